@@ -1,25 +1,138 @@
 """Enhanced FastAPI application with Government Datasets Integration."""
 
-from fastapi import FastAPI, HTTPException, Depends, Query
+from fastapi import FastAPI, HTTPException, Depends, Query, Header, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Dict, List, Any, Optional
+from contextlib import asynccontextmanager
+import asyncio
 import logging
+import time
 
 from core.config import settings
 from core.logging import setup_logging
+from core.deadline import Deadline, DeadlineExceeded
+from core.timing import record as record_timing, start_request_timings, timing_histograms
 from services.insights import InsightsService
 from services.government_data_service import government_data_service
-from db.session import get_readonly_session
+from db.session import (
+    get_readonly_session, shutdown_query_executor, run_in_query_executor, run_in_background_executor,
+    get_data_version
+)
+from llm.openrouter import get_shared_client, close_shared_client
+from llm.agent import MunicipalAnalystAgent, EventCallback, agent_stats
+from llm.admission import AdmissionRejected, current_lane, priority_lane, BATCH, INTERACTIVE
+from services.schema import SchemaService
+from llm.streaming import format_sse
+from services.response_cache import response_cache, make_cache_key
+from services.singleflight import insight_flights
+from services.intent_router import intent_router
+from services.sql_template_cache import sql_template_cache
+from services.example_library import example_library
+from services.doc_search import doc_search_index, DocIndexError
+from services.insight_jobs import insight_job_queue, run_job_worker
+from services.conversation_sessions import ConversationSession, conversation_store
+from services.usage_ledger import usage_ledger
+from services.sql_guard import statement_cache, table_catalog
 
 # Setup logging
 setup_logging()
 logger = logging.getLogger(__name__)
 
+
+async def watch_data_version():
+    """Invalidate cached insights whenever an ETL run changes the warehouse."""
+    while True:
+        try:
+            version = await run_in_background_executor(get_data_version)
+            changed = response_cache.observe_data_version(version)
+            # Loaders that came up empty (e.g. the database was down at startup) retry on every check
+            if changed or not intent_router.datasets:
+                await run_in_background_executor(intent_router.refresh)
+            if changed or not SchemaService.has_catalog():
+                await run_in_background_executor(SchemaService.refresh_catalog_index)
+            if changed or not sql_template_cache.vocabulary["places"]:
+                await run_in_background_executor(sql_template_cache.refresh_vocabulary)
+        except Exception as e:
+            logger.warning(f"Data version check failed: {e}")
+        try:
+            # Migrations change tables without touching the data version
+            await run_in_background_executor(table_catalog.refresh)
+        except Exception as e:
+            logger.warning(f"SQL guard catalog refresh failed: {e}")
+        await asyncio.sleep(settings.response_cache_version_check_seconds)
+
+
+async def flush_usage_ledger():
+    """Periodically write buffered LLM usage rows to the ledger."""
+    while True:
+        await asyncio.sleep(settings.usage_flush_seconds)
+        try:
+            await run_in_background_executor(usage_ledger.flush)
+        except Exception as e:
+            logger.warning(f"LLM usage flush failed: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create process-wide resources on startup and release them on shutdown."""
+    app.state.openrouter_client = get_shared_client()
+    try:
+        await run_in_query_executor(SchemaService.refresh_value_hints)
+    except Exception as e:
+        logger.warning(f"Using default schema value hints: {e}")
+    SchemaService.get_schema_digest()
+    try:
+        await run_in_query_executor(example_library.load)
+    except Exception as e:
+        logger.warning(f"Few-shot example library will load on first use: {e}")
+    try:
+        await run_in_query_executor(doc_search_index.load)
+    except DocIndexError as e:
+        logger.warning(f"search_docs disabled: {e}")
+    try:
+        await run_in_query_executor(intent_router.refresh)
+    except Exception as e:
+        logger.warning(f"Intent router disabled until the dataset registry loads: {e}")
+    try:
+        await run_in_query_executor(SchemaService.refresh_catalog_index)
+    except Exception as e:
+        logger.warning(f"Sending the full schema until the dataset catalog loads: {e}")
+    try:
+        await run_in_query_executor(sql_template_cache.refresh_vocabulary)
+    except Exception as e:
+        logger.warning(f"SQL templates only re-bind filter values until places and years load: {e}")
+    try:
+        await run_in_query_executor(table_catalog.refresh)
+    except Exception as e:
+        logger.warning(f"SQL guard using the model catalog until the database is reflected: {e}")
+    version_watcher = asyncio.create_task(watch_data_version())
+    usage_flusher = asyncio.create_task(flush_usage_ledger())
+    job_workers = [
+        asyncio.create_task(run_job_worker(insight_job_queue, f"{insight_job_queue.worker_prefix}:{index}", run_insight_job))
+        for index in range(settings.insight_job_workers)
+    ]
+    try:
+        yield
+    finally:
+        version_watcher.cancel()
+        usage_flusher.cancel()
+        for worker in job_workers:
+            worker.cancel()
+        try:
+            await run_in_background_executor(usage_ledger.flush)
+        except Exception as e:
+            logger.warning(f"Final LLM usage flush failed: {e}")
+        await close_shared_client()
+        shutdown_query_executor()
+
+
 app = FastAPI(
     title="Municipal AI Insights - Enhanced",
     description="AI-powered municipal analytics platform with government datasets integration",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan
 )
 
 # CORS middleware
@@ -64,6 +177,17 @@ class InsightFilters(BaseModel):
 class InsightRequest(BaseModel):
     prompt: str
     filters: Optional[InsightFilters] = None
+    # Continue a conversation; responses carry the id to send with the next question
+    session_id: Optional[str] = None
+
+SESSION_QUERY = Query(None, description="Pass 'new' to start a conversation session for follow-up questions")
+
+
+def open_session(session_id: Optional[str], session: Optional[str]) -> Optional[ConversationSession]:
+    """Resume or start a conversation only when the client opted in; one-off questions get none."""
+    if session_id or session == "new":
+        return conversation_store.get_or_create(session_id)
+    return None
 
 # Existing endpoints
 @app.get("/healthz")
@@ -75,10 +199,7 @@ async def health_check():
 async def test_llm_connection():
     """Test LLM connection and configuration."""
     try:
-        from llm.openrouter import OpenRouterClient
-        from core.config import settings
-        
-        client = OpenRouterClient()
+        client = get_shared_client()
         
         # Simple test message
         messages = [{"role": "user", "content": "Say 'Hello' if you can receive this message."}]
@@ -123,50 +244,262 @@ async def get_schema():
         logger.error(f"Error getting schema: {e}")
         raise HTTPException(status_code=500, detail="Failed to retrieve schema")
 
-@app.post("/api/insights")
-async def generate_insight(request: InsightRequest):
-    """Generate AI-powered insights from municipal data."""
-    logger.info(f"Received insight request: {request.prompt}")
-    try:
-        from llm.agent import MunicipalAnalystAgent
-        
-        # Initialize the LLM agent
-        agent = MunicipalAnalystAgent()
-        
-        # Convert filters to the format expected by the agent
-        filters_dict = {}
-        if request.filters:
-            if request.filters.time:
-                filters_dict["time"] = {
-                    "from": request.filters.time.from_,
-                    "to": request.filters.time.to
-                }
-            if request.filters.place:
-                filters_dict["place"] = {
-                    "state": request.filters.place.state,
-                    "district": request.filters.place.district,
-                    "ward": request.filters.place.ward,
-                    "zone": request.filters.place.zone
-                }
-            if request.filters.extra:
-                filters_dict["extra"] = {
-                    "category": request.filters.extra.category
-                }
+def build_filters_dict(filters: Optional[InsightFilters]) -> Dict[str, Any]:
+    """Convert request filters to the format expected by the agent."""
+    filters_dict = {}
+    if filters:
+        if filters.time:
+            filters_dict["time"] = {
+                "from": filters.time.from_,
+                "to": filters.time.to
+            }
+        if filters.place:
+            filters_dict["place"] = {
+                "state": filters.place.state,
+                "district": filters.place.district,
+                "ward": filters.place.ward,
+                "zone": filters.place.zone
+            }
+        if filters.extra:
+            filters_dict["extra"] = {
+                "category": filters.extra.category
+            }
+    return filters_dict
+
+
+async def run_insight(
+    prompt: str,
+    filters_dict: Dict[str, Any],
+    on_event: Optional[EventCallback] = None,
+    deadline: Optional[Deadline] = None,
+    session: Optional[ConversationSession] = None
+) -> Dict[str, Any]:
+    """Answer an insight request and, within a conversation, remember the turn."""
+    response = await answer_insight(prompt, filters_dict, on_event, deadline, session)
+    if session is not None:
+        session.record_turn(prompt, filters_dict, response)
+        # The dict may be a coalescing leader's result, so other callers must not see the id
+        response = {**response, "session_id": session.session_id}
+    return response
+
+
+async def answer_insight(
+    prompt: str,
+    filters_dict: Dict[str, Any],
+    on_event: Optional[EventCallback] = None,
+    deadline: Optional[Deadline] = None,
+    session: Optional[ConversationSession] = None
+) -> Dict[str, Any]:
+    """Answer an insight request from the catalog, the cache or by running the LLM agent.
+    
+    Follow-up questions depend on their conversation, so they bypass the
+    response cache and request coalescing and go straight to the agent.
+    Streamed requests also run their own agent so their progress events
+    reach only them, and requests coalesce only with others that have the
+    same time budget and priority lane, so no caller inherits a shorter
+    deadline or waits in the batch lane.
+    """
+    # Catalog, coverage and statistics questions never need the LLM
+    routed_response = await intent_router.answer(prompt, filters_dict)
+    if routed_response is not None:
+        routed_response["cached"] = False
+        return routed_response
+    
+    follow_up = session is not None and bool(session.turns)
+    
+    # Serve repeated questions from the response cache
+    cache_key = make_cache_key(prompt, filters_dict)
+    if settings.response_cache_enabled and not follow_up:
+        cached_response = response_cache.get(cache_key)
+        if cached_response is not None:
+            logger.info("Serving insight from response cache")
+            cached_response["cached"] = True
+            return cached_response
+    
+    deadline = deadline or Deadline(settings.insight_deadline_seconds)
+    
+    async def run_agent() -> Dict[str, Any]:
+        # Initialize the LLM agent with the worker's pooled client
+        agent = MunicipalAnalystAgent(client=get_shared_client())
         
         # Generate insight using the LLM agent
         logger.info(f"Calling agent with filters: {filters_dict}")
         insight_response = await agent.generate_insight(
-            prompt=request.prompt,
-            filters=filters_dict
+            prompt=prompt,
+            filters=filters_dict,
+            on_event=on_event,
+            deadline=deadline,
+            session=session if follow_up else None
         )
         logger.info(f"Agent returned result: {type(insight_response)}")
         
+        # Only genuine, context-free LLM answers are cached, never templated fallbacks
+        if settings.response_cache_enabled and agent.last_run_succeeded and not follow_up:
+            response_cache.set(cache_key, insight_response)
+        return insight_response
+    
+    if follow_up or on_event is not None:
+        insight_response = await run_agent()
+        insight_response["cached"] = False
+        return insight_response
+    
+    # Identical concurrent requests wait for one agent run instead of starting their own;
+    # the lane is part of the key so an interactive request never queues behind batch admission
+    flight_key = f"{cache_key}|{deadline.budget_seconds:g}s|{current_lane.get()}"
+    started = time.monotonic()
+    try:
+        insight_response, coalesced = await insight_flights.do(
+            flight_key, run_agent, timeout=deadline.remaining()
+        )
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded("Timed out waiting for an identical in-flight request")
+    if coalesced:
+        logger.info("Served insight from a coalesced in-flight request")
+        # The leader's spans went to its own timings; show this request's wait instead
+        record_timing("coalesced", started, time.monotonic() - started)
+    
+    insight_response["cached"] = False
+    return insight_response
+
+
+@app.post("/api/insights")
+async def generate_insight(
+    request: InsightRequest,
+    response: Response,
+    deadline_ms: Optional[int] = Header(None, alias="X-Request-Deadline-Ms"),
+    priority: Optional[str] = Header(None, alias="X-Priority"),
+    timings: bool = Query(False, description="Include the per-stage latency breakdown in the response"),
+    session: Optional[str] = SESSION_QUERY
+):
+    """Generate AI-powered insights from municipal data.
+    
+    Clients may shorten the server's time budget with ``X-Request-Deadline-Ms``.
+    Cache warmers and evaluation runs send ``X-Priority: batch`` so their LLM
+    calls yield to interactive traffic. When LLM capacity is exhausted the
+    request fails fast with 429 and ``Retry-After``.
+    
+    The response carries a ``Server-Timing`` header with the time spent in
+    LLM calls, tools, SQL validation, the database and response assembly;
+    ``?timings=true`` adds the individual spans as a ``timings`` field.
+    
+    ``?session=new`` starts a conversation; send the returned ``session_id``
+    with follow-up questions.
+    """
+    logger.info(f"Received insight request: {request.prompt}")
+    request_timings = start_request_timings()
+    try:
+        with priority_lane(BATCH if priority == BATCH else INTERACTIVE):
+            insight_response = await run_insight(
+                request.prompt,
+                build_filters_dict(request.filters),
+                deadline=Deadline.from_header(deadline_ms),
+                session=open_session(request.session_id, session)
+            )
+        
+        if settings.server_timing_enabled:
+            response.headers["Server-Timing"] = request_timings.server_timing()
+        if timings:
+            # A coalescing leader holds the dict its followers deep-copy from, so add the field to a copy
+            insight_response = {**insight_response, "timings": request_timings.as_dict()}
         return insight_response
         
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(int(e.retry_after))})
+    except DeadlineExceeded as e:
+        logger.warning(f"Insight request timed out: {e}")
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         logger.error(f"Error generating insight: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to generate insight: {str(e)}")
 
+async def run_insight_job(prompt: str, filters_dict: Dict[str, Any]) -> Dict[str, Any]:
+    """Answer a queued insight job in the batch lane with the longer background budget."""
+    with priority_lane(BATCH):
+        return await run_insight(prompt, filters_dict, deadline=Deadline(settings.insight_job_deadline_seconds))
+
+
+@app.post("/api/insights/jobs", status_code=202)
+async def create_insight_job(request: InsightRequest):
+    """Queue an insight request and return its job id immediately.
+    
+    Poll ``GET /api/insights/jobs/{job_id}`` for the result.
+    """
+    try:
+        job_id = await run_in_query_executor(
+            insight_job_queue.enqueue, request.prompt, build_filters_dict(request.filters)
+        )
+    except Exception as e:
+        logger.error(f"Error queueing insight job: {e}")
+        raise HTTPException(status_code=503, detail="Failed to queue insight job")
+    return {"job_id": job_id, "status": "queued"}
+
+@app.get("/api/insights/jobs/{job_id}")
+async def get_insight_job(job_id: int):
+    """Get a queued insight job's status and, once finished, its result."""
+    try:
+        job = await run_in_query_executor(insight_job_queue.get, job_id)
+    except Exception as e:
+        logger.error(f"Error reading insight job {job_id}: {e}")
+        raise HTTPException(status_code=500, detail="Failed to read insight job")
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Insight job {job_id} not found")
+    return job
+
+@app.post("/api/insights/stream")
+async def stream_insight(
+    request: InsightRequest,
+    deadline_ms: Optional[int] = Header(None, alias="X-Request-Deadline-Ms"),
+    session: Optional[str] = SESSION_QUERY
+):
+    """Generate insights, streaming agent progress as Server-Sent Events.
+    
+    Events: ``started``, ``tool_call``, ``sql_executed``, ``data_preview``,
+    ``insight_token`` and finally ``result`` (or ``error``). Sessions work as
+    for ``/api/insights``.
+    """
+    logger.info(f"Received streaming insight request: {request.prompt}")
+    filters_dict = build_filters_dict(request.filters)
+    deadline = Deadline.from_header(deadline_ms)
+    events: asyncio.Queue = asyncio.Queue()
+    
+    async def emit(event: str, payload: Dict[str, Any]) -> None:
+        await events.put((event, payload))
+    
+    async def produce() -> None:
+        try:
+            result = await run_insight(
+                request.prompt, filters_dict, on_event=emit, deadline=deadline,
+                session=open_session(request.session_id, session)
+            )
+            await emit("result", result)
+        except AdmissionRejected as e:
+            await emit("error", {"detail": str(e), "status_code": 429, "retry_after": e.retry_after})
+        except Exception as e:
+            logger.error(f"Error streaming insight: {e}")
+            await emit("error", {"detail": f"Failed to generate insight: {str(e)}"})
+        finally:
+            await events.put(None)
+    
+    async def event_stream():
+        # Flush a first frame immediately so clients see bytes before the LLM answers
+        yield format_sse("started", {"prompt": request.prompt, "filters": filters_dict})
+        producer = asyncio.create_task(produce())
+        try:
+            while True:
+                item = await events.get()
+                if item is None:
+                    break
+                yield format_sse(*item)
+        finally:
+            if not producer.done():
+                producer.cancel()
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # New Government Dataset endpoints
 @app.get("/api/datasets")
 async def get_datasets():
@@ -307,6 +640,51 @@ async def search_datasets(search: DatasetSearch):
         logger.error(f"Error searching datasets: {e}")
         raise HTTPException(status_code=500, detail="Failed to search datasets")
 
+@app.get("/api/admin/metrics")
+async def get_metrics():
+    """Get runtime performance metrics for this worker process."""
+    try:
+        queue_depth = await run_in_query_executor(insight_job_queue.queue_depth)
+    except Exception as e:
+        queue_depth = {"error": str(e)}
+    return {
+        "openrouter": get_shared_client().get_stats(),
+        "response_cache": response_cache.get_stats(),
+        "agent": agent_stats.get_stats(),
+        "singleflight": insight_flights.get_stats(),
+        "intent_router": intent_router.get_stats(),
+        "sql_templates": sql_template_cache.get_stats(),
+        "sql_guard": {**statement_cache.get_stats(), "catalog": table_catalog.get_stats()},
+        "examples": example_library.get_stats(),
+        "doc_search": doc_search_index.get_stats(),
+        "conversations": conversation_store.get_stats(),
+        "timings": timing_histograms.get_stats(),
+        "usage_ledger": usage_ledger.get_stats(),
+        "insight_jobs": {**insight_job_queue.get_stats(), "queue": queue_depth}
+    }
+
+@app.get("/api/admin/usage")
+async def get_usage(
+    hours: float = Query(24.0, gt=0, description="How far back to look"),
+    bucket: str = Query("hour", description="Rollup bucket: minute, hour or day"),
+    group_by: str = Query("model", description="Rollup key: model, prompt_hash, request or stage"),
+    limit: int = Query(100, ge=1, le=1000)
+):
+    """Get LLM token, cost and latency rollups from the usage ledger, costliest first per bucket."""
+    try:
+        return await run_in_query_executor(usage_ledger.rollup, hours, bucket, group_by, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error reading LLM usage: {e}")
+        raise HTTPException(status_code=500, detail="Failed to read LLM usage")
+
+@app.post("/api/admin/cache/invalidate")
+async def invalidate_response_cache():
+    """Drop all cached insight responses on this worker."""
+    response_cache.invalidate(reason="admin request")
+    return {"status": "invalidated", "response_cache": response_cache.get_stats()}
+
 # Dataset management endpoints (for future admin functionality)
 @app.get("/api/admin/datasets/sync-status")
 async def get_sync_status():
@@ -0,0 +1 @@
+# Microbenchmarks for hot paths; run as python -m benchmarks.<name>
@@ -0,0 +1,54 @@
+"""Microbenchmark for SQLGuard: cold validation versus the statement cache.
+
+Run from the backend directory::
+
+    python -m benchmarks.sql_guard_bench --iterations 2000
+"""
+
+import argparse
+import time
+
+from services.sql_guard import SQLGuard
+
+# Shapes typical of agent-generated queries; {n} varies the literals between calls
+QUERIES = [
+    "SELECT g.state, t.year, SUM(f.value) AS total FROM fact_measure f "
+    "JOIN dim_geo g ON g.id = f.geo_id JOIN dim_time t ON t.id = f.time_id "
+    "WHERE g.state = 'State {n}' AND t.year >= {n} GROUP BY g.state, t.year ORDER BY t.year LIMIT 100",
+    "WITH yearly AS (SELECT t.year, AVG(efm.numeric_value) AS avg_value FROM extended_fact_measure efm "
+    "JOIN dim_time t ON t.id = efm.time_id JOIN dataset_registry dr ON dr.id = efm.dataset_id "
+    "WHERE dr.category = 'Economic' AND efm.indicator_id = {n} GROUP BY t.year) "
+    "SELECT year, avg_value FROM yearly WHERE avg_value > (SELECT AVG(avg_value) FROM yearly) ORDER BY year",
+    "SELECT dr.title, di.display_name, COUNT(*) AS points FROM extended_fact_measure efm "
+    "JOIN dataset_registry dr ON dr.id = efm.dataset_id LEFT JOIN dataset_indicator di ON di.id = efm.indicator_id "
+    "WHERE efm.numeric_value > {n} GROUP BY dr.title, di.display_name ORDER BY points DESC LIMIT 20",
+]
+
+
+def run(guard: SQLGuard, iterations: int, clear_cache: bool) -> float:
+    """Validate ``iterations`` statements and return statements per second."""
+    started = time.perf_counter()
+    for n in range(iterations):
+        if clear_cache:
+            guard.cache.clear()
+        guard.validate_and_sanitize(QUERIES[n % len(QUERIES)].format(n=n))
+    return iterations / (time.perf_counter() - started)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    guard = SQLGuard()
+    cold = run(guard, args.iterations, clear_cache=True)
+    guard.cache.clear()
+    cached = run(guard, args.iterations, clear_cache=False)
+
+    print(f"cold   (tokenize + parse + validate): {cold:10.0f} statements/s")
+    print(f"cached (tokenize + fingerprint hit):  {cached:10.0f} statements/s")
+    print(f"speedup: {cached / cold:.1f}x  cache: {guard.cache.get_stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,7 @@
 """Configuration management for the Municipal AI Insights backend."""
 
 import os
-from typing import Optional
+from typing import Dict, List, Optional
 from pydantic_settings import BaseSettings
 from pydantic import Field
 
@@ -13,6 +13,31 @@ class Settings(BaseSettings):
     openrouter_api_key: str
     model_slug: str = "openai/gpt-4"
     
+    # Per-stage model routing; unset stages use model_slug
+    planner_model_slug: Optional[str] = None
+    synthesis_model_slug: Optional[str] = None
+    planner_max_tokens: int = 800
+    
+    # OpenRouter HTTP connection pool (one shared client per worker process)
+    openrouter_timeout_seconds: float = 30.0
+    openrouter_http2: bool = True
+    openrouter_max_connections: int = 20
+    openrouter_max_keepalive_connections: int = 10
+    openrouter_keepalive_expiry_seconds: float = 60.0
+    
+    # OpenRouter retries and circuit breaker
+    openrouter_max_retries: int = 2
+    openrouter_backoff_base_seconds: float = 0.5
+    openrouter_backoff_max_seconds: float = 8.0
+    openrouter_breaker_failure_threshold: int = 5
+    openrouter_breaker_reset_seconds: float = 30.0
+    
+    # Hedged requests: race a second model when the primary is slower than usual
+    openrouter_hedge_model: Optional[str] = None
+    openrouter_hedge_percentile: float = 95.0
+    openrouter_hedge_initial_delay_seconds: float = 8.0
+    openrouter_hedge_min_samples: int = 20
+    
     # Database Configuration
     database_url: str
     runtime_db_url: str
@@ -28,6 +53,86 @@ class Settings(BaseSettings):
     query_timeout_seconds: int = 10
     max_rows_returned: int = 5000
     max_preview_rows: int = 50
+    # Validated statement shapes kept so repeated queries skip SQL guard parsing
+    sql_guard_cache_size: int = 1024
+    # Tables the read-only role can see that generated SQL must never touch
+    sql_guard_excluded_tables: List[str] = Field(default_factory=lambda: ["alembic_version", "insight_job"])
+    
+    # Size of the thread pool that runs read-only queries off the event loop
+    sql_executor_workers: int = 8
+    # Threads for housekeeping (job queue polling, usage flushes, catalog checks)
+    background_executor_workers: int = 2
+    
+    # Per-request budgets for the agent loop
+    insight_deadline_seconds: float = 45.0
+    max_tool_rounds: int = 6
+    
+    # Max tool calls from one LLM turn that run at the same time for a request
+    max_concurrent_tool_calls: int = 4
+    
+    # Size limits for run_sql results sent back to the LLM
+    llm_result_sample_rows: int = 20
+    llm_result_token_budget: int = 1500
+    
+    # Insight response cache
+    response_cache_enabled: bool = True
+    response_cache_max_entries: int = 512
+    response_cache_max_rows: int = 200000
+    response_cache_ttl_seconds: float = 3600.0
+    response_cache_version_check_seconds: float = 30.0
+    
+    # Learned question-pattern -> SQL templates
+    sql_template_cache_enabled: bool = True
+    sql_template_cache_max_entries: int = 256
+    
+    # Few-shot examples retrieved from verified question/SQL pairs
+    example_library_path: str = "data/sql_examples.jsonl"
+    example_library_max_entries: int = 2000
+    few_shot_examples: int = 3
+    
+    # Per-request schema subset sent to the LLM
+    schema_subset_max_datasets: int = 5
+    schema_subset_max_indicators: int = 12
+    
+    # Local document index behind the search_docs tool
+    doc_index_path: str = "data/doc_index"
+    doc_search_max_results: int = 5
+    
+    # Conversation sessions for follow-up questions (per worker process)
+    conversation_max_sessions: int = 500
+    conversation_idle_ttl_seconds: float = 1800.0
+    conversation_history_turns: int = 6
+    conversation_results_per_session: int = 3
+    conversation_max_result_rows: int = 5000
+    conversation_max_cached_rows: int = 100000
+    
+    # Admission control for LLM calls (per worker process)
+    llm_admission_enabled: bool = True
+    llm_max_in_flight: int = 16
+    llm_batch_max_in_flight: int = 4
+    llm_rate_per_second: float = 10.0
+    llm_burst: int = 20
+    llm_queue_max: int = 64
+    llm_interactive_max_wait_seconds: float = 5.0
+    llm_batch_max_wait_seconds: float = 60.0
+    
+    # Background insight jobs (Postgres queue drained by in-process workers)
+    insight_job_workers: int = 2
+    insight_job_poll_seconds: float = 1.0
+    insight_job_deadline_seconds: float = 600.0
+    insight_job_stale_seconds: float = 900.0
+    insight_job_max_attempts: int = 2
+    
+    # Per-request latency breakdown sent as a Server-Timing header on /api/insights
+    server_timing_enabled: bool = True
+    
+    # LLM token and cost ledger (local SQLite file shared by the workers on a host)
+    usage_ledger_enabled: bool = True
+    usage_ledger_path: str = "data/llm_usage.sqlite3"
+    usage_flush_seconds: float = 5.0
+    usage_retention_days: int = 30
+    # Fallback prices when OpenRouter reports no cost: model -> [USD per 1M prompt tokens, per 1M completion tokens]
+    llm_model_prices: Dict[str, List[float]] = Field(default_factory=dict)
     
     class Config:
         env_file = ".env"
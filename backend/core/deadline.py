@@ -0,0 +1,42 @@
+"""Per-request wall-clock budgets."""
+
+import time
+from typing import Optional
+
+from core.config import settings
+
+
+class DeadlineExceeded(Exception):
+    """Exception raised when a request has used up its time budget."""
+    pass
+
+
+class Deadline:
+    """Wall-clock budget for one request, shared by LLM and SQL calls."""
+
+    def __init__(self, seconds: float):
+        self.budget_seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    @classmethod
+    def from_header(cls, deadline_ms: Optional[int]) -> "Deadline":
+        """Build a deadline from an ``X-Request-Deadline-Ms`` value; clients may only shorten the server budget."""
+        seconds = settings.insight_deadline_seconds
+        if deadline_ms is not None and deadline_ms > 0:
+            seconds = min(deadline_ms / 1000, seconds)
+        return cls(seconds)
+
+    def remaining(self) -> float:
+        """Seconds left before the deadline (never negative)."""
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def expired(self) -> bool:
+        """Whether the budget has been used up."""
+        return self.remaining() <= 0
+
+    def check(self) -> float:
+        """Return the remaining seconds, raising DeadlineExceeded if none are left."""
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"Request exceeded its {self.budget_seconds:.1f}s budget")
+        return remaining
@@ -36,7 +36,8 @@ def log_request_response(
     duration_ms: int,
     row_count: int,
     success: bool = True,
-    error: Optional[str] = None
+    error: Optional[str] = None,
+    extra: Optional[Dict[str, Any]] = None
 ) -> None:
     """Log request and response details for observability."""
     log_data = {
@@ -52,6 +53,9 @@ def log_request_response(
     if error:
         log_data["error"] = error
     
+    if extra:
+        log_data.update(extra)
+    
     if success:
         logger.info(f"Request completed: {json.dumps(log_data)}")
     else:
@@ -0,0 +1,175 @@
+"""Per-request latency breakdown: timed spans, Server-Timing headers and histograms."""
+
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Upper bounds (ms) of the latency histogram buckets; a final bucket catches the rest
+BUCKETS_MS: Tuple[float, ...] = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+
+class RequestTimings:
+    """Spans recorded while answering one request."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.spans: List[Dict[str, Any]] = []
+
+    def add(self, name: str, started: float, seconds: float, attrs: Dict[str, Any]) -> None:
+        # list.append is atomic, so executor threads can record into the same request
+        self.spans.append({
+            "name": name,
+            "start_ms": round((started - self.started) * 1000, 1),
+            "duration_ms": round(seconds * 1000, 1),
+            **attrs,
+        })
+
+    def total_ms(self) -> float:
+        return round((time.monotonic() - self.started) * 1000, 1)
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """Return the call count and summed duration of each span name."""
+        summary: Dict[str, Dict[str, Any]] = {}
+        for span in self.spans:
+            entry = summary.setdefault(span["name"], {"count": 0, "duration_ms": 0.0})
+            entry["count"] += 1
+            entry["duration_ms"] = round(entry["duration_ms"] + span["duration_ms"], 1)
+        return summary
+
+    def server_timing(self) -> str:
+        """Render the spans as a ``Server-Timing`` header value, one metric per span name."""
+        metrics = [
+            f'{name};dur={entry["duration_ms"]};desc="{entry["count"]}x"'
+            for name, entry in self.summary().items()
+        ]
+        metrics.append(f"total;dur={self.total_ms()}")
+        return ", ".join(metrics)
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Return the breakdown for the response's ``timings`` field."""
+        return {
+            "total_ms": self.total_ms(),
+            "summary": self.summary(),
+            "spans": sorted(self.spans, key=lambda span: span["start_ms"]),
+        }
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram."""
+
+    def __init__(self, bounds: Tuple[float, ...] = BUCKETS_MS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum_ms = 0.0
+
+    def observe(self, ms: float) -> None:
+        self.counts[bisect_left(self.bounds, ms)] += 1
+        self.count += 1
+        self.sum_ms += ms
+
+    def percentile(self, pct: float) -> Optional[float]:
+        """Upper bound of the bucket holding the ``pct``th percentile (None when empty)."""
+        if not self.count:
+            return None
+        rank = self.count * pct / 100
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return self.bounds[index] if index < len(self.bounds) else float("inf")
+        return float("inf")
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return counts, percentiles and cumulative bucket counts."""
+        buckets = {}
+        seen = 0
+        for bound, count in zip(self.bounds + (float("inf"),), self.counts):
+            seen += count
+            buckets["+Inf" if bound == float("inf") else str(bound)] = seen
+        p95 = self.percentile(95)
+        return {
+            "count": self.count,
+            "mean_ms": round(self.sum_ms / self.count, 1) if self.count else None,
+            "p50_ms": self.percentile(50),
+            "p95_ms": None if p95 == float("inf") else p95,
+            "buckets": buckets,
+        }
+
+
+class TimingHistograms:
+    """Per-span-name latency histograms for the whole worker."""
+
+    def __init__(self):
+        self._histograms: Dict[str, LatencyHistogram] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, ms: float) -> None:
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = LatencyHistogram()
+            histogram.observe(ms)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {name: histogram.snapshot() for name, histogram in sorted(self._histograms.items())}
+
+
+# Global instance shared by requests on this worker
+timing_histograms = TimingHistograms()
+
+# Timings of the request being answered by the current task, if it asked for them
+current_timings: contextvars.ContextVar = contextvars.ContextVar("request_timings", default=None)
+# Attributes of the innermost open span, so nested code can annotate it
+_current_span: contextvars.ContextVar = contextvars.ContextVar("timing_span", default=None)
+
+
+def start_request_timings() -> RequestTimings:
+    """Start recording spans for the request running in the current task."""
+    timings = RequestTimings()
+    current_timings.set(timings)
+    return timings
+
+
+def record(name: str, started: float, seconds: float, **attrs: Any) -> None:
+    """Record a finished span in the histograms and the current request's timings.
+
+    Numeric ``*_ms`` attributes (e.g. ``queue_ms``) get histograms of their own.
+    """
+    timing_histograms.observe(name, seconds * 1000)
+    for key, value in attrs.items():
+        if key.endswith("_ms") and isinstance(value, (int, float)):
+            timing_histograms.observe(f"{name}_{key[:-3]}", value)
+    timings = current_timings.get()
+    if timings is not None:
+        timings.add(name, started, seconds, attrs)
+
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[Dict[str, Any]]:
+    """Time the enclosed block; the yielded dict takes extra attributes such as token counts."""
+    started = time.monotonic()
+    token = _current_span.set(attrs)
+    try:
+        yield attrs
+    except BaseException as e:
+        attrs["error"] = type(e).__name__
+        raise
+    finally:
+        _current_span.reset(token)
+        record(name, started, time.monotonic() - started, **attrs)
+
+
+def annotate(**attrs: Any) -> None:
+    """Add attributes to the innermost open span, if there is one."""
+    current = _current_span.get()
+    if current is not None:
+        current.update(attrs)
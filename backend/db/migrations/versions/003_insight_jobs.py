@@ -0,0 +1,42 @@
+"""Add insight job queue
+
+Revision ID: 003
+Revises: 002
+Create Date: 2026-10-16 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '003'
+down_revision = '002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('insight_job',
+        sa.Column('id', sa.BigInteger(), nullable=False),
+        sa.Column('status', sa.Text(), nullable=False, server_default='queued'),
+        sa.Column('prompt', sa.Text(), nullable=False),
+        sa.Column('filters', postgresql.JSON(astext_type=sa.Text()), nullable=True),
+        sa.Column('result', postgresql.JSON(astext_type=sa.Text()), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('worker_id', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.text('now()')),
+        sa.Column('started_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+        sa.CheckConstraint("status IN ('queued', 'running', 'succeeded', 'failed')", name='check_job_status'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    
+    # Partial index so claiming the oldest queued job stays cheap as finished jobs pile up
+    op.create_index('idx_insight_job_queued', 'insight_job', ['id'], postgresql_where=sa.text("status = 'queued'"))
+
+
+def downgrade():
+    op.drop_index('idx_insight_job_queued', table_name='insight_job')
+    op.drop_table('insight_job')
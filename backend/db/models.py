@@ -1,6 +1,6 @@
 """SQLAlchemy models for the Municipal AI Insights database."""
 
-from sqlalchemy import Column, Integer, String, Text, Numeric, Date, ForeignKey, Index, CheckConstraint
+from sqlalchemy import Column, Integer, BigInteger, String, Text, Numeric, Date, DateTime, ForeignKey, Index, CheckConstraint, JSON, func
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 
@@ -86,3 +86,26 @@ class FactMeasure(Base):
 
 # Create indexes separately for better control
 Index("idx_time_year_quarter_month", DimTime.year, DimTime.quarter, DimTime.month)
+
+
+class InsightJob(Base):
+    """Queued insight request answered by a background worker."""
+    __tablename__ = "insight_job"
+    
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    status = Column(Text, nullable=False, default="queued")
+    prompt = Column(Text, nullable=False)
+    filters = Column(JSON, nullable=True)
+    result = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    worker_id = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    
+    __table_args__ = (
+        CheckConstraint("status IN ('queued', 'running', 'succeeded', 'failed')", name="check_job_status"),
+        # Workers only ever scan queued jobs in arrival order
+        Index("idx_insight_job_queued", "id", postgresql_where=(status == "queued")),
+    )
@@ -1,12 +1,17 @@
 """Database session management with read-only and owner connections."""
 
-from sqlalchemy import create_engine, Engine
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from sqlalchemy import create_engine, Engine, text
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.pool import StaticPool
-from typing import Generator
+from typing import Generator, Optional
 
 from core.config import settings
 from core.logging import get_logger
+from core.timing import span
 
 logger = get_logger(__name__)
 
@@ -18,14 +23,22 @@ owner_engine: Engine = create_engine(
     connect_args={"connect_timeout": 10}
 )
 
-# Read-only engine for runtime queries
+# Read-only engine for runtime queries; sized to match both executors
 readonly_engine: Engine = create_engine(
     settings.runtime_db_url,
     echo=settings.debug,
     pool_pre_ping=True,
+    pool_size=settings.sql_executor_workers + settings.background_executor_workers,
     connect_args={"connect_timeout": 10}
 )
 
+# Bounded worker pool so blocking read-only queries never run on the event loop;
+# created on first use so a new lifespan after shutdown gets a fresh one
+_query_executor: Optional[ThreadPoolExecutor] = None
+# Small separate pool for housekeeping (job queue polling, usage flushes, catalog
+# checks) so background work never takes threads from user queries
+_background_executor: Optional[ThreadPoolExecutor] = None
+
 # Session makers
 OwnerSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=owner_engine)
 ReadonlySessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=readonly_engine)
@@ -49,13 +62,14 @@ def get_readonly_session() -> Generator[Session, None, None]:
         session.close()
 
 
-def execute_safe_query(query: str, timeout_seconds: int = None) -> dict:
+def execute_safe_query(query: str, timeout_seconds: Optional[float] = None) -> dict:
     """Execute a read-only query with safety checks and timeout."""
     from services.sql_guard import SQLGuard
     
     # Validate and sanitize the query
     guard = SQLGuard()
-    safe_query = guard.validate_and_sanitize(query)
+    with span("sql_guard"):
+        safe_query = guard.validate_and_sanitize(query)
     
     # Use configured timeout if not specified
     if timeout_seconds is None:
@@ -63,15 +77,18 @@ def execute_safe_query(query: str, timeout_seconds: int = None) -> dict:
     
     session = ReadonlySessionLocal()
     try:
-        # Set query timeout
-        session.execute(f"SET statement_timeout = '{timeout_seconds}s'")
-        
-        # Execute the query
-        result = session.execute(safe_query)
+        # Set query timeout for this transaction only, so pooled connections stay clean
+        timeout_ms = max(int(timeout_seconds * 1000), 1)
+        session.execute(text(f"SET LOCAL statement_timeout = {timeout_ms}"))
         
-        # Fetch results
-        columns = list(result.keys()) if result.keys() else []
-        rows = result.fetchall()
+        with span("db") as attrs:
+            # Execute the query
+            result = session.execute(safe_query)
+            
+            # Fetch results
+            columns = list(result.keys()) if result.keys() else []
+            rows = result.fetchall()
+            attrs["rows"] = len(rows)
         
         # Apply row limit
         if len(rows) > settings.max_rows_returned:
@@ -89,3 +106,68 @@ def execute_safe_query(query: str, timeout_seconds: int = None) -> dict:
         raise
     finally:
         session.close()
+
+
+def get_query_executor() -> ThreadPoolExecutor:
+    """Return the read-only query executor, creating it if none is running."""
+    global _query_executor
+    if _query_executor is None:
+        _query_executor = ThreadPoolExecutor(
+            max_workers=settings.sql_executor_workers,
+            thread_name_prefix="readonly-sql"
+        )
+    return _query_executor
+
+
+async def run_in_query_executor(func, *args):
+    """Run a blocking database call on the bounded read-only executor."""
+    loop = asyncio.get_running_loop()
+    # Carry the caller's context over so the call's timing spans land on its request
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(get_query_executor(), partial(context.run, func, *args))
+
+
+def get_background_executor() -> ThreadPoolExecutor:
+    """Return the housekeeping executor, creating it if none is running."""
+    global _background_executor
+    if _background_executor is None:
+        _background_executor = ThreadPoolExecutor(
+            max_workers=settings.background_executor_workers,
+            thread_name_prefix="background"
+        )
+    return _background_executor
+
+
+async def run_in_background_executor(func, *args):
+    """Run a blocking housekeeping call off the event loop without using query threads."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_background_executor(), partial(func, *args))
+
+
+async def execute_safe_query_async(query: str, timeout_seconds: Optional[float] = None) -> dict:
+    """Run execute_safe_query on the bounded executor without blocking the event loop."""
+    return await run_in_query_executor(execute_safe_query, query, timeout_seconds)
+
+
+def get_data_version() -> str:
+    """Return a cheap fingerprint of warehouse contents that changes on every ingest."""
+    with readonly_engine.connect() as conn:
+        row = conn.execute(text(
+            "SELECT "
+            "(SELECT COALESCE(MAX(id), 0) FROM extended_fact_measure), "
+            "(SELECT COALESCE(MAX(id), 0) FROM fact_measure), "
+            "(SELECT COALESCE(MAX(id), 0) FROM dataset_registry), "
+            "(SELECT COUNT(*) FROM dataset_registry WHERE is_active)"
+        )).one()
+    return ":".join(str(value) for value in row)
+
+
+def shutdown_query_executor() -> None:
+    """Stop the read-only query and housekeeping executors, dropping queued work."""
+    global _query_executor, _background_executor
+    if _query_executor is not None:
+        _query_executor.shutdown(wait=False, cancel_futures=True)
+        _query_executor = None
+    if _background_executor is not None:
+        _background_executor.shutdown(wait=False, cancel_futures=True)
+        _background_executor = None
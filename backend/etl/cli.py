@@ -229,6 +229,33 @@ def search_datasets(query: str, category: Optional[str]):
         click.echo(f"   Geographic Level: {dataset['geographic_level']}")
 
 
+@cli.command()
+@click.argument('sources', nargs=-1, type=click.Path(exists=True))
+@click.option('--output', default=settings.doc_index_path, help='Directory to write the index to')
+@click.option('--catalog/--no-catalog', default=True, help='Also index dataset registry descriptions')
+def build_doc_index(sources, output: str, catalog: bool):
+    """Build the search_docs index from markdown/text/PDF files and the dataset catalog."""
+    from services.doc_search import build_index, catalog_documents, load_documents
+    
+    documents = load_documents(list(sources))
+    click.echo(f"📄 Loaded {len(documents)} chunks from {len(sources)} source path(s)")
+    if catalog:
+        from services.government_data_service import government_data_service
+        try:
+            datasets = government_data_service.get_all_datasets()
+            documents += catalog_documents(datasets)
+            click.echo(f"📊 Added {len(datasets)} dataset descriptions")
+        except Exception as e:
+            click.echo(f"⚠️  Skipping dataset catalog: {e}")
+    
+    if not documents:
+        click.echo("❌ Nothing to index.")
+        return
+    
+    stats = build_index(documents, output)
+    click.echo(f"✅ Indexed {stats['documents']} documents, {stats['terms']} terms into {output}")
+
+
 @cli.command()
 def status():
     """Show overall ETL pipeline status."""
@@ -0,0 +1,199 @@
+"""Admission control for LLM calls: token bucket, in-flight limit and priority lanes."""
+
+import asyncio
+import contextvars
+import math
+import time
+from contextlib import asynccontextmanager, contextmanager
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, Iterator, Optional
+
+from core.config import settings
+from core.logging import get_logger
+from llm.hedging import LatencyWindow
+
+logger = get_logger(__name__)
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+LANES = (INTERACTIVE, BATCH)
+
+# Lane of the LLM work running in the current task; interactive unless marked otherwise
+current_lane: contextvars.ContextVar = contextvars.ContextVar("llm_lane", default=INTERACTIVE)
+
+
+class AdmissionRejected(Exception):
+    """Raised when an LLM call cannot be admitted in time; callers should answer 429."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+@contextmanager
+def priority_lane(lane: str) -> Iterator[None]:
+    """Run the enclosed LLM calls in ``lane`` (``interactive`` or ``batch``)."""
+    if lane not in LANES:
+        raise ValueError(f"Unknown LLM lane: {lane}")
+    token = current_lane.set(lane)
+    try:
+        yield
+    finally:
+        current_lane.reset(token)
+
+
+class LLMAdmission:
+    """Admit LLM calls under a request rate and a concurrency limit.
+
+    A token bucket (``rate_per_second``, ``burst``) bounds how fast calls
+    start and ``max_in_flight`` bounds how many run at once; the batch lane
+    additionally has its own, smaller in-flight cap. Waiting calls are
+    admitted first-come first-served within a lane, and batch calls only
+    when no interactive call is waiting. A call that cannot be admitted
+    within its lane's wait limit, or that finds the queue full, is
+    rejected with a ``retry_after`` hint instead of waiting indefinitely.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: Optional[int] = None,
+        batch_max_in_flight: Optional[int] = None,
+        rate_per_second: Optional[float] = None,
+        burst: Optional[int] = None,
+        max_queue: Optional[int] = None
+    ):
+        self.max_in_flight = max_in_flight or settings.llm_max_in_flight
+        self.lane_limits = {
+            INTERACTIVE: self.max_in_flight,
+            BATCH: min(batch_max_in_flight or settings.llm_batch_max_in_flight, self.max_in_flight),
+        }
+        self.rate_per_second = settings.llm_rate_per_second if rate_per_second is None else rate_per_second
+        self.burst = burst or settings.llm_burst
+        self.max_queue = max_queue or settings.llm_queue_max
+        self.tokens = float(self.burst)
+        self._refilled_at = time.monotonic()
+        self.in_flight: Dict[str, int] = {lane: 0 for lane in LANES}
+        self._waiters: Dict[str, Deque[asyncio.Event]] = {lane: deque() for lane in LANES}
+        self.admitted: Dict[str, int] = {lane: 0 for lane in LANES}
+        self.rejected: Dict[str, int] = {lane: 0 for lane in LANES}
+        self.wait_seconds: Dict[str, LatencyWindow] = {lane: LatencyWindow() for lane in LANES}
+
+    @staticmethod
+    def max_wait(lane: str) -> float:
+        if lane == BATCH:
+            return settings.llm_batch_max_wait_seconds
+        return settings.llm_interactive_max_wait_seconds
+
+    def _refill(self) -> None:
+        if self.rate_per_second <= 0:
+            return
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._refilled_at) * self.rate_per_second)
+        self._refilled_at = now
+
+    def _token_wait(self, needed: float = 1.0) -> float:
+        """Seconds until ``needed`` tokens are available."""
+        if self.rate_per_second <= 0 or self.tokens >= needed:
+            return 0.0
+        return (needed - self.tokens) / self.rate_per_second
+
+    def _first_in_line(self, lane: str, waiter: Optional[asyncio.Event]) -> bool:
+        """Whether a call in ``lane`` (``waiter`` None for a new call) may go ahead of everyone waiting."""
+        queue = self._waiters[lane]
+        ahead_in_lane = queue and queue[0] is not waiter
+        return not ahead_in_lane and (lane == INTERACTIVE or not self._waiters[INTERACTIVE])
+
+    def _try_take(self, lane: str) -> bool:
+        self._refill()
+        if sum(self.in_flight.values()) >= self.max_in_flight or self.in_flight[lane] >= self.lane_limits[lane]:
+            return False
+        if self.rate_per_second > 0:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+        self.in_flight[lane] += 1
+        return True
+
+    def _wake(self) -> None:
+        for queue in self._waiters.values():
+            if queue:
+                queue[0].set()
+
+    def _reject(self, lane: str, reason: str) -> AdmissionRejected:
+        self.rejected[lane] += 1
+        waiting = sum(len(queue) for queue in self._waiters.values())
+        retry_after = max(1.0, math.ceil(self._token_wait(waiting + 1)))
+        logger.warning(f"Rejected {lane} LLM call: {reason}; retry after {retry_after:.0f}s")
+        return AdmissionRejected(f"LLM capacity exhausted ({reason})", retry_after)
+
+    async def acquire(self, lane: str, timeout: Optional[float] = None) -> None:
+        """Wait for a slot in ``lane`` for at most the lane's wait limit (or ``timeout``)."""
+        started = time.monotonic()
+        if self._first_in_line(lane, None) and self._try_take(lane):
+            self._admit(lane, started)
+            return
+        if sum(len(queue) for queue in self._waiters.values()) >= self.max_queue:
+            raise self._reject(lane, "queue full")
+
+        max_wait = self.max_wait(lane) if timeout is None else min(self.max_wait(lane), timeout)
+        waiter = asyncio.Event()
+        self._waiters[lane].append(waiter)
+        try:
+            while True:
+                if self._first_in_line(lane, waiter) and self._try_take(lane):
+                    break
+                remaining = started + max_wait - time.monotonic()
+                if remaining <= 0:
+                    raise self._reject(lane, f"no slot within {max_wait:.1f}s")
+                # Woken by a release, or poll when the next bucket token is due
+                waiter.clear()
+                token_wait = self._token_wait() or remaining
+                try:
+                    await asyncio.wait_for(waiter.wait(), min(remaining, token_wait))
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._waiters[lane].remove(waiter)
+            self._wake()
+        self._admit(lane, started)
+
+    def _admit(self, lane: str, started: float) -> None:
+        self.admitted[lane] += 1
+        self.wait_seconds[lane].add(time.monotonic() - started)
+
+    def release(self, lane: str) -> None:
+        self.in_flight[lane] -= 1
+        self._wake()
+
+    @asynccontextmanager
+    async def slot(self, timeout: Optional[float] = None) -> AsyncIterator[str]:
+        """Hold a slot in the current task's lane for the duration of the block."""
+        lane = current_lane.get()
+        await self.acquire(lane, timeout)
+        try:
+            yield lane
+        finally:
+            self.release(lane)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return per-lane in-flight, queue, admission and wait-time figures."""
+        self._refill()
+        lanes = {}
+        for lane in LANES:
+            p50 = self.wait_seconds[lane].percentile(50)
+            p95 = self.wait_seconds[lane].percentile(95)
+            lanes[lane] = {
+                "in_flight": self.in_flight[lane],
+                "max_in_flight": self.lane_limits[lane],
+                "waiting": len(self._waiters[lane]),
+                "admitted": self.admitted[lane],
+                "rejected": self.rejected[lane],
+                "wait_seconds_p50": round(p50, 3) if p50 is not None else None,
+                "wait_seconds_p95": round(p95, 3) if p95 is not None else None,
+            }
+        return {
+            "max_in_flight": self.max_in_flight,
+            "rate_per_second": self.rate_per_second,
+            "tokens": round(self.tokens, 2),
+            "lanes": lanes,
+        }
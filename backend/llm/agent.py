@@ -1,15 +1,128 @@
 """LLM agent with tool calling capabilities."""
 
+import asyncio
 import json
 import time
-from typing import Dict, Any, List, Optional
-from llm.openrouter import OpenRouterClient, OpenRouterError
+import uuid
+from typing import Dict, Any, List, Optional, Callable, Awaitable, Tuple
+from llm.openrouter import OpenRouterClient, OpenRouterError, get_shared_client
+from llm.admission import AdmissionRejected
+from llm.streaming import InsightTextExtractor, summarize_event_payload
 from services.schema import SchemaService
-from db.session import execute_safe_query
-from core.logging import get_logger, log_request_response
+from services.result_compactor import compact_result, estimate_tokens
+from services.response_assembly import assemble_result_data
+from services.sql_template_cache import sql_template_cache
+from services.example_library import example_library, format_examples
+from services.doc_search import doc_search_index
+from services.conversation_sessions import ConversationSession, conversation_store
+from services.result_refiner import RefineError, refine_result
+from services.usage_ledger import estimate_cost, usage_ledger
+from db.session import execute_safe_query_async
+from core.config import settings
+from core.deadline import Deadline, DeadlineExceeded
+from core.logging import get_logger, hash_prompt, log_request_response
+from core.timing import span
+
+# Async callback receiving (event_name, payload) progress notifications
+EventCallback = Callable[[str, Dict[str, Any]], Awaitable[None]]
 
 logger = get_logger(__name__)
 
+# Offered only when the conversation has cached results to work from
+REFINE_RESULT_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "refine_result",
+        "description": (
+            "Filter, regroup, sort or trim a cached result from earlier in this conversation "
+            "without running SQL. Use it when the new question is a subset or re-slice of that result."
+        ),
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "result_id": {"type": "string", "description": "Cached result id (e.g. r1); defaults to the latest"},
+                "where": {
+                    "type": "array",
+                    "description": "Row conditions, all of which must hold",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "column": {"type": "string"},
+                            "op": {"type": "string", "enum": ["=", "!=", ">", ">=", "<", "<=", "in", "contains"]},
+                            "value": {}
+                        },
+                        "required": ["column", "value"]
+                    }
+                },
+                "group_by": {"type": "array", "items": {"type": "string"}, "description": "Columns to group by"},
+                "aggregate": {
+                    "type": "object",
+                    "description": "Column -> sum, avg, min, max or count, applied per group"
+                },
+                "columns": {"type": "array", "items": {"type": "string"}, "description": "Columns to keep"},
+                "sort_by": {"type": "string"},
+                "descending": {"type": "boolean"},
+                "limit": {"type": "integer"}
+            }
+        }
+    }
+}
+
+
+class AgentStats:
+    """Process-wide counters of LLM rounds, tool usage and SQL failures per request.
+    
+    Requests are also split by whether few-shot examples were injected, so
+    the effect of the example library on rounds and SQL retries is visible.
+    """
+    
+    def __init__(self):
+        self.requests = 0
+        self.llm_rounds = 0
+        self.sql_failures = 0
+        self.tool_calls: Dict[str, int] = {}
+        self.cohorts: Dict[str, Dict[str, int]] = {}
+    
+    def record(
+        self,
+        llm_rounds: int,
+        tool_calls: Dict[str, int],
+        sql_failures: int = 0,
+        with_examples: bool = False
+    ) -> None:
+        self.requests += 1
+        self.llm_rounds += llm_rounds
+        self.sql_failures += sql_failures
+        for name, count in tool_calls.items():
+            self.tool_calls[name] = self.tool_calls.get(name, 0) + count
+        cohort = self.cohorts.setdefault(
+            "with_examples" if with_examples else "without_examples",
+            {"requests": 0, "llm_rounds": 0, "sql_failures": 0}
+        )
+        cohort["requests"] += 1
+        cohort["llm_rounds"] += llm_rounds
+        cohort["sql_failures"] += sql_failures
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "llm_rounds": self.llm_rounds,
+            "avg_llm_rounds": round(self.llm_rounds / self.requests, 2) if self.requests else 0.0,
+            "avg_sql_failures": round(self.sql_failures / self.requests, 2) if self.requests else 0.0,
+            "tool_calls": dict(self.tool_calls),
+            "cohorts": {
+                name: {
+                    **counts,
+                    "avg_llm_rounds": round(counts["llm_rounds"] / counts["requests"], 2),
+                    "avg_sql_failures": round(counts["sql_failures"] / counts["requests"], 2),
+                }
+                for name, counts in self.cohorts.items()
+            },
+        }
+
+
+agent_stats = AgentStats()
+
 
 class MunicipalAnalystAgent:
     """Municipal data analyst agent with tool calling capabilities."""
@@ -29,14 +142,14 @@ AVAILABLE DATA SOURCES:
    - Use tables: fact_measure, dim_indicator, dim_geo, dim_time
 
 IMPORTANT INSTRUCTIONS:
-1. ALWAYS call get_schema() first if you're unsure about the database structure
+1. The user message lists the columns and join keys of the tables relevant to the query; call get_schema() only if you need column descriptions
 2. For questions about GDP, inflation, PMGSY, education, etc., use GOVERNMENT DATASETS (extended_fact_measure)
 3. Draft safe SQL queries that apply user filters (time/place/extra)
-4. Call run_sql() to execute queries
+4. Call run_sql() to execute queries; it returns row_count, per-column statistics and a sample of rows (the full result is attached to the response for you)
 5. Synthesize responses that EXACTLY match the required JSON schema
 6. For visualizations, prefer simple bar/line/area charts in Vega-Lite format
-7. Use "data":{"values":"__INLINE_DATA__"} placeholder in chart specs
-8. Keep data_preview.rows ≤ 50 rows
+7. Use "data":{"values":"__INLINE_DATA__"} placeholder in chart specs and encode fields by the run_sql column names
+8. Do NOT copy result rows into your answer: the server fills data_preview, sql_used and the chart data from your last successful run_sql
 9. Include concise disclaimers if data looks sparse or missing
 10. Return insights in a conversational, helpful tone
 
@@ -51,15 +164,13 @@ FILTER APPLICATION:
 - place.state/district/ward/zone: Filter by geographic location using dim_geo
 - extra.category: Filter by dataset category (Economic, Infrastructure, Social, Environmental)
 
-RESPONSE FORMAT: Always return a complete JSON response with all required fields:
+RESPONSE FORMAT: Always return a complete JSON response with these fields (sql_used and data_preview are added by the server):
 - insight_text: DETAILED, in-depth analysis with key findings, trends, and actionable insights. Include:
   * Executive Summary (2-3 sentences)
   * Key Findings (3-5 bullet points with specific data points)
   * Trend Analysis (what patterns emerge from the data)
   * Notable Observations (outliers, interesting correlations)
   * Actionable Recommendations (what this data suggests for decision-making)
-- sql_used: The exact SQL query executed
-- data_preview: {columns: [...], rows: [...]} with ≤50 rows
 - viz: Vega-Lite chart specification with __INLINE_DATA__ placeholder (prefer interactive charts)
 - doc_citations: List of relevant citations (use search_docs)
 - filters_applied: Echo the filters that were actually applied
@@ -73,9 +184,53 @@ INSIGHT WRITING GUIDELINES:
 - Use clear, professional language but keep it engaging
 - Include comparisons (year-over-year, state-wise, etc.) when relevant"""
 
-    def __init__(self):
-        self.client = OpenRouterClient()
+    @classmethod
+    def build_system_prompt(cls) -> str:
+        """Return the system prompt with the cached schema digest (table names and value hints) appended.
+        
+        The whole message is identical across requests, so providers can
+        reuse it as a cached prompt prefix.
+        """
+        return f"{cls.SYSTEM_PROMPT}\n\nSCHEMA DIGEST:\n{SchemaService.get_schema_digest()}"
+    
+    @staticmethod
+    def planner_model() -> str:
+        """Model that decides which tools to call."""
+        return settings.planner_model_slug or settings.model_slug
+    
+    @staticmethod
+    def synthesis_model() -> str:
+        """Model that writes the final JSON answer."""
+        return settings.synthesis_model_slug or settings.model_slug
+    
+    def __init__(self, client: Optional[OpenRouterClient] = None):
+        # Reuse the worker's pooled client so connections survive across requests
+        self.client = client or get_shared_client()
         self.schema_service = SchemaService()
+        # Set once process_query produced a genuine LLM answer (safe to cache)
+        self.last_run_succeeded = False
+        self._on_event: Optional[EventCallback] = None
+        # Full run_sql results, kept server-side while the LLM sees compacted copies
+        self.query_results: List[Dict[str, Any]] = []
+        # Per-request round and tool counters, logged and aggregated in agent_stats
+        self.llm_rounds = 0
+        self.tool_call_counts: Dict[str, int] = {}
+        # Per-stage model, token and latency totals for the request log
+        self.stage_metrics: Dict[str, Dict[str, Any]] = {}
+        # Set when the run was answered from a learned SQL template
+        self.used_sql_template = False
+        # Failed run_sql calls and few-shot examples shown, for measuring the example library
+        self.sql_failures = 0
+        self.few_shot_examples = 0
+        # Conversation this request continues, if any
+        self.session: Optional[ConversationSession] = None
+        # Tables, joins and datasets relevant to this request, chosen once in _user_message
+        self.schema_subset: Optional[Dict[str, Any]] = None
+        self.schema_tokens: Dict[str, Any] = {}
+        # Keys of this request's LLM calls in the usage ledger
+        self.request_id = uuid.uuid4().hex
+        self.prompt_hash = ""
+        self.deadline = Deadline(settings.insight_deadline_seconds)
         
     def get_tools_definition(self) -> List[Dict[str, Any]]:
         """Define the tools available to the LLM."""
@@ -84,7 +239,7 @@ INSIGHT WRITING GUIDELINES:
                 "type": "function",
                 "function": {
                     "name": "get_schema",
-                    "description": "Get the sanitized database schema with tables, columns, and join information",
+                    "description": "Get column descriptions, joins and candidate datasets for the tables relevant to this query",
                     "parameters": {
                         "type": "object",
                         "properties": {},
@@ -138,15 +293,16 @@ INSIGHT WRITING GUIDELINES:
                     }
                 }
             }
-        ]
+        ] + ([REFINE_RESULT_TOOL] if self.session is not None and self.session.results else [])
     
-    def execute_tool(self, tool_name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
+    async def execute_tool(self, tool_name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
         """Execute a tool function and return the result."""
         try:
             if tool_name == "get_schema":
+                schema = self.schema_subset or self.schema_service.get_sanitized_schema()
                 return {
                     "success": True,
-                    "result": self.schema_service.get_sanitized_schema()
+                    "result": {key: value for key, value in schema.items() if key != "selection_ms"}
                 }
             
             elif tool_name == "run_sql":
@@ -154,7 +310,9 @@ INSIGHT WRITING GUIDELINES:
                 start_time = time.time()
                 
                 try:
-                    result = execute_safe_query(query)
+                    # Never let one statement outlive the request's remaining budget
+                    timeout_seconds = min(settings.query_timeout_seconds, self.deadline.check())
+                    result = await execute_safe_query_async(query, timeout_seconds)
                     duration_ms = int((time.time() - start_time) * 1000)
                     
                     return {
@@ -175,11 +333,36 @@ INSIGHT WRITING GUIDELINES:
                         "duration_ms": duration_ms
                     }
             
+            elif tool_name == "refine_result":
+                source = self.session.get_result(arguments.get("result_id")) if self.session else None
+                if source is None:
+                    return {"success": False, "error": f"No cached result {arguments.get('result_id')!r} in this conversation"}
+                try:
+                    refined = refine_result(source, arguments)
+                except RefineError as e:
+                    return {"success": False, "error": str(e)}
+                conversation_store.refinements += 1
+                return {
+                    "success": True,
+                    "result": {
+                        **refined,
+                        "refined_from": source["result_id"],
+                        "query": source["query"],
+                        # The cached rows were capped, so aggregates over them may be incomplete
+                        "source_truncated": source["truncated"],
+                    }
+                }
+            
             elif tool_name == "search_docs":
-                # Stub implementation - returns empty for now
+                citations = doc_search_index.search(
+                    arguments.get("text", ""),
+                    ward=arguments.get("ward"),
+                    from_date=arguments.get("from_date"),
+                    to_date=arguments.get("to_date"),
+                )
                 return {
                     "success": True,
-                    "result": []
+                    "result": citations
                 }
             
             else:
@@ -195,65 +378,212 @@ INSIGHT WRITING GUIDELINES:
                 "error": str(e)
             }
     
-    async def process_query(self, prompt: str, filters: Dict[str, Any]) -> Dict[str, Any]:
-        """Process a user query with filters and return insights."""
+    async def _emit(self, event: str, payload: Dict[str, Any]) -> None:
+        """Forward a progress event to the streaming callback, if any."""
+        if self._on_event is not None:
+            await self._on_event(event, payload)
+    
+    async def _complete(
+        self,
+        messages: List[Dict[str, Any]],
+        tools: List[Dict[str, Any]],
+        tool_choice: str = "auto",
+        stage: str = "planner"
+    ) -> Dict[str, Any]:
+        """Run one LLM round with the model routed to ``stage`` ("planner" or "synthesis").
+        
+        insight_text tokens are streamed when a listener is attached and the
+        round may produce the final answer. The call is bounded by the request
+        deadline; DeadlineExceeded is raised when the budget runs out before
+        the model answers.
+        """
+        remaining = self.deadline.check()
+        self.llm_rounds += 1
+        model = self.planner_model() if stage == "planner" else self.synthesis_model()
+        routed = self.planner_model() != self.synthesis_model()
+        
+        on_delta = None
+        if self._on_event is not None and (stage == "synthesis" or not routed):
+            extractor = InsightTextExtractor()
+            
+            async def on_delta(fragment: str) -> None:
+                text = extractor.feed(fragment)
+                if text:
+                    await self._emit("insight_token", {"text": text})
+        
+        started = time.monotonic()
+        try:
+            response = await asyncio.wait_for(
+                self.client.chat_completion(
+                    messages=messages,
+                    tools=tools,
+                    tool_choice=tool_choice,
+                    temperature=0.1,
+                    max_tokens=settings.planner_max_tokens if stage == "planner" and routed else 2000,
+                    on_delta=on_delta,
+                    timeout=remaining,
+                    model=model
+                ),
+                timeout=remaining
+            )
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded(f"LLM call did not finish within the remaining {remaining:.1f}s")
+        
+        # Without routing one model does both jobs; label the round by what it did
+        if not routed and not response["choices"][0]["message"].get("tool_calls"):
+            stage = "synthesis"
+        usage = response.get("usage") or {}
+        seconds = time.monotonic() - started
+        # A hedged call may have been answered by the hedge model
+        served_by = response.get("model") or model
+        usage_ledger.record(self.request_id, self.prompt_hash, served_by, stage, usage, int(seconds * 1000))
+        self._record_stage(stage, served_by, usage, seconds)
+        return response
+    
+    def _record_stage(self, stage: str, model: str, usage: Dict[str, Any], seconds: float) -> None:
+        """Accumulate model, token and latency figures for one LLM round."""
+        metrics = self.stage_metrics.setdefault(stage, {
+            "model": model,
+            "calls": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "latency_ms": 0,
+        })
+        metrics["calls"] += 1
+        metrics["prompt_tokens"] += usage.get("prompt_tokens") or 0
+        metrics["completion_tokens"] += usage.get("completion_tokens") or 0
+        cost = estimate_cost(model, usage)
+        if cost is not None:
+            metrics["cost_usd"] = round(metrics.get("cost_usd", 0.0) + cost, 6)
+        metrics["latency_ms"] += int(seconds * 1000)
+    
+    async def _run_tool_call(
+        self,
+        tool_call: Dict[str, Any],
+        tool_slots: asyncio.Semaphore
+    ) -> Tuple[str, Dict[str, Any], Dict[str, Any]]:
+        """Execute one tool call under the request's concurrency cap."""
+        tool_name = tool_call["function"]["name"]
+        self.tool_call_counts[tool_name] = self.tool_call_counts.get(tool_name, 0) + 1
+        try:
+            arguments = json.loads(tool_call["function"]["arguments"] or "{}")
+        except ValueError as e:
+            # Reported back so the model can correct the call instead of failing the request
+            return tool_name, {}, {"success": False, "error": f"Invalid JSON arguments for {tool_name}: {e}"}
+        
+        async with tool_slots:
+            await self._emit("tool_call", {"name": tool_name, "arguments": arguments})
+            with span("tool", tool=tool_name):
+                tool_result = await self.execute_tool(tool_name, arguments)
+        
+        if tool_name == "refine_result" and tool_result.get("success"):
+            await self._emit("data_preview", summarize_event_payload(
+                tool_result["result"], settings.max_preview_rows
+            ))
+        if tool_name == "run_sql":
+            await self._emit("sql_executed", {
+                "success": tool_result.get("success", False),
+                "row_count": tool_result.get("result", {}).get("row_count", 0),
+                "duration_ms": tool_result.get("result", {}).get(
+                    "duration_ms", tool_result.get("duration_ms")
+                ),
+                "error": tool_result.get("error")
+            })
+            if tool_result.get("success"):
+                await self._emit("data_preview", summarize_event_payload(
+                    tool_result["result"], settings.max_preview_rows
+                ))
+        
+        return tool_name, arguments, tool_result
+    
+    async def process_query(
+        self,
+        prompt: str,
+        filters: Dict[str, Any],
+        on_event: Optional[EventCallback] = None,
+        deadline: Optional[Deadline] = None,
+        session: Optional[ConversationSession] = None
+    ) -> Dict[str, Any]:
+        """Process a user query with filters and return insights.
+        
+        ``on_event`` receives progress events (tool calls, SQL results, data
+        previews and insight_text tokens) for streaming clients. The loop is
+        bounded by ``deadline`` and ``settings.max_tool_rounds``; when either
+        runs out the best partial answer is returned instead of an error.
+        With a conversation ``session`` the model sees earlier turns and can
+        re-slice their cached results with refine_result instead of new SQL.
+        """
         start_time = time.time()
-        sql_used = ""
-        row_count = 0
+        self._on_event = on_event
+        self.session = session
+        self.request_id = uuid.uuid4().hex
+        self.prompt_hash = hash_prompt(prompt)
+        if deadline is not None:
+            self.deadline = deadline
         
         try:
             # Build messages with system prompt and user query
             messages = [
-                {"role": "system", "content": self.SYSTEM_PROMPT},
-                {"role": "user", "content": f"Query: {prompt}\nFilters: {json.dumps(filters)}"}
+                {"role": "system", "content": self.build_system_prompt()},
+                {"role": "user", "content": self._user_message(prompt, filters)}
             ]
             
             # Get tools definition
             tools = self.get_tools_definition()
+            tool_slots = asyncio.Semaphore(settings.max_concurrent_tool_calls)
             
-            # Initial LLM call
-            response = await self.client.chat_completion(
-                messages=messages,
-                tools=tools,
-                tool_choice="auto",
-                temperature=0.1
-            )
+            # A learned question pattern runs its SQL directly and skips tool planning;
+            # a follow-up's wording only makes sense with its conversation, so it never does
+            follow_up = self.session is not None and bool(self.session.turns)
+            synthesized = False if follow_up else await self._run_sql_template(prompt, filters, messages)
+            if synthesized:
+                response = await self._complete(messages, tools, tool_choice="none", stage="synthesis")
+            else:
+                # Initial LLM call
+                response = await self._complete(messages, tools)
             
             # Process tool calls
             message = response["choices"][0]["message"]
+            tool_rounds = 0
             
             while message.get("tool_calls"):
+                tool_rounds += 1
+                
                 # Add assistant message to conversation
                 messages.append(message)
                 
-                # Execute each tool call
-                for tool_call in message["tool_calls"]:
-                    tool_name = tool_call["function"]["name"]
-                    arguments = json.loads(tool_call["function"]["arguments"])
-                    
-                    # Execute the tool
-                    tool_result = self.execute_tool(tool_name, arguments)
-                    
-                    # Track SQL and row count for logging
-                    if tool_name == "run_sql" and tool_result.get("success"):
-                        sql_used = arguments.get("query", "")
-                        row_count = tool_result["result"].get("row_count", 0)
-                    
-                    # Add tool result to conversation
-                    messages.append({
-                        "role": "tool",
-                        "tool_call_id": tool_call["id"],
-                        "content": json.dumps(tool_result)
-                    })
+                # Execute the round's tool calls concurrently, bounded per request
+                tool_tasks = [
+                    asyncio.ensure_future(self._run_tool_call(tool_call, tool_slots))
+                    for tool_call in message["tool_calls"]
+                ]
+                try:
+                    tool_outcomes = await asyncio.gather(*tool_tasks)
+                except BaseException:
+                    # One failed call (or a cancelled request) must not leave its siblings running
+                    for task in tool_tasks:
+                        task.cancel()
+                    await asyncio.gather(*tool_tasks, return_exceptions=True)
+                    raise
                 
-                # Get next response from LLM
-                response = await self.client.chat_completion(
-                    messages=messages,
-                    tools=tools,
-                    tool_choice="auto",
-                    temperature=0.1
-                )
+                # Results go back in the model's original tool_call order
+                for tool_call, (tool_name, arguments, tool_result) in zip(message["tool_calls"], tool_outcomes):
+                    messages.append(self._tool_message(tool_call, tool_name, arguments, tool_result))
                 
+                # Get next response from LLM; once out of rounds, insist on the final answer
+                if tool_rounds >= settings.max_tool_rounds:
+                    response = await self._complete(messages, tools, tool_choice="none", stage="synthesis")
+                    message = response["choices"][0]["message"]
+                    if message.get("tool_calls"):
+                        raise DeadlineExceeded(f"Reached the limit of {settings.max_tool_rounds} tool rounds")
+                    synthesized = True
+                else:
+                    response = await self._complete(messages, tools)
+                    message = response["choices"][0]["message"]
+            
+            # With routing, the planner's own answer is dropped and the synthesis model writes it
+            if not synthesized and self.planner_model() != self.synthesis_model():
+                response = await self._complete(messages, tools, tool_choice="none", stage="synthesis")
                 message = response["choices"][0]["message"]
             
             # Extract final response
@@ -261,57 +591,258 @@ INSIGHT WRITING GUIDELINES:
             
             # Try to parse as JSON
             try:
-                result = json.loads(final_content)
-                
-                # Validate required fields
-                required_fields = [
-                    "insight_text", "sql_used", "data_preview", "viz", 
-                    "doc_citations", "filters_applied", "disclaimers"
-                ]
-                
-                for field in required_fields:
-                    if field not in result:
-                        result[field] = self._get_default_value(field)
-                
-                # Ensure data_preview has correct structure
-                if "data_preview" in result:
-                    preview = result["data_preview"]
-                    if not isinstance(preview, dict) or "columns" not in preview or "rows" not in preview:
-                        result["data_preview"] = {"columns": [], "rows": []}
+                with span("assembly"):
+                    result = json.loads(final_content)
+                    
+                    # Fill data_preview, sql_used and chart data from real query results
+                    if self.query_results:
+                        assemble_result_data(result, self.query_results[-1], settings.max_preview_rows)
+                    
+                    # Validate required fields
+                    required_fields = [
+                        "insight_text", "sql_used", "data_preview", "viz", 
+                        "doc_citations", "filters_applied", "disclaimers"
+                    ]
+                    
+                    for field in required_fields:
+                        if field not in result:
+                            result[field] = self._get_default_value(field)
+                    
+                    # Ensure data_preview has correct structure
+                    if "data_preview" in result:
+                        preview = result["data_preview"]
+                        if not isinstance(preview, dict) or "columns" not in preview or "rows" not in preview:
+                            result["data_preview"] = {"columns": [], "rows": []}
+                    
+                    # Attach the full result of the last successful query
+                    if self.query_results:
+                        result["full_result"] = self._full_result()
                 
                 # Log the request/response
                 duration_ms = int((time.time() - start_time) * 1000)
+                sql_used, row_count = self._last_query_summary()
                 log_request_response(
-                    logger, prompt, filters, sql_used, duration_ms, row_count, True
+                    logger, prompt, filters, sql_used, duration_ms, row_count, True,
+                    extra=self._run_metrics()
                 )
                 
+                self.last_run_succeeded = True
+                if self.query_results and "refined_from" in self.query_results[-1]:
+                    if not isinstance(result["disclaimers"], list):
+                        result["disclaimers"] = [result["disclaimers"]]
+                    result["disclaimers"].append(
+                        "Computed from an earlier result in this conversation; sql_used is the query it came from."
+                    )
+                    if self.query_results[-1].get("source_truncated"):
+                        result["disclaimers"].append(
+                            "The earlier result was cut off at its row limit, so these figures may be incomplete."
+                        )
+                elif self.query_results and not follow_up and self.query_results[-1]["row_count"] > 0:
+                    # Learned pairs are shared across users, so only context-free questions
+                    # whose query found rows qualify, as on the template replay path
+                    if not self.used_sql_template:
+                        sql_template_cache.learn(prompt, filters, self.query_results[-1]["query"])
+                    example_library.add(prompt, self.query_results[-1]["query"])
                 return result
                 
             except json.JSONDecodeError:
                 # Fallback response if JSON parsing fails
                 duration_ms = int((time.time() - start_time) * 1000)
+                sql_used, row_count = self._last_query_summary()
                 log_request_response(
-                    logger, prompt, filters, sql_used, duration_ms, row_count, False, "JSON parsing failed"
+                    logger, prompt, filters, sql_used, duration_ms, row_count, False, "JSON parsing failed",
+                    extra=self._run_metrics()
                 )
                 
                 return self._create_fallback_response(final_content, filters)
         
+        except AdmissionRejected:
+            # Over capacity: let the API answer 429 instead of a templated fallback
+            raise
+        
+        except DeadlineExceeded as e:
+            duration_ms = int((time.time() - start_time) * 1000)
+            sql_used, row_count = self._last_query_summary()
+            logger.warning(f"Returning partial answer: {e}")
+            
+            log_request_response(
+                logger, prompt, filters, sql_used, duration_ms, row_count, False, str(e),
+                extra={**self._run_metrics(), "partial": True}
+            )
+            
+            return self._create_partial_response(prompt, filters, str(e))
+        
         except Exception as e:
             duration_ms = int((time.time() - start_time) * 1000)
+            sql_used, row_count = self._last_query_summary()
             error_msg = str(e)
             logger.error(f"LLM Agent Exception: {error_msg}")
             
             log_request_response(
-                logger, prompt, filters, sql_used, duration_ms, row_count, False, error_msg
+                logger, prompt, filters, sql_used, duration_ms, row_count, False, error_msg,
+                extra=self._run_metrics()
             )
             
             # Use query-specific response generation when LLM fails
             logger.info("Generating query-specific response due to LLM failure...")
             return self._create_query_specific_response(prompt, filters, error_msg)
 
-    async def generate_insight(self, prompt: str, filters: Dict[str, Any]) -> Dict[str, Any]:
+    def _user_message(self, prompt: str, filters: Dict[str, Any]) -> str:
+        """Build the user message, with the relevant schema subset and similar verified question/SQL pairs.
+        
+        Both go here rather than in the system prompt so the system
+        prompt stays identical (and cacheable) across requests.
+        """
+        content = f"Query: {prompt}\nFilters: {json.dumps(filters)}"
+        if self.session is not None and self.session.turns:
+            content = f"{self.session.describe()}\n\n{content}"
+        self.schema_subset = self.schema_service.select_schema(prompt, filters)
+        subset_text = self.schema_service.describe_subset(self.schema_subset)
+        content += "\n\n" + subset_text
+        examples = example_library.search(prompt)
+        self.few_shot_examples = len(examples)
+        if examples:
+            content += (
+                "\n\nSIMILAR SOLVED QUESTIONS (verified SQL; adapt tables, filters and values to this query):\n"
+                + format_examples(examples)
+            )
+        
+        # Sizes of the text actually sent, next to what describing every table would cost
+        self.schema_tokens = {
+            "system_prompt": estimate_tokens(self.build_system_prompt()),
+            "user_message": estimate_tokens(content),
+            "full_tables": self.schema_service.get_full_tables_tokens(),
+            "subset": estimate_tokens(subset_text),
+            "selection_ms": self.schema_subset["selection_ms"],
+        }
+        return content
+    
+    def _tool_message(
+        self,
+        tool_call: Dict[str, Any],
+        tool_name: str,
+        arguments: Dict[str, Any],
+        tool_result: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """Record a tool result and build the tool message sent back to the LLM."""
+        if tool_name == "run_sql" and not tool_result.get("success"):
+            self.sql_failures += 1
+        if tool_name in ("run_sql", "refine_result") and tool_result.get("success"):
+            if tool_name == "run_sql":
+                self.query_results.append({"query": arguments.get("query", ""), **tool_result["result"]})
+            else:
+                # Refined rows stand in for a query result; "query" is the SQL they were cut from
+                self.query_results.append(tool_result["result"])
+            
+            # The LLM only needs a bounded sample and column statistics
+            compacted = compact_result(tool_result["result"])
+            if tool_result["result"].get("source_truncated"):
+                compacted["source_truncated"] = True
+            tool_result = {"success": True, "result": compacted}
+        
+        return {
+            "role": "tool",
+            "tool_call_id": tool_call["id"],
+            "content": json.dumps(tool_result, default=str)
+        }
+    
+    async def _run_sql_template(self, prompt: str, filters: Dict[str, Any], messages: List[Dict[str, Any]]) -> bool:
+        """Run the re-bound SQL of a learned template and seed its result into ``messages``.
+        
+        Returns True when the template query succeeded with rows, so the next
+        LLM round can go straight to synthesis.
+        """
+        query = sql_template_cache.match(prompt, filters)
+        if query is None:
+            return False
+        
+        tool_call = {
+            "id": "sql_template",
+            "type": "function",
+            "function": {"name": "run_sql", "arguments": json.dumps({"query": query})}
+        }
+        tool_name, arguments, tool_result = await self._run_tool_call(tool_call, asyncio.Semaphore(1))
+        if not tool_result.get("success"):
+            # The learned SQL no longer runs (e.g. the schema changed); let the planner work it out
+            logger.info("SQL template query failed; falling back to planning")
+            sql_template_cache.forget(prompt, filters)
+            return False
+        if not tool_result["result"].get("row_count"):
+            # A valid place or year can simply have no data; keep the template
+            logger.info("SQL template query returned no rows; falling back to planning")
+            return False
+        
+        messages.append({"role": "assistant", "content": "", "tool_calls": [tool_call]})
+        messages.append(self._tool_message(tool_call, tool_name, arguments, tool_result))
+        self.used_sql_template = True
+        return True
+    
+    def _last_query_summary(self) -> Tuple[str, int]:
+        """SQL and row count of the last successful query, for the request log."""
+        if not self.query_results:
+            return "", 0
+        return self.query_results[-1]["query"], self.query_results[-1]["row_count"]
+    
+    def _full_result(self) -> Dict[str, Any]:
+        """Return every row of the last successful query."""
+        last_result = self.query_results[-1]
+        return {
+            "columns": last_result["columns"],
+            "rows": last_result["rows"],
+            "row_count": last_result["row_count"]
+        }
+    
+    def _create_partial_response(self, prompt: str, filters: Dict[str, Any], reason: str) -> Dict[str, Any]:
+        """Build the best available answer when the request runs out of budget."""
+        if not self.query_results:
+            response = self._create_query_specific_response(prompt, filters, reason)
+            response["disclaimers"] = response.get("disclaimers", []) + [
+                f"Analysis stopped early ({reason}); no query finished in time"
+            ]
+            response["partial"] = True
+            return response
+        
+        last_result = self.query_results[-1]
+        response = {
+            "insight_text": (
+                f"## Partial Result\nThe analysis of '{prompt}' stopped before the narrative was written. "
+                f"The last successful query returned {last_result['row_count']} rows, shown below."
+            ),
+            "viz": {"type": "vega-lite", "spec": {}},
+            "doc_citations": [],
+            "filters_applied": filters,
+            "disclaimers": [f"Partial answer: {reason}"],
+            "partial": True
+        }
+        assemble_result_data(response, last_result, settings.max_preview_rows)
+        response["full_result"] = self._full_result()
+        return response
+    
+    def _run_metrics(self) -> Dict[str, Any]:
+        """Record this run in agent_stats and return its metrics for the request log."""
+        agent_stats.record(
+            self.llm_rounds, self.tool_call_counts, self.sql_failures, self.few_shot_examples > 0
+        )
+        return {
+            "llm_rounds": self.llm_rounds,
+            "tool_calls": dict(self.tool_call_counts),
+            "sql_failures": self.sql_failures,
+            "few_shot_examples": self.few_shot_examples,
+            "sql_template": self.used_sql_template,
+            "schema_tokens": dict(self.schema_tokens),
+            "stages": {stage: dict(metrics) for stage, metrics in self.stage_metrics.items()},
+        }
+    
+    async def generate_insight(
+        self,
+        prompt: str,
+        filters: Dict[str, Any],
+        on_event: Optional[EventCallback] = None,
+        deadline: Optional[Deadline] = None,
+        session: Optional[ConversationSession] = None
+    ) -> Dict[str, Any]:
         """Alias for process_query for compatibility with app.py endpoint."""
-        return await self.process_query(prompt, filters)
+        return await self.process_query(prompt, filters, on_event=on_event, deadline=deadline, session=session)
     
     def _get_default_value(self, field: str) -> Any:
         """Get default value for a required field."""
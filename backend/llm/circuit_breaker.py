@@ -0,0 +1,87 @@
+"""Circuit breaker guarding calls to the LLM provider."""
+
+import time
+from typing import Any, Dict, Optional
+
+from core.logging import get_logger
+
+logger = get_logger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker with a single half-open trial call.
+
+    After ``failure_threshold`` failed calls in a row the breaker opens and
+    rejects calls for ``reset_seconds``. The first call after that is let
+    through as a trial: success closes the breaker, failure re-opens it.
+    """
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.times_opened = 0
+        self.rejected_calls = 0
+        self._trial_in_flight = False
+
+    def allow(self) -> bool:
+        """Return whether a call may be attempted now."""
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_seconds:
+            self.state = HALF_OPEN
+            logger.info("Circuit breaker half-open; allowing a trial call")
+        if self.state == HALF_OPEN and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        self.rejected_calls += 1
+        return False
+
+    def record_success(self) -> None:
+        """Record a successful call, closing the breaker."""
+        if self.state != CLOSED:
+            logger.info("Circuit breaker closed")
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        """Record a failed call, opening the breaker once the threshold is reached."""
+        self.consecutive_failures += 1
+        self._trial_in_flight = False
+        if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != OPEN:
+                self.times_opened += 1
+                logger.warning(
+                    f"Circuit breaker opened after {self.consecutive_failures} consecutive failures"
+                )
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+
+    def release(self) -> None:
+        """Free the half-open trial slot without counting an outcome."""
+        self._trial_in_flight = False
+
+    def retry_in(self) -> float:
+        """Seconds until an open breaker will allow a trial call."""
+        if self.state != OPEN or self.opened_at is None:
+            return 0.0
+        return max(self.reset_seconds - (time.monotonic() - self.opened_at), 0.0)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return the breaker state as a JSON-serialisable dict."""
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "failure_threshold": self.failure_threshold,
+            "times_opened": self.times_opened,
+            "rejected_calls": self.rejected_calls,
+            "retry_in_seconds": round(self.retry_in(), 1),
+        }
@@ -0,0 +1,109 @@
+"""Latency tracking for hedged LLM requests."""
+
+import math
+from collections import deque
+from typing import Any, Dict, Iterable, Optional
+
+from core.config import settings
+
+
+def percentile(values: Iterable[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile of ``values``, or None when there are none."""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    rank = max(math.ceil(pct / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+class LatencyWindow:
+    """Rolling window of the most recent latencies, in seconds."""
+
+    def __init__(self, size: int = 200):
+        self.samples = deque(maxlen=size)
+
+    def add(self, seconds: float) -> None:
+        self.samples.append(seconds)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        return percentile(self.samples, pct)
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+
+class HedgeStats:
+    """Per-model latencies and win counts for hedged completions.
+
+    ``model_latency`` holds per-model request latencies, whether or not they
+    won (an abandoned primary is recorded at the time it was cancelled, a
+    lower bound); ``observed`` holds what callers actually waited, per
+    primary model, so that model's p99 minus the observed p99 is what
+    hedging buys. The primary is the payload's model, which differs between
+    the planner and synthesis stages.
+    """
+
+    def __init__(self):
+        self.model_latency: Dict[str, LatencyWindow] = {}
+        self.observed: Dict[str, LatencyWindow] = {}
+        self.calls = 0
+        self.hedged = 0
+        self.wins: Dict[str, int] = {}
+
+    def hedge_delay(self, model: str) -> float:
+        """How long to wait for ``model`` before sending the hedge request."""
+        window = self.model_latency.get(model)
+        if window is None or len(window) < settings.openrouter_hedge_min_samples:
+            return settings.openrouter_hedge_initial_delay_seconds
+        return window.percentile(settings.openrouter_hedge_percentile)
+
+    def record_latency(self, model: str, seconds: float) -> None:
+        """Record a completed (not cancelled) request to ``model``."""
+        self.model_latency.setdefault(model, LatencyWindow()).add(seconds)
+
+    def record_call(self, primary: str, winner: str, hedged: bool, seconds: float) -> None:
+        """Record the outcome of one caller-visible completion sent to ``primary``."""
+        self.calls += 1
+        if hedged:
+            self.hedged += 1
+        self.wins[winner] = self.wins.get(winner, 0) + 1
+        self.observed.setdefault(primary, LatencyWindow()).add(seconds)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return hedge counters, win rates and latency percentiles."""
+        models = {}
+        for model, window in self.model_latency.items():
+            models[model] = {
+                "samples": len(window),
+                "p50_seconds": _rounded(window.percentile(50)),
+                "p99_seconds": _rounded(window.percentile(99)),
+                "wins": self.wins.get(model, 0),
+                "win_rate": round(self.wins.get(model, 0) / self.calls, 3) if self.calls else 0.0,
+            }
+
+        primaries = {}
+        for primary, observed in self.observed.items():
+            primary_window = self.model_latency.get(primary)
+            primary_p99 = primary_window.percentile(99) if primary_window else None
+            observed_p99 = observed.percentile(99)
+            improvement = None
+            if primary_p99 is not None and observed_p99 is not None:
+                improvement = primary_p99 - observed_p99
+            primaries[primary] = {
+                "calls": len(observed),
+                "current_delay_seconds": _rounded(self.hedge_delay(primary)),
+                "observed_p99_seconds": _rounded(observed_p99),
+                "p99_improvement_seconds": _rounded(improvement),
+            }
+
+        return {
+            "calls": self.calls,
+            "hedged": self.hedged,
+            "hedge_rate": round(self.hedged / self.calls, 3) if self.calls else 0.0,
+            "primaries": primaries,
+            "models": models,
+        }
+
+
+def _rounded(value: Optional[float]) -> Optional[float]:
+    return round(value, 3) if value is not None else None
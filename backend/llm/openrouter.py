@@ -1,19 +1,137 @@
 """OpenRouter client for LLM interactions."""
 
+import asyncio
 import httpx
 import json
-from typing import Dict, Any, List, Optional
+import random
+import time
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from typing import Dict, Any, AsyncIterator, List, Optional, Callable, Awaitable
 from core.config import settings
 from core.logging import get_logger
+from core.timing import annotate, span
+from llm.admission import AdmissionRejected, LLMAdmission
+from llm.circuit_breaker import CircuitBreaker
+from llm.hedging import HedgeStats
 
 logger = get_logger(__name__)
 
+# Status codes worth retrying: rate limiting and transient upstream failures
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
 
 class OpenRouterError(Exception):
     """Exception raised when OpenRouter API calls fail."""
+    
+    def __init__(
+        self,
+        message: str,
+        status_code: Optional[int] = None,
+        retry_after: Optional[float] = None,
+        retryable: bool = False
+    ):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.retryable = retryable or status_code in RETRYABLE_STATUS_CODES
+
+
+class CircuitOpenError(OpenRouterError):
+    """Exception raised when the circuit breaker is open and the call is skipped."""
     pass
 
 
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a ``Retry-After`` header given as seconds or an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def error_from_response(status_code: int, headers: httpx.Headers, body: str) -> OpenRouterError:
+    """Build an OpenRouterError for a non-200 response."""
+    return OpenRouterError(
+        f"HTTP {status_code}: {body}",
+        status_code=status_code,
+        retry_after=parse_retry_after(headers.get("retry-after"))
+    )
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """Full-jitter exponential backoff, never shorter than the server's ``Retry-After``."""
+    ceiling = min(
+        settings.openrouter_backoff_max_seconds,
+        settings.openrouter_backoff_base_seconds * (2 ** attempt)
+    )
+    delay = random.uniform(0, ceiling)
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+class ConnectionStats:
+    """Connection reuse counters collected from httpcore trace events."""
+    
+    def __init__(self):
+        self.requests = 0
+        self.new_connections = 0
+        self.tls_handshakes = 0
+        self.http_versions: Dict[str, int] = {}
+    
+    async def trace(self, event_name: str, info: Dict[str, Any]) -> None:
+        """httpcore ``trace`` extension hook; fires once per connection phase."""
+        if event_name == "connection.connect_tcp.complete":
+            self.new_connections += 1
+        elif event_name == "connection.start_tls.complete":
+            self.tls_handshakes += 1
+    
+    def record_response(self, response: httpx.Response) -> None:
+        """Count a completed request and the protocol it was served over."""
+        self.requests += 1
+        version = response.http_version
+        self.http_versions[version] = self.http_versions.get(version, 0) + 1
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """Return the current counters as a JSON-serialisable dict."""
+        reused = max(self.requests - self.new_connections, 0)
+        return {
+            "requests": self.requests,
+            "new_connections": self.new_connections,
+            "tls_handshakes": self.tls_handshakes,
+            "reused_connections": reused,
+            "reuse_ratio": round(reused / self.requests, 3) if self.requests else 0.0,
+            "http_versions": dict(self.http_versions),
+        }
+
+
+def create_http_client() -> httpx.AsyncClient:
+    """Build the pooled keep-alive HTTP client used for OpenRouter calls."""
+    limits = httpx.Limits(
+        max_connections=settings.openrouter_max_connections,
+        max_keepalive_connections=settings.openrouter_max_keepalive_connections,
+        keepalive_expiry=settings.openrouter_keepalive_expiry_seconds,
+    )
+    return httpx.AsyncClient(
+        http2=settings.openrouter_http2,
+        limits=limits,
+        timeout=settings.openrouter_timeout_seconds,
+        headers={
+            "Authorization": f"Bearer {settings.openrouter_api_key}",
+            "Content-Type": "application/json",
+            "HTTP-Referer": "https://municipal-ai-insights.com",
+            "X-Title": "Municipal AI Insights"
+        }
+    )
+
+
 class OpenRouterClient:
     """Client for interacting with OpenRouter API."""
     
@@ -22,15 +140,22 @@ class OpenRouterClient:
         self.model_slug = settings.model_slug
         self.base_url = "https://openrouter.ai/api/v1"
         
-        self.client = httpx.AsyncClient(
-            timeout=30.0,
-            headers={
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json",
-                "HTTP-Referer": "https://municipal-ai-insights.com",
-                "X-Title": "Municipal AI Insights"
-            }
+        self.client = create_http_client()
+        self.stats = ConnectionStats()
+        self.breaker = CircuitBreaker(
+            failure_threshold=settings.openrouter_breaker_failure_threshold,
+            reset_seconds=settings.openrouter_breaker_reset_seconds
         )
+        # Bounds how many calls this worker starts per second and runs at once
+        self.admission = LLMAdmission()
+        self.retry_stats = {
+            "attempts": 0,
+            "retries": 0,
+            "retry_after_honoured": 0,
+            "exhausted": 0,
+            "short_circuited": 0,
+        }
+        self.hedge_stats = HedgeStats()
     
     async def chat_completion(
         self,
@@ -38,20 +163,53 @@ class OpenRouterClient:
         tools: Optional[List[Dict[str, Any]]] = None,
         tool_choice: Optional[str] = None,
         temperature: float = 0.1,
-        max_tokens: int = 2000
+        max_tokens: int = 2000,
+        on_delta: Optional[Callable[[str], Awaitable[None]]] = None,
+        timeout: Optional[float] = None,
+        model: Optional[str] = None
     ) -> Dict[str, Any]:
-        """Send a chat completion request to OpenRouter."""
+        """Send a chat completion request to OpenRouter.
+        
+        ``model`` overrides the client's default ``model_slug`` for this call.
+        
+        When ``on_delta`` is given the request is streamed and the callback
+        receives each content fragment as it arrives; the assembled response
+        has the same shape as a non-streamed one. ``timeout`` is the total
+        budget for the call including retries, e.g. a request's remaining
+        deadline; without it each attempt uses the client's default timeout.
+        
+        Rate-limited (429) and transient 5xx/network failures are retried
+        with jittered exponential backoff. Repeated failures open a circuit
+        breaker, after which calls fail fast with CircuitOpenError.
+        
+        With ``OPENROUTER_HEDGE_MODEL`` set, non-streamed calls that outlast
+        the primary model's usual latency are raced against the hedge model.
+        
+        Each HTTP attempt first passes admission control in the current
+        priority lane and holds its slot only while the request is in flight,
+        not across backoff sleeps; AdmissionRejected is raised when no slot
+        frees up in time.
+        """
+        if not self.breaker.allow():
+            self.retry_stats["short_circuited"] += 1
+            raise CircuitOpenError(
+                f"OpenRouter circuit breaker is open; retrying in {self.breaker.retry_in():.0f}s"
+            )
+        
+        model = model or self.model_slug
         
         # Log the request for debugging
-        logger.info(f"OpenRouter request - Model: {self.model_slug}")
+        logger.info(f"OpenRouter request - Model: {model}")
         logger.info(f"OpenRouter request - Messages count: {len(messages)}")
         logger.info(f"OpenRouter request - Tools: {'Yes' if tools else 'No'}")
         
         payload = {
-            "model": self.model_slug,
+            "model": model,
             "messages": messages,
             "temperature": temperature,
             "max_tokens": max_tokens,
+            # Ask OpenRouter to report token usage, also on streamed responses
+            "usage": {"include": True},
         }
         
         if tools:
@@ -59,34 +217,188 @@ class OpenRouterClient:
             if tool_choice:
                 payload["tool_choice"] = tool_choice
         
+        with span("llm", model=model) as attrs:
+            result = await self._send(payload, on_delta, timeout)
+            usage = result.get("usage") or {}
+            attrs["prompt_tokens"] = usage.get("prompt_tokens")
+            attrs["completion_tokens"] = usage.get("completion_tokens")
+            return result
+    
+    async def _send(
+        self,
+        payload: Dict[str, Any],
+        on_delta: Optional[Callable[[str], Awaitable[None]]],
+        timeout: Optional[float]
+    ) -> Dict[str, Any]:
+        """Send a request, hedged or with retries."""
+        if on_delta is None and settings.openrouter_hedge_model and settings.openrouter_hedge_model != payload["model"]:
+            return await self._hedged_completion(payload, timeout)
+        
+        started = time.monotonic()
+        result = await self._with_retries(payload, on_delta, timeout)
+        elapsed = time.monotonic() - started
+        self.hedge_stats.record_latency(payload["model"], elapsed)
+        self.hedge_stats.record_call(payload["model"], payload["model"], False, elapsed)
+        return result
+    
+    async def _hedged_completion(self, payload: Dict[str, Any], timeout: Optional[float]) -> Dict[str, Any]:
+        """Send the request to the primary model and, if it is slow, to the hedge model too.
+        
+        The hedge request is only sent once the primary has been outstanding
+        for longer than its recent latency percentile. Whichever answers first
+        wins and the other request is cancelled. Each request takes its own
+        admission slot, so a hedge counts against the lane's in-flight cap.
+        """
+        primary = payload["model"]
+        secondary = settings.openrouter_hedge_model
+        delay = self.hedge_stats.hedge_delay(primary)
+        started = time.monotonic()
+        
+        # task -> (model, start time)
+        tasks: Dict[asyncio.Task, Any] = {
+            asyncio.create_task(self._with_retries(payload, None, timeout)): (primary, started)
+        }
         try:
-            logger.info("Sending request to OpenRouter...")
-            response = await self.client.post(
-                f"{self.base_url}/chat/completions",
-                json=payload
-            )
-            
-            logger.info(f"OpenRouter response status: {response.status_code}")
-            
-            # Log response content for debugging
-            if response.status_code != 200:
-                error_content = response.text
-                logger.error(f"OpenRouter error response: {error_content}")
-                raise OpenRouterError(f"HTTP {response.status_code}: {error_content}")
+            first_wait = delay if timeout is None else min(delay, timeout)
+            done, _ = await asyncio.wait(set(tasks), timeout=first_wait)
+            hedged = not done
+            if hedged:
+                logger.info(f"{primary} slower than {delay:.2f}s; hedging with {secondary}")
+                remaining = None if timeout is None else max(timeout - (time.monotonic() - started), 0.001)
+                hedge_task = asyncio.create_task(self._with_retries({**payload, "model": secondary}, None, remaining))
+                tasks[hedge_task] = (secondary, time.monotonic())
             
-            result = response.json()
+            pending = set(tasks)
+            errors: List[BaseException] = []
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = None
+                for task in done:
+                    if task.exception() is not None:
+                        errors.append(task.exception())
+                    elif winner is None:
+                        winner = task
+                if winner is not None:
+                    model, model_started = tasks[winner]
+                    now = time.monotonic()
+                    self.hedge_stats.record_latency(model, now - model_started)
+                    self.hedge_stats.record_call(primary, model, hedged, now - started)
+                    return winner.result()
+            raise errors[0]
+        finally:
+            losers = [task for task in tasks if not task.done()]
+            for task in losers:
+                task.cancel()
+                model, model_started = tasks[task]
+                # The abandoned primary took at least this long; keep its tail visible
+                if model == primary:
+                    self.hedge_stats.record_latency(model, time.monotonic() - model_started)
+            # Collect the cancelled requests so their outcome is never left unretrieved
+            await asyncio.gather(*losers, return_exceptions=True)
+    
+    async def _with_retries(
+        self,
+        payload: Dict[str, Any],
+        on_delta: Optional[Callable[[str], Awaitable[None]]],
+        timeout: Optional[float]
+    ) -> Dict[str, Any]:
+        """Run attempts for one completion until success, a permanent error or the budget runs out."""
+        # A stream that already delivered text to the caller cannot be replayed
+        streamed = False
+        emit = None
+        if on_delta is not None:
+            async def emit(fragment: str) -> None:
+                nonlocal streamed
+                streamed = True
+                await on_delta(fragment)
+        
+        started = time.monotonic()
+        attempt = 0
+        queued = 0.0
+        try:
+            while True:
+                queued_at = time.monotonic()
+                remaining = None if timeout is None else max(timeout - (queued_at - started), 0.001)
+                try:
+                    async with self._admission_slot(remaining):
+                        if settings.llm_admission_enabled:
+                            queued += time.monotonic() - queued_at
+                            annotate(queue_ms=round(queued * 1000, 1))
+                        attempt_timeout = settings.openrouter_timeout_seconds
+                        if timeout is not None:
+                            attempt_timeout = max(timeout - (time.monotonic() - started), 0.001)
+                        result = await self._attempt(payload, emit, attempt_timeout)
+                    self.breaker.record_success()
+                    return result
+                except OpenRouterError as e:
+                    if not e.retryable:
+                        self.breaker.release()
+                        raise
+                    
+                    delay = backoff_delay(attempt, e.retry_after)
+                    elapsed = time.monotonic() - started
+                    out_of_budget = timeout is not None and elapsed + delay >= timeout
+                    too_long = delay > settings.openrouter_backoff_max_seconds
+                    if attempt >= settings.openrouter_max_retries or streamed or out_of_budget or too_long:
+                        self.retry_stats["exhausted"] += 1
+                        self.breaker.record_failure()
+                        raise
+                    
+                    attempt += 1
+                    self.retry_stats["retries"] += 1
+                    if e.retry_after is not None:
+                        self.retry_stats["retry_after_honoured"] += 1
+                    logger.warning(f"Retrying OpenRouter call in {delay:.2f}s (attempt {attempt + 1}): {e}")
+                    await asyncio.sleep(delay)
+        except (AdmissionRejected, asyncio.CancelledError):
+            # A half-open trial that never got a slot, or was abandoned, must not hold the breaker
+            self.breaker.release()
+            raise
+    
+    @asynccontextmanager
+    async def _admission_slot(self, timeout: Optional[float]) -> AsyncIterator[None]:
+        """Hold an admission slot for one attempt (a no-op when admission is disabled)."""
+        if not settings.llm_admission_enabled:
+            yield
+            return
+        async with self.admission.slot(timeout):
+            yield
+    
+    async def _attempt(
+        self,
+        payload: Dict[str, Any],
+        on_delta: Optional[Callable[[str], Awaitable[None]]],
+        timeout: float
+    ) -> Dict[str, Any]:
+        """Make a single completion request, converting failures into OpenRouterError."""
+        self.retry_stats["attempts"] += 1
+        try:
+            logger.info("Sending request to OpenRouter...")
+            if on_delta is not None:
+                result = await self._stream_completion(payload, on_delta, timeout)
+            else:
+                result = await self._post_completion(payload, timeout)
             logger.info("OpenRouter response received successfully")
             
             if "error" in result:
                 logger.error(f"OpenRouter API error: {result['error']}")
-                raise OpenRouterError(f"OpenRouter API error: {result['error']}")
+                code = result["error"].get("code") if isinstance(result["error"], dict) else None
+                raise OpenRouterError(
+                    f"OpenRouter API error: {result['error']}",
+                    status_code=code if isinstance(code, int) else None
+                )
             
             return result
             
+        except OpenRouterError:
+            raise
         except httpx.HTTPStatusError as e:
             error_text = e.response.text if hasattr(e, 'response') else str(e)
             logger.error(f"HTTP error calling OpenRouter: Status {e.response.status_code}, Body: {error_text}")
-            raise OpenRouterError(f"HTTP error {e.response.status_code}: {error_text}")
+            raise error_from_response(e.response.status_code, e.response.headers, error_text)
+        except httpx.TransportError as e:
+            logger.error(f"Transport error calling OpenRouter: {e!r}")
+            raise OpenRouterError(f"Request error: {e!r}", retryable=True)
         except httpx.RequestError as e:
             logger.error(f"Request error calling OpenRouter: {e}")
             raise OpenRouterError(f"Request error: {e}")
@@ -94,6 +406,121 @@ class OpenRouterClient:
             logger.error(f"Unexpected error calling OpenRouter: {e}")
             raise OpenRouterError(f"Unexpected error: {e}")
     
+    async def _post_completion(self, payload: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+        """Send a non-streamed completion request and return the parsed body."""
+        # Opened as a stream so time to first byte can be told apart from body transfer
+        sent_at = time.monotonic()
+        async with self.client.stream(
+            "POST",
+            f"{self.base_url}/chat/completions",
+            json=payload,
+            timeout=timeout,
+            extensions={"trace": self.stats.trace}
+        ) as response:
+            annotate(ttfb_ms=round((time.monotonic() - sent_at) * 1000, 1))
+            await response.aread()
+        self.stats.record_response(response)
+        
+        logger.info(f"OpenRouter response status: {response.status_code}")
+        
+        # Log response content for debugging
+        if response.status_code != 200:
+            error_content = response.text
+            logger.error(f"OpenRouter error response: {error_content}")
+            raise error_from_response(response.status_code, response.headers, error_content)
+        
+        return response.json()
+    
+    async def _stream_completion(
+        self,
+        payload: Dict[str, Any],
+        on_delta: Callable[[str], Awaitable[None]],
+        timeout: float
+    ) -> Dict[str, Any]:
+        """Stream a completion over SSE and assemble it into a regular response."""
+        content_parts: List[str] = []
+        tool_calls: Dict[int, Dict[str, Any]] = {}
+        finish_reason = None
+        usage = None
+        
+        sent_at = time.monotonic()
+        async with self.client.stream(
+            "POST",
+            f"{self.base_url}/chat/completions",
+            json={**payload, "stream": True},
+            timeout=timeout,
+            extensions={"trace": self.stats.trace}
+        ) as response:
+            annotate(ttfb_ms=round((time.monotonic() - sent_at) * 1000, 1))
+            self.stats.record_response(response)
+            logger.info(f"OpenRouter stream status: {response.status_code}")
+            
+            if response.status_code != 200:
+                error_content = (await response.aread()).decode(errors="replace")
+                logger.error(f"OpenRouter error response: {error_content}")
+                raise error_from_response(response.status_code, response.headers, error_content)
+            
+            async for line in response.aiter_lines():
+                # Blank lines separate events; ':' lines are keep-alive comments
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                
+                chunk = json.loads(data)
+                if "error" in chunk:
+                    raise OpenRouterError(f"OpenRouter API error: {chunk['error']}")
+                if chunk.get("usage"):
+                    usage = chunk["usage"]
+                
+                for choice in chunk.get("choices", []):
+                    delta = choice.get("delta") or {}
+                    if delta.get("content"):
+                        content_parts.append(delta["content"])
+                        await on_delta(delta["content"])
+                    for call_delta in delta.get("tool_calls") or []:
+                        call = tool_calls.setdefault(call_delta.get("index", 0), {
+                            "id": None,
+                            "type": "function",
+                            "function": {"name": "", "arguments": ""}
+                        })
+                        if call_delta.get("id"):
+                            call["id"] = call_delta["id"]
+                        function = call_delta.get("function") or {}
+                        call["function"]["name"] += function.get("name") or ""
+                        call["function"]["arguments"] += function.get("arguments") or ""
+                    if choice.get("finish_reason"):
+                        finish_reason = choice["finish_reason"]
+        
+        message: Dict[str, Any] = {"role": "assistant", "content": "".join(content_parts)}
+        if tool_calls:
+            message["tool_calls"] = [tool_calls[index] for index in sorted(tool_calls)]
+        
+        result: Dict[str, Any] = {
+            "choices": [{"message": message, "finish_reason": finish_reason}]
+        }
+        if usage is not None:
+            result["usage"] = usage
+        return result
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Return connection pool and reuse statistics."""
+        return {
+            "http2_enabled": settings.openrouter_http2,
+            "max_connections": settings.openrouter_max_connections,
+            "max_keepalive_connections": settings.openrouter_max_keepalive_connections,
+            **self.stats.snapshot(),
+            "retries": dict(self.retry_stats),
+            "circuit_breaker": self.breaker.snapshot(),
+            "admission": {"enabled": settings.llm_admission_enabled, **self.admission.get_stats()},
+            "hedging": {
+                "enabled": bool(settings.openrouter_hedge_model),
+                "hedge_model": settings.openrouter_hedge_model,
+                **self.hedge_stats.snapshot(),
+            },
+        }
+    
     async def close(self):
         """Close the HTTP client."""
         await self.client.aclose()
@@ -103,3 +530,27 @@ class OpenRouterClient:
     
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         await self.close()
+
+
+# Process-wide client shared by every request on this worker
+_shared_client: Optional[OpenRouterClient] = None
+
+
+def get_shared_client() -> OpenRouterClient:
+    """Return the worker's pooled OpenRouter client, creating it on first use."""
+    global _shared_client
+    if _shared_client is None:
+        _shared_client = OpenRouterClient()
+        logger.info(
+            f"Created shared OpenRouter client (http2={settings.openrouter_http2}, "
+            f"max_connections={settings.openrouter_max_connections})"
+        )
+    return _shared_client
+
+
+async def close_shared_client() -> None:
+    """Close the worker's pooled OpenRouter client, if one was created."""
+    global _shared_client
+    if _shared_client is not None:
+        await _shared_client.close()
+        _shared_client = None
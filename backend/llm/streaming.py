@@ -0,0 +1,107 @@
+"""Helpers for streaming agent progress to clients as Server-Sent Events."""
+
+import json
+import re
+from typing import Any, Dict, Optional
+
+_INSIGHT_TEXT_START = re.compile(r'"insight_text"\s*:\s*"')
+_HEX_DIGITS = re.compile(r"^[0-9a-fA-F]{4}$")
+
+_SIMPLE_ESCAPES = {
+    '"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t",
+}
+
+
+def _hex_code(digits: str) -> Optional[int]:
+    """Return the code point of four hex digits, or None if they are not valid."""
+    if len(digits) != 4 or _HEX_DIGITS.match(digits) is None:
+        return None
+    return int(digits, 16)
+
+
+def format_sse(event: str, data: Any) -> str:
+    """Encode one Server-Sent Event frame."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+class InsightTextExtractor:
+    """Incrementally pull the ``insight_text`` string out of streamed JSON.
+
+    The final synthesis arrives as raw JSON fragments; feeding each fragment
+    in returns only the newly decoded characters of ``insight_text`` so they
+    can be forwarded to the client as tokens.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._position: Optional[int] = None
+        self.done = False
+
+    def feed(self, fragment: str) -> str:
+        """Consume a content fragment and return any new insight_text characters."""
+        if self.done:
+            return ""
+        self._buffer += fragment
+
+        if self._position is None:
+            match = _INSIGHT_TEXT_START.search(self._buffer)
+            if not match:
+                return ""
+            self._position = match.end()
+
+        decoded = []
+        buffer = self._buffer
+        i = self._position
+        while i < len(buffer):
+            char = buffer[i]
+            if char == '"':
+                self.done = True
+                i += 1
+                break
+            if char != "\\":
+                decoded.append(char)
+                i += 1
+                continue
+            # Escape sequence: wait for the rest of it if it is split across fragments
+            if i + 1 >= len(buffer):
+                break
+            escape = buffer[i + 1]
+            if escape == "u":
+                if i + 6 > len(buffer):
+                    break
+                code = _hex_code(buffer[i + 2:i + 6])
+                if code is None:
+                    # A malformed escape from the model is shown as text rather than ending the stream
+                    decoded.append(buffer[i:i + 2])
+                    i += 2
+                    continue
+                if 0xD800 <= code < 0xDC00:
+                    # A high surrogate waits for its low half, which may be in the next fragment
+                    pair = buffer[i + 6:i + 12]
+                    if len(pair) < 6 and "\\u".startswith(pair[:2]):
+                        break
+                    low = _hex_code(pair[2:]) if pair.startswith("\\u") else None
+                    if low is not None and 0xDC00 <= low < 0xE000:
+                        decoded.append(chr(0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00)))
+                        i += 12
+                        continue
+                    code = 0xFFFD
+                elif 0xDC00 <= code < 0xE000:
+                    code = 0xFFFD
+                decoded.append(chr(code))
+                i += 6
+            else:
+                decoded.append(_SIMPLE_ESCAPES.get(escape, escape))
+                i += 2
+
+        self._position = i
+        return "".join(decoded)
+
+
+def summarize_event_payload(payload: Dict[str, Any], max_rows: int) -> Dict[str, Any]:
+    """Trim a query result down to a preview suitable for a progress event."""
+    return {
+        "columns": payload.get("columns", []),
+        "rows": payload.get("rows", [])[:max_rows],
+        "row_count": payload.get("row_count", 0),
+    }
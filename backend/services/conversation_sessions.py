@@ -0,0 +1,168 @@
+"""Server-side conversation sessions for follow-up questions."""
+
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Optional
+
+from core.config import settings
+from core.logging import get_logger
+
+logger = get_logger(__name__)
+
+# Characters of each earlier answer kept in the session history
+ANSWER_SUMMARY_CHARS = 400
+
+
+class ConversationSession:
+    """Compacted history and the most recent result sets of one conversation."""
+
+    def __init__(self, session_id: str, store: Optional["ConversationStore"] = None):
+        self.session_id = session_id
+        self.store = store
+        self.turns: Deque[Dict[str, Any]] = deque(maxlen=settings.conversation_history_turns)
+        self.results: Deque[Dict[str, Any]] = deque(maxlen=settings.conversation_results_per_session)
+        self.last_used = time.monotonic()
+        self._next_result = 1
+
+    def get_result(self, result_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Return a cached result set by id, or the latest one."""
+        if not self.results:
+            return None
+        if result_id is None:
+            return self.results[-1]
+        return next((result for result in self.results if result["result_id"] == result_id), None)
+
+    def add_result(self, prompt: str, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Keep a result set (capped at ``conversation_max_result_rows``) for later refinement."""
+        rows = result.get("rows", [])[:settings.conversation_max_result_rows]
+        entry = {
+            "result_id": f"r{self._next_result}",
+            "prompt": prompt,
+            "query": result.get("query", ""),
+            "columns": list(result.get("columns", [])),
+            "rows": rows,
+            "row_count": len(rows),
+            "truncated": len(rows) < result.get("row_count", len(rows)),
+        }
+        self._next_result += 1
+        self.results.append(entry)
+        if self.store is not None:
+            self.store.enforce_row_budget(keep=entry)
+        return entry
+
+    def record_turn(self, prompt: str, filters: Dict[str, Any], response: Dict[str, Any]) -> None:
+        """Remember a finished turn and, when it carried data, its full result."""
+        self.turns.append({
+            "prompt": prompt,
+            "filters": filters,
+            "answer": (response.get("insight_text") or "")[:ANSWER_SUMMARY_CHARS],
+            "sql": response.get("sql_used", ""),
+        })
+        full_result = response.get("full_result")
+        if full_result and full_result.get("rows"):
+            self.add_result(prompt, {**full_result, "query": response.get("sql_used", "")})
+
+    def describe(self) -> str:
+        """Render the history and cached results for the agent's user message."""
+        lines = ["CONVERSATION SO FAR (oldest first):"]
+        for turn in self.turns:
+            lines.append(f"- Q: {turn['prompt']}\n  Filters: {turn['filters']}\n  SQL: {turn['sql'] or '-'}\n  A: {turn['answer']}")
+        if self.results:
+            lines.append("CACHED RESULTS (refine them with refine_result when the new question is a subset or re-slice):")
+            for result in self.results:
+                lines.append(
+                    f"- {result['result_id']}: {result['row_count']} rows{' (truncated)' if result['truncated'] else ''}, "
+                    f"columns {result['columns']}, from: {result['query']}"
+                )
+        return "\n".join(lines)
+
+
+class ConversationStore:
+    """Bounded LRU of sessions with idle expiry and a total budget of cached result rows."""
+
+    def __init__(
+        self,
+        max_sessions: Optional[int] = None,
+        idle_ttl_seconds: Optional[float] = None,
+        max_cached_rows: Optional[int] = None
+    ):
+        self.max_sessions = max_sessions or settings.conversation_max_sessions
+        self.idle_ttl_seconds = idle_ttl_seconds or settings.conversation_idle_ttl_seconds
+        self.max_cached_rows = max_cached_rows or settings.conversation_max_cached_rows
+        self._sessions: "OrderedDict[str, ConversationSession]" = OrderedDict()
+        self.created = 0
+        self.resumed = 0
+        self.expired = 0
+        self.evicted = 0
+        self.results_dropped = 0
+        self.refinements = 0
+
+    def _expire(self) -> None:
+        cutoff = time.monotonic() - self.idle_ttl_seconds
+        # Least recently used first, so stop at the first live session
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if session.last_used > cutoff:
+                break
+            del self._sessions[session_id]
+            self.expired += 1
+
+    def get_or_create(self, session_id: Optional[str] = None) -> ConversationSession:
+        """Resume a live session, or start a new one (with a fresh id if the old one expired)."""
+        self._expire()
+        session = self._sessions.get(session_id) if session_id else None
+        if session is not None:
+            self.resumed += 1
+            self._sessions.move_to_end(session_id)
+        else:
+            if session_id:
+                logger.info(f"Conversation session {session_id} expired or unknown; starting a new one")
+            session = ConversationSession(uuid.uuid4().hex, store=self)
+            self._sessions[session.session_id] = session
+            self.created += 1
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evicted += 1
+        session.last_used = time.monotonic()
+        return session
+
+    def cached_rows(self) -> int:
+        return sum(result["row_count"] for session in self._sessions.values() for result in session.results)
+
+    def enforce_row_budget(self, keep: Optional[Dict[str, Any]] = None) -> None:
+        """Drop the oldest results of the least recently used sessions until the row budget holds.
+
+        ``keep`` (the result just added) is never dropped, so the current
+        conversation can always refine its latest answer.
+        """
+        total = self.cached_rows()
+        for session in list(self._sessions.values()):
+            while total > self.max_cached_rows and session.results and session.results[0] is not keep:
+                total -= session.results.popleft()["row_count"]
+                self.results_dropped += 1
+            if total <= self.max_cached_rows:
+                return
+
+    def clear(self) -> None:
+        self._sessions.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return session counts and the rows held in cached results."""
+        self._expire()
+        return {
+            "sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "cached_rows": self.cached_rows(),
+            "max_cached_rows": self.max_cached_rows,
+            "results_dropped": self.results_dropped,
+            "created": self.created,
+            "resumed": self.resumed,
+            "expired": self.expired,
+            "evicted": self.evicted,
+            "refinements": self.refinements,
+        }
+
+
+# Global instance shared by requests on this worker
+conversation_store = ConversationStore()
@@ -0,0 +1,259 @@
+"""Local document search for the search_docs tool.
+
+The index is built offline (``python -m etl.cli build-doc-index``) into a
+directory of numpy arrays plus JSON metadata; at runtime the postings are
+memory-mapped, so loading is cheap and queries touch only the terms asked for.
+"""
+
+import json
+import math
+import os
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from core.config import settings
+from core.logging import get_logger
+from services.text_index import ngram_terms
+
+logger = get_logger(__name__)
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+# Words per indexed chunk; long documents are split so citations stay specific
+CHUNK_WORDS = 200
+SNIPPET_CHARS = 280
+DOC_EXTENSIONS = (".md", ".markdown", ".txt", ".pdf")
+FRONT_MATTER_PATTERN = re.compile(r"\A---\s*\n(.*?)\n---\s*\n", re.DOTALL)
+HEADING_PATTERN = re.compile(r"^#{1,6}\s+(.*)$", re.MULTILINE)
+
+
+class DocIndexError(Exception):
+    """Raised when a document index cannot be built or loaded."""
+    pass
+
+
+def _front_matter(text: str) -> Tuple[Dict[str, str], str]:
+    """Split ``key: value`` front matter (ward, date, title) from a markdown body."""
+    match = FRONT_MATTER_PATTERN.match(text)
+    if not match:
+        return {}, text
+    meta = {}
+    for line in match.group(1).splitlines():
+        key, _, value = line.partition(":")
+        if value.strip():
+            meta[key.strip().lower()] = value.strip().strip("\"'")
+    return meta, text[match.end():]
+
+
+def _read_text(path: str) -> str:
+    if path.lower().endswith(".pdf"):
+        try:
+            from pypdf import PdfReader
+        except ImportError:
+            raise DocIndexError(f"pypdf is required to index {path}")
+        return "\n".join(page.extract_text() or "" for page in PdfReader(path).pages)
+    with open(path, encoding="utf-8") as handle:
+        return handle.read()
+
+
+def _chunks(title: str, body: str) -> Iterable[Dict[str, str]]:
+    """Split a body into heading sections of at most ``CHUNK_WORDS`` words."""
+    headings = list(HEADING_PATTERN.finditer(body))
+    sections = []
+    if not headings or headings[0].start() > 0:
+        sections.append((title, body[:headings[0].start()] if headings else body))
+    for index, heading in enumerate(headings):
+        end = headings[index + 1].start() if index + 1 < len(headings) else len(body)
+        sections.append((f"{title} - {heading.group(1).strip()}", body[heading.end():end]))
+
+    for section_title, text in sections:
+        words = text.split()
+        for start in range(0, len(words), CHUNK_WORDS):
+            yield {"title": section_title, "text": " ".join(words[start:start + CHUNK_WORDS])}
+
+
+def load_documents(paths: List[str]) -> List[Dict[str, Any]]:
+    """Read markdown, text and PDF files (recursively for directories) into chunk documents."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend(os.path.join(root, name) for name in sorted(names) if name.lower().endswith(DOC_EXTENSIONS))
+        else:
+            files.append(path)
+
+    documents = []
+    for path in files:
+        try:
+            text = _read_text(path)
+        except (OSError, UnicodeDecodeError, DocIndexError) as e:
+            logger.warning(f"Skipping {path}: {e}")
+            continue
+        meta, body = _front_matter(text)
+        title = meta.get("title") or os.path.splitext(os.path.basename(path))[0].replace("_", " ")
+        for chunk in _chunks(title, body):
+            if chunk["text"]:
+                documents.append({
+                    **chunk,
+                    "source": path,
+                    "ward": meta.get("ward"),
+                    "date": meta.get("date"),
+                })
+    return documents
+
+
+def catalog_documents(datasets: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Turn dataset registry rows into documents describing each dataset."""
+    documents = []
+    for dataset in datasets:
+        parts = [dataset.get("description") or ""]
+        for label, key in (("Category", "category"), ("Subcategory", "subcategory"),
+                           ("Geographic level", "geographic_level"), ("Time granularity", "time_granularity"),
+                           ("Source", "source_department")):
+            if dataset.get(key):
+                parts.append(f"{label}: {dataset[key]}.")
+        documents.append({
+            "title": dataset["title"],
+            "text": " ".join(part for part in parts if part),
+            "source": f"dataset:{dataset['slug']}",
+            "ward": None,
+            "date": (dataset.get("last_updated") or "")[:10] or None,
+        })
+    return documents
+
+
+def build_index(documents: List[Dict[str, Any]], output_dir: str) -> Dict[str, Any]:
+    """Write the inverted index for ``documents`` to ``output_dir``.
+
+    Files: ``postings.npy`` (int32 doc ids grouped by term), ``frequencies.npy``
+    (matching term counts), ``doc_lengths.npy``, ``vocab.json`` (term ->
+    [offset, length]) and ``docs.json`` (citation metadata).
+    """
+    term_postings: Dict[str, List[List[int]]] = {}
+    lengths = []
+    for doc_id, document in enumerate(documents):
+        terms = ngram_terms(f"{document['title']} {document['text']}")
+        lengths.append(len(terms))
+        counts: Dict[str, int] = {}
+        for term in terms:
+            counts[term] = counts.get(term, 0) + 1
+        for term, count in counts.items():
+            term_postings.setdefault(term, []).append([doc_id, count])
+
+    vocab = {}
+    postings, frequencies = [], []
+    for term in sorted(term_postings):
+        vocab[term] = [len(postings), len(term_postings[term])]
+        for doc_id, count in term_postings[term]:
+            postings.append(doc_id)
+            frequencies.append(count)
+
+    os.makedirs(output_dir, exist_ok=True)
+    np.save(os.path.join(output_dir, "postings.npy"), np.asarray(postings, dtype=np.int32))
+    np.save(os.path.join(output_dir, "frequencies.npy"), np.asarray(frequencies, dtype=np.int32))
+    np.save(os.path.join(output_dir, "doc_lengths.npy"), np.asarray(lengths, dtype=np.int32))
+    with open(os.path.join(output_dir, "vocab.json"), "w", encoding="utf-8") as handle:
+        json.dump(vocab, handle)
+    with open(os.path.join(output_dir, "docs.json"), "w", encoding="utf-8") as handle:
+        json.dump([
+            {**{key: document[key] for key in ("title", "source", "ward", "date")},
+             "snippet": document["text"][:SNIPPET_CHARS]}
+            for document in documents
+        ], handle)
+    return {"documents": len(documents), "terms": len(vocab), "postings": len(postings)}
+
+
+class DocSearchIndex:
+    """Memory-mapped BM25 index with ward and date filters."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or settings.doc_index_path
+        self.docs: List[Dict[str, Any]] = []
+        self.vocab: Dict[str, List[int]] = {}
+        self.postings: Optional[np.ndarray] = None
+        self.frequencies: Optional[np.ndarray] = None
+        self.length_norm: Optional[np.ndarray] = None
+        self.searches = 0
+
+    @property
+    def loaded(self) -> bool:
+        return self.postings is not None
+
+    def load(self) -> None:
+        """Memory-map the index files; a missing index leaves search returning nothing."""
+        if not os.path.exists(os.path.join(self.path, "vocab.json")):
+            logger.warning(f"No document index at {self.path}; search_docs will return no citations")
+            return
+        try:
+            with open(os.path.join(self.path, "vocab.json"), encoding="utf-8") as handle:
+                vocab = json.load(handle)
+            with open(os.path.join(self.path, "docs.json"), encoding="utf-8") as handle:
+                docs = json.load(handle)
+            postings = np.load(os.path.join(self.path, "postings.npy"), mmap_mode="r")
+            frequencies = np.load(os.path.join(self.path, "frequencies.npy"), mmap_mode="r")
+            lengths = np.load(os.path.join(self.path, "doc_lengths.npy")).astype(np.float32)
+        except (OSError, ValueError) as e:
+            raise DocIndexError(f"Could not load document index from {self.path}: {e}")
+
+        average_length = float(lengths.mean()) if len(lengths) else 1.0
+        self.length_norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / (average_length or 1.0))
+        self.vocab, self.docs = vocab, docs
+        self.postings, self.frequencies = postings, frequencies
+        logger.info(f"Document index loaded: {len(docs)} documents, {len(vocab)} terms")
+
+    def search(
+        self,
+        text: str,
+        ward: Optional[str] = None,
+        from_date: Optional[str] = None,
+        to_date: Optional[str] = None,
+        k: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """Return the best-matching documents as citations.
+
+        Documents tagged with another ward, or dated outside
+        ``from_date``..``to_date`` (ISO dates), are excluded; untagged and
+        undated documents always pass.
+        """
+        if not self.loaded:
+            return []
+        self.searches += 1
+        k = k or settings.doc_search_max_results
+        total = len(self.docs)
+        scores = np.zeros(total, dtype=np.float32)
+        for term in set(ngram_terms(text)):
+            entry = self.vocab.get(term)
+            if entry is None:
+                continue
+            offset, length = entry
+            doc_ids = self.postings[offset:offset + length]
+            frequency = self.frequencies[offset:offset + length].astype(np.float32)
+            idf = math.log(1 + (total - length + 0.5) / (length + 0.5))
+            scores[doc_ids] += idf * frequency * (BM25_K1 + 1) / (frequency + self.length_norm[doc_ids])
+
+        results = []
+        matched = np.flatnonzero(scores > 0)
+        for doc_id in matched[np.argsort(-scores[matched], kind="stable")]:
+            if len(results) >= k:
+                break
+            doc = self.docs[doc_id]
+            if ward and doc.get("ward") and doc["ward"].lower() != ward.lower():
+                continue
+            if doc.get("date") and ((from_date and doc["date"] < from_date) or (to_date and doc["date"] > to_date)):
+                continue
+            results.append({**doc, "score": round(float(scores[doc_id]), 3)})
+        return results
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "loaded": self.loaded,
+            "documents": len(self.docs),
+            "terms": len(self.vocab),
+            "searches": self.searches,
+        }
+
+
+# Global instance loaded at startup
+doc_search_index = DocSearchIndex()
@@ -0,0 +1,211 @@
+"""Library of verified question/SQL pairs used as few-shot examples for the agent."""
+
+import json
+import os
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from core.config import settings
+from core.logging import get_logger
+from services.response_cache import normalize_prompt
+from services.schema import SchemaService
+from services.text_index import BM25Index, ngram_terms
+
+logger = get_logger(__name__)
+
+# Worked examples of the extended_fact_measure EAV layout, on top of the schema's sample queries
+SEED_EXAMPLES: List[Dict[str, str]] = [
+    {
+        "question": "GDP growth rate trend over the years",
+        "sql": (
+            "SELECT t.year, AVG(efm.numeric_value) AS value, di.unit "
+            "FROM extended_fact_measure efm "
+            "JOIN dataset_indicator di ON efm.indicator_id = di.id "
+            "JOIN dim_time t ON efm.time_id = t.id "
+            "WHERE di.display_name ILIKE '%GDP%' AND efm.numeric_value IS NOT NULL "
+            "GROUP BY t.year, di.unit ORDER BY t.year LIMIT 100"
+        ),
+    },
+    {
+        "question": "Literacy rate by state in the latest year",
+        "sql": (
+            "SELECT g.state, AVG(efm.numeric_value) AS value "
+            "FROM extended_fact_measure efm "
+            "JOIN dataset_registry dr ON efm.dataset_id = dr.id "
+            "JOIN dim_geo g ON efm.geo_id = g.id "
+            "JOIN dim_time t ON efm.time_id = t.id "
+            "WHERE dr.title ILIKE '%literacy%' "
+            "AND t.year = (SELECT MAX(t2.year) FROM extended_fact_measure e2 "
+            "JOIN dim_time t2 ON e2.time_id = t2.id WHERE e2.dataset_id = dr.id) "
+            "GROUP BY g.state ORDER BY value DESC LIMIT 50"
+        ),
+    },
+    {
+        "question": "Compare indicators of an infrastructure dataset across years",
+        "sql": (
+            "SELECT t.year, di.display_name AS indicator, SUM(efm.numeric_value) AS value "
+            "FROM extended_fact_measure efm "
+            "JOIN dataset_registry dr ON efm.dataset_id = dr.id "
+            "JOIN dataset_indicator di ON efm.indicator_id = di.id "
+            "JOIN dim_time t ON efm.time_id = t.id "
+            "WHERE dr.category = 'Infrastructure' AND di.is_measure = true "
+            "GROUP BY t.year, di.display_name ORDER BY t.year LIMIT 200"
+        ),
+    },
+]
+
+
+class ExampleLibrary:
+    """Seed and learned question/SQL pairs with BM25 retrieval over question n-grams.
+
+    Learned pairs are appended to a JSONL file so the library survives
+    restarts; the index is rebuilt in memory on load, which also compacts
+    replaced and evicted pairs out of the file. Adding a pair only touches
+    that pair: replaced or evicted entries are removed from the index in
+    place and the file is appended to.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_entries: Optional[int] = None):
+        self.path = path or settings.example_library_path
+        self.max_entries = max_entries or settings.example_library_max_entries
+        # Positions match index doc ids; dropped entries leave None behind
+        self.examples: List[Optional[Dict[str, Any]]] = []
+        self._by_question: Dict[str, int] = {}
+        # Positions of learned examples, oldest first, for eviction
+        self._learned: "deque[int]" = deque()
+        self.index = BM25Index()
+        self._loaded = False
+        self.searches = 0
+        self.searches_with_results = 0
+
+    def load(self) -> None:
+        """Build the index from seed examples and the learned-examples file."""
+        examples = [
+            {"question": sample["description"], "sql": " ".join(sample["sql"].split()), "source": "seed"}
+            for sample in SchemaService.get_sanitized_schema().get("sample_queries", [])
+        ]
+        examples += [{**example, "source": "seed"} for example in SEED_EXAMPLES]
+        lines = 0
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, encoding="utf-8") as handle:
+                    for line in handle:
+                        if line.strip():
+                            examples.append({**json.loads(line), "source": "learned"})
+                            lines += 1
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not read example library {self.path}: {e}")
+        self._rebuild(examples)
+        learned = [example for example in self.examples if example["source"] == "learned"]
+        if lines > len(learned):
+            self._persist(learned, mode="w")
+        self._loaded = True
+        logger.info(f"Example library loaded {len(self.examples)} examples")
+
+    def _rebuild(self, examples: List[Dict[str, Any]]) -> None:
+        # Later entries for the same question replace earlier ones
+        latest: Dict[str, Dict[str, Any]] = {}
+        for example in examples:
+            latest.pop(normalize_prompt(example["question"]), None)
+            latest[normalize_prompt(example["question"])] = example
+        kept = list(latest.values())
+        learned = [example for example in kept if example["source"] == "learned"]
+        overflow = len(kept) - self.max_entries
+        if overflow > 0:
+            dropped = {id(example) for example in learned[:overflow]}
+            kept = [example for example in kept if id(example) not in dropped]
+
+        self.examples = []
+        self._by_question = {}
+        self._learned = deque()
+        self.index = BM25Index()
+        for example in kept:
+            self._append(example)
+
+    def _append(self, example: Dict[str, Any]) -> None:
+        position = self.index.add(ngram_terms(example["question"]))
+        self._by_question[normalize_prompt(example["question"])] = position
+        self.examples.append(example)
+        if example["source"] == "learned":
+            self._learned.append(position)
+
+    def _drop(self, position: int) -> None:
+        key = normalize_prompt(self.examples[position]["question"])
+        if self._by_question.get(key) == position:
+            del self._by_question[key]
+        self.index.remove(position)
+        self.examples[position] = None
+
+    def search(self, question: str, k: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Return the ``k`` examples most similar to ``question``."""
+        if not self._loaded:
+            self.load()
+        k = settings.few_shot_examples if k is None else k
+        self.searches += 1
+        # Dropped entries are no longer indexed, so every hit is live
+        hits = [self.examples[doc_id] for doc_id, _ in self.index.search(ngram_terms(question), k)]
+        if hits:
+            self.searches_with_results += 1
+        return hits
+
+    def add(self, question: str, sql: str) -> None:
+        """Record a verified question/SQL pair and persist it."""
+        if not self._loaded:
+            self.load()
+        sql = " ".join(sql.split())
+        key = normalize_prompt(question)
+        existing = self._by_question.get(key)
+        if existing is not None and self.examples[existing]["sql"] == sql:
+            return
+
+        example = {"question": question, "sql": sql, "added_at": time.time(), "source": "learned"}
+        if existing is not None:
+            self._drop(existing)
+        elif len(self._by_question) >= self.max_entries:
+            # Evict the oldest learned example; seeds are never evicted
+            while self._learned and self.examples[self._learned[0]] is None:
+                self._learned.popleft()
+            if not self._learned:
+                return
+            self._drop(self._learned.popleft())
+        self._append(example)
+        # Later lines win on load, so replacing or evicting never rewrites the file here
+        self._persist([example], mode="a")
+
+        # Dropped entries leave gaps; compact once they outnumber the live ones
+        if len(self.examples) > 2 * len(self._by_question):
+            self._rebuild([entry for entry in self.examples if entry is not None])
+
+    def _persist(self, examples: List[Dict[str, Any]], mode: str) -> None:
+        """Append (``mode="a"``) or rewrite (``mode="w"``) learned examples in the JSONL file."""
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, mode, encoding="utf-8") as handle:
+                for example in examples:
+                    record = {key: value for key, value in example.items() if key != "source"}
+                    handle.write(json.dumps(record) + "\n")
+        except OSError as e:
+            logger.warning(f"Could not persist examples to {self.path}: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return library size and retrieval counters."""
+        learned = sum(1 for example in self.examples if example is not None and example["source"] == "learned")
+        return {
+            "entries": len(self._by_question),
+            "seed": len(self._by_question) - learned,
+            "learned": learned,
+            "searches": self.searches,
+            "searches_with_results": self.searches_with_results,
+        }
+
+
+def format_examples(examples: List[Dict[str, Any]]) -> str:
+    """Render examples for the user message."""
+    return "\n\n".join(f"Q: {example['question']}\nSQL: {example['sql']}" for example in examples)
+
+
+# Global instance shared by agent runs on this worker
+example_library = ExampleLibrary()
@@ -0,0 +1,224 @@
+"""Postgres-backed queue of background insight jobs."""
+
+import asyncio
+import json
+import os
+import socket
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from sqlalchemy import Engine, text
+
+from core.config import settings
+from core.logging import get_logger
+from db.session import run_in_background_executor
+from llm.admission import AdmissionRejected
+from llm.hedging import LatencyWindow
+
+logger = get_logger(__name__)
+
+JobHandler = Callable[[str, Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+# Oldest queued job first; SKIP LOCKED lets any number of workers claim concurrently
+CLAIM_SQL = text(
+    "UPDATE insight_job SET status = 'running', started_at = now(), "
+    "attempts = attempts + 1, worker_id = :worker_id "
+    "WHERE id = ("
+    "  SELECT id FROM insight_job WHERE status = 'queued' "
+    "  ORDER BY id FOR UPDATE SKIP LOCKED LIMIT 1"
+    ") "
+    "RETURNING id, prompt, filters, attempts, "
+    "EXTRACT(EPOCH FROM started_at - created_at) AS wait_seconds"
+)
+
+
+class InsightJobQueue:
+    """Enqueue, claim and finish insight jobs in the ``insight_job`` table.
+
+    Database calls are blocking and meant to run on the query executor.
+    Wait and run times seen by this worker process are kept in memory.
+    """
+
+    def __init__(self, engine: Optional[Engine] = None):
+        self._engine = engine
+        self.worker_prefix = f"{socket.gethostname()}:{os.getpid()}"
+        self.wait_seconds = LatencyWindow()
+        self.run_seconds = LatencyWindow()
+        self.claimed = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.requeued = 0
+
+    @property
+    def engine(self) -> Engine:
+        if self._engine is None:
+            # Job rows are written, so they go through the owner role
+            from db.session import owner_engine
+            self._engine = owner_engine
+        return self._engine
+
+    def enqueue(self, prompt: str, filters: Dict[str, Any]) -> int:
+        """Insert a queued job and return its id."""
+        with self.engine.begin() as conn:
+            return conn.execute(
+                text("INSERT INTO insight_job (status, prompt, filters) VALUES ('queued', :prompt, :filters) RETURNING id"),
+                {"prompt": prompt, "filters": json.dumps(filters)}
+            ).scalar_one()
+
+    def get(self, job_id: int) -> Optional[Dict[str, Any]]:
+        """Return a job's status, timings and result, or None if it does not exist."""
+        with self.engine.connect() as conn:
+            row = conn.execute(text(
+                "SELECT id, status, result, error, attempts, created_at, started_at, finished_at, "
+                "(SELECT COUNT(*) FROM insight_job q WHERE q.status = 'queued' AND q.id < j.id) AS queue_position "
+                "FROM insight_job j WHERE id = :id"
+            ), {"id": job_id}).mappings().first()
+        if row is None:
+            return None
+        job = dict(row)
+        for key in ("created_at", "started_at", "finished_at"):
+            job[key] = job[key].isoformat() if job[key] else None
+        if job["status"] != "queued":
+            job.pop("queue_position")
+        return job
+
+    def claim(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """Mark the oldest queued job as running for ``worker_id`` and return it."""
+        with self.engine.begin() as conn:
+            row = conn.execute(CLAIM_SQL, {"worker_id": worker_id}).mappings().first()
+        if row is None:
+            return None
+        job = dict(row)
+        if isinstance(job["filters"], str):
+            job["filters"] = json.loads(job["filters"])
+        self.claimed += 1
+        self.wait_seconds.add(float(job["wait_seconds"] or 0.0))
+        return job
+
+    def complete(self, job_id: int, result: Dict[str, Any]) -> None:
+        with self.engine.begin() as conn:
+            conn.execute(text(
+                "UPDATE insight_job SET status = 'succeeded', result = :result, error = NULL, finished_at = now() "
+                "WHERE id = :id"
+            ), {"id": job_id, "result": json.dumps(result, default=str)})
+        self.succeeded += 1
+
+    def fail(self, job_id: int, error: str) -> None:
+        with self.engine.begin() as conn:
+            conn.execute(text(
+                "UPDATE insight_job SET status = 'failed', error = :error, finished_at = now() WHERE id = :id"
+            ), {"id": job_id, "error": error[:2000]})
+        self.failed += 1
+
+    def requeue(self, job_id: int) -> None:
+        """Return a claimed job to the queue without counting the attempt."""
+        with self.engine.begin() as conn:
+            conn.execute(text(
+                "UPDATE insight_job SET status = 'queued', started_at = NULL, worker_id = NULL, "
+                "attempts = GREATEST(attempts - 1, 0) WHERE id = :id AND status = 'running'"
+            ), {"id": job_id})
+        self.requeued += 1
+
+    def requeue_stale(self) -> int:
+        """Put jobs left running by a dead worker back in the queue (or fail them after max attempts)."""
+        with self.engine.begin() as conn:
+            rows = conn.execute(text(
+                "UPDATE insight_job SET "
+                "status = CASE WHEN attempts >= :max_attempts THEN 'failed' ELSE 'queued' END, "
+                "error = CASE WHEN attempts >= :max_attempts THEN 'Worker stopped while running the job' END, "
+                "finished_at = CASE WHEN attempts >= :max_attempts THEN now() END "
+                "WHERE status = 'running' AND started_at < now() - make_interval(secs => :stale_seconds) "
+                "RETURNING id"
+            ), {
+                "max_attempts": settings.insight_job_max_attempts,
+                "stale_seconds": settings.insight_job_stale_seconds,
+            }).fetchall()
+        if rows:
+            self.requeued += len(rows)
+            logger.warning(f"Recovered {len(rows)} stale insight jobs")
+        return len(rows)
+
+    def queue_depth(self) -> Dict[str, Any]:
+        """Return queued/running counts and the age of the oldest queued job."""
+        with self.engine.connect() as conn:
+            row = conn.execute(text(
+                "SELECT "
+                "COUNT(*) FILTER (WHERE status = 'queued') AS queued, "
+                "COUNT(*) FILTER (WHERE status = 'running') AS running, "
+                "EXTRACT(EPOCH FROM now() - MIN(created_at) FILTER (WHERE status = 'queued')) AS oldest_queued_seconds "
+                "FROM insight_job WHERE status IN ('queued', 'running')"
+            )).mappings().one()
+        return {
+            "queued": row["queued"],
+            "running": row["running"],
+            "oldest_queued_seconds": round(float(row["oldest_queued_seconds"]), 3)
+            if row["oldest_queued_seconds"] is not None else None,
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return this process's claim counters and wait/run time percentiles."""
+        def rounded(value: Optional[float]) -> Optional[float]:
+            return round(value, 3) if value is not None else None
+
+        return {
+            "claimed": self.claimed,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "requeued": self.requeued,
+            "wait_seconds_p50": rounded(self.wait_seconds.percentile(50)),
+            "wait_seconds_p95": rounded(self.wait_seconds.percentile(95)),
+            "run_seconds_p50": rounded(self.run_seconds.percentile(50)),
+            "run_seconds_p95": rounded(self.run_seconds.percentile(95)),
+        }
+
+
+async def run_job_worker(queue: InsightJobQueue, worker_id: str, handler: JobHandler) -> None:
+    """Claim and run jobs until cancelled, sleeping while the queue is empty."""
+    last_recovery = 0.0
+    while True:
+        try:
+            if time.monotonic() - last_recovery > settings.insight_job_stale_seconds / 2:
+                last_recovery = time.monotonic()
+                await run_in_background_executor(queue.requeue_stale)
+            job = await run_in_background_executor(queue.claim, worker_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Insight job worker {worker_id} could not poll the queue: {e}")
+            job = None
+        if job is None:
+            await asyncio.sleep(settings.insight_job_poll_seconds)
+            continue
+
+        logger.info(f"Worker {worker_id} running insight job {job['id']} (waited {job['wait_seconds']:.1f}s)")
+        started = time.monotonic()
+        try:
+            result = await handler(job["prompt"], job["filters"] or {})
+        except asyncio.CancelledError:
+            # Left as running; requeue_stale hands it to another worker
+            raise
+        except AdmissionRejected as e:
+            # LLM capacity is busy with interactive traffic; put the job back and back off
+            logger.info(f"Insight job {job['id']} deferred for {e.retry_after:.0f}s: {e}")
+            try:
+                await run_in_background_executor(queue.requeue, job["id"])
+            except Exception as requeue_error:
+                logger.error(f"Could not requeue insight job {job['id']}: {requeue_error}")
+            await asyncio.sleep(e.retry_after)
+            continue
+        except Exception as e:
+            logger.error(f"Insight job {job['id']} failed: {e}")
+            result, error = None, str(e)
+        else:
+            error = None
+        queue.run_seconds.add(time.monotonic() - started)
+        try:
+            if error is None:
+                await run_in_background_executor(queue.complete, job["id"], result)
+            else:
+                await run_in_background_executor(queue.fail, job["id"], error)
+        except Exception as e:
+            logger.error(f"Could not record the outcome of insight job {job['id']}: {e}")
+
+# Global instance shared by the API and this process's workers
+insight_job_queue = InsightJobQueue()
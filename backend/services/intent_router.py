@@ -0,0 +1,355 @@
+"""Deterministic routing of dataset catalog questions that do not need the LLM."""
+
+import re
+import time
+from typing import Any, Dict, List, Optional, Set
+
+from core.config import settings
+from core.logging import get_logger
+from db.session import run_in_query_executor
+from services.government_data_service import government_data_service
+from services.response_assembly import build_default_chart_spec
+from services.response_cache import STOPWORDS
+from services.sql_template_cache import sql_template_cache
+
+logger = get_logger(__name__)
+
+
+# Phrasing that marks a question about what data exists
+CATALOG_PATTERN = re.compile(
+    r"\b(what|which|list|show|available|have|any|browse)\b.*\b(datasets?|data ?sets?|indicators?|categor(?:y|ies)|data sources?)\b"
+    r"|\b(datasets?|data ?sets?|indicators?)\b.*\b(available|do you have|are there|exist)\b"
+)
+CATEGORIES_PATTERN = re.compile(r"\bcategor(?:y|ies)\b")
+# Coverage and statistics need explicit catalog wording; "which states have..."
+# or "education statistics" are questions about the data itself
+COVERAGE_PATTERN = re.compile(
+    r"\b(coverage|time range|date range|years? available)\b"
+    r"|\b(datasets?|data ?sets?|indicators?)\b.*\b(covers?|covered|span|spans)\b"
+    r"|\b(covers?|covered)\b.*\b(datasets?|data ?sets?|indicators?)\b"
+)
+GEO_COVERAGE_PATTERN = re.compile(r"\b(geographic|geography|states?|districts?|regions?|places?|locations?)\b")
+TIME_COVERAGE_PATTERN = re.compile(r"\b(time|years?|periods?|dates?|months?|quarters?)\b")
+STATISTICS_PATTERN = re.compile(
+    r"\b(how many (?:records|rows|data points|observations)|record count|row count|number of (?:records|rows))\b"
+    r"|\b(datasets?|data ?sets?)\b.*\b(statistics|stats)\b|\b(statistics|stats)\b.*\b(datasets?|data ?sets?)\b"
+)
+# A year, a value request or "in <Place>" asks for the data itself, not a listing
+YEAR_PATTERN = re.compile(r"\b(?:19|20)\d{2}\b")
+VALUE_PATTERN = re.compile(r"\b(values?|figures?|numbers?|readings?|data for|data of)\b")
+PLACE_PHRASE_PATTERN = re.compile(r"\b(?:in|for|of|at|across)\s+[A-Z][a-z]")
+
+# Analytical phrasing always goes to the LLM, even when catalog words appear
+ANALYTIC_PATTERN = re.compile(
+    r"\b(trends?|compare[sd]?|comparing|comparison|versus|vs|correlat\w*|highest|lowest|top|bottom|average|mean|"
+    r"over time|increase[sd]?|decrease[sd]?|rank\w*|why|forecast\w*|predict\w*|between|"
+    r"above|below|exceed\w*|(?:more|less|greater|fewer|higher|lower) than|at (?:least|most)|"
+    r"most|least|best|worst|percent|threshold)\b"
+)
+
+# Extra words that point at a registry category
+CATEGORY_SYNONYMS: Dict[str, List[str]] = {
+    "Economic": ["economic", "economy", "economics", "fiscal", "financial", "finance"],
+    "Infrastructure": ["infrastructure", "infra"],
+    "Social": ["social", "society", "welfare"],
+    "Environmental": ["environment", "environmental", "climate", "ecology"],
+}
+
+# Words too generic to identify a dataset
+VOCABULARY_STOPWORDS = {
+    "the", "and", "for", "with", "data", "dataset", "datasets", "rate", "rates", "india",
+    "indian", "national", "state", "total", "by", "of", "in", "wise", "level", "annual",
+    "list", "show", "what", "which", "have", "available", "indicator", "indicators",
+}
+
+# Words that only say "tell me what data exists"
+CATALOG_WORDS = {
+    "datasets", "dataset", "sets", "indicators", "indicator", "categories", "category",
+    "sources", "source", "available", "any", "there", "exist", "browse", "which", "your", "have",
+}
+
+
+def _tokens(text: str) -> List[str]:
+    return re.findall(r"[a-z0-9]+", (text or "").lower())
+
+
+class IntentRouter:
+    """Answers catalog, coverage and statistics questions straight from the dataset registry.
+
+    The registry snapshot is compiled into a single keyword regex (an
+    alternation of every dataset phrase and term, longest first) so matching a
+    prompt is one scan. Anything ambiguous or analytical is left to the agent.
+    """
+
+    def __init__(self):
+        self.datasets: List[Dict[str, Any]] = []
+        self._term_datasets: Dict[str, Set[str]] = {}
+        self._term_categories: Dict[str, str] = {}
+        self._automaton: Optional[re.Pattern] = None
+        self.routed: Dict[str, int] = {}
+        self.passed_through = 0
+
+    def load(self, datasets: List[Dict[str, Any]]) -> None:
+        """Compile the keyword automaton from registry entries."""
+        term_datasets: Dict[str, Set[str]] = {}
+        term_categories: Dict[str, str] = {}
+
+        for dataset in datasets:
+            phrases = [dataset.get("title"), dataset.get("subcategory"), (dataset.get("slug") or "").replace("-", " ").replace("_", " ")]
+            for phrase in phrases:
+                words = _tokens(phrase)
+                if len(words) > 1:
+                    term_datasets.setdefault(" ".join(words), set()).add(dataset["slug"])
+                for word in words:
+                    if len(word) >= 3 and word not in VOCABULARY_STOPWORDS:
+                        term_datasets.setdefault(word, set()).add(dataset["slug"])
+            if dataset.get("category"):
+                term_categories[dataset["category"].lower()] = dataset["category"]
+
+        for category, synonyms in CATEGORY_SYNONYMS.items():
+            for synonym in synonyms:
+                term_categories.setdefault(synonym, category)
+
+        terms = sorted(set(term_datasets) | set(term_categories), key=len, reverse=True)
+        self._automaton = re.compile(r"\b(" + "|".join(re.escape(term) for term in terms) + r")\b") if terms else None
+        self._term_datasets = term_datasets
+        self._term_categories = term_categories
+        self.datasets = list(datasets)
+        logger.info(f"Intent router loaded {len(datasets)} datasets, {len(terms)} terms")
+
+    def refresh(self) -> None:
+        """Reload the registry snapshot from the database (blocking)."""
+        self.load(government_data_service.get_all_datasets())
+
+    def _match(self, text: str) -> Dict[str, Any]:
+        """Return dataset scores and categories mentioned in normalized text."""
+        scores: Dict[str, int] = {}
+        categories: Set[str] = set()
+        if self._automaton is None:
+            return {"scores": scores, "categories": categories}
+        for match in self._automaton.finditer(text):
+            term = match.group(1)
+            if term in self._term_categories:
+                categories.add(self._term_categories[term])
+                continue
+            for slug in self._term_datasets.get(term, ()):
+                scores[slug] = scores.get(slug, 0) + len(term)
+        return {"scores": scores, "categories": categories}
+
+    def _asks_for_values(self, prompt: str, text: str, filters: Dict[str, Any]) -> bool:
+        """Whether the prompt or filters pin a year or place, i.e. want data rather than a listing."""
+        if any(value for key in ("time", "place") for value in (filters.get(key) or {}).values()):
+            return True
+        if YEAR_PATTERN.search(text) or VALUE_PATTERN.search(text) or PLACE_PHRASE_PATTERN.search(prompt or ""):
+            return True
+        padded = f" {text} "
+        return any(f" {place} " in padded for place in sql_template_cache.vocabulary["places"])
+
+    def classify(self, prompt: str, filters: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """Return ``{"intent", ...}`` for a recognized catalog question, else None.
+
+        The ``extra.category`` filter limits matches to that registry category.
+        """
+        filters = filters or {}
+        category = (filters.get("extra") or {}).get("category")
+        if not self.datasets:
+            return None
+        text = " ".join(_tokens(prompt))
+        if ANALYTIC_PATTERN.search(text):
+            return None
+
+        matched = self._match(text)
+        scores = matched["scores"]
+        if category:
+            in_category = {dataset["slug"] for dataset in self.datasets if dataset.get("category") == category}
+            outside = set(scores) - in_category
+            scores = {slug: score for slug, score in scores.items() if slug in in_category}
+            if outside and not scores:
+                # The prompt names data the filter excludes; let the agent explain
+                return None
+            if matched["categories"] - {category}:
+                return None
+            matched["categories"] = {category}
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        # Coverage and statistics need exactly one clearly best dataset
+        single = best[0][0] if best and (len(best) == 1 or best[0][1] > best[1][1]) else None
+
+        if STATISTICS_PATTERN.search(text):
+            return {"intent": "statistics", "slug": single} if single else None
+        if COVERAGE_PATTERN.search(text):
+            if not single:
+                return None
+            wants_geo = bool(GEO_COVERAGE_PATTERN.search(text))
+            wants_time = bool(TIME_COVERAGE_PATTERN.search(text))
+            return {
+                "intent": "coverage",
+                "slug": single,
+                "geographic": wants_geo or not wants_time,
+                "time": wants_time or not wants_geo,
+            }
+        if CATALOG_PATTERN.search(text):
+            if self._asks_for_values(prompt, text, filters):
+                return None
+            if CATEGORIES_PATTERN.search(text) and not scores and not matched["categories"]:
+                return {"intent": "categories"}
+            if scores:
+                return {"intent": "catalog", "slugs": [slug for slug, _ in best]}
+            if matched["categories"]:
+                return {"intent": "catalog", "categories": sorted(matched["categories"])}
+            # A topic we know nothing about is better explained by the agent
+            if any(token not in STOPWORDS and token not in CATALOG_WORDS for token in text.split()):
+                return None
+            return {"intent": "catalog"}
+        return None
+
+    async def answer(self, prompt: str, filters: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Answer ``prompt`` without the LLM, or return None to hand it to the agent."""
+        started = time.monotonic()
+        intent = self.classify(prompt, filters)
+        if intent is None:
+            self.passed_through += 1
+            return None
+
+        name = intent["intent"]
+        try:
+            if name == "statistics":
+                response = await self._statistics_response(intent["slug"], filters)
+            elif name == "coverage":
+                response = await self._coverage_response(intent, filters)
+            elif name == "categories":
+                response = self._categories_response(filters)
+            else:
+                response = self._catalog_response(intent, filters)
+        except Exception as e:
+            # A failed catalog lookup should not fail the request; the agent can still answer
+            logger.warning(f"Intent router '{name}' lookup failed, passing to agent: {e}")
+            response = None
+        if response is None:
+            self.passed_through += 1
+            return None
+
+        self.routed[name] = self.routed.get(name, 0) + 1
+        duration_ms = round((time.monotonic() - started) * 1000, 2)
+        logger.info(f"Intent router answered '{name}' in {duration_ms}ms")
+        response["intent"] = name
+        return response
+
+    def _dataset(self, slug: str) -> Optional[Dict[str, Any]]:
+        return next((dataset for dataset in self.datasets if dataset["slug"] == slug), None)
+
+    def _response(
+        self,
+        insight_text: str,
+        columns: List[str],
+        rows: List[List[Any]],
+        filters: Dict[str, Any],
+        chart_columns: Optional[List[str]] = None,
+        chart_rows: Optional[List[List[Any]]] = None
+    ) -> Dict[str, Any]:
+        """Wrap a catalog answer in the standard insight response shape."""
+        return {
+            "insight_text": insight_text,
+            "sql_used": "",
+            "data_preview": {"columns": columns, "rows": rows[:settings.max_preview_rows]},
+            "viz": {
+                "type": "vega-lite",
+                "spec": build_default_chart_spec(chart_columns or columns, chart_rows if chart_rows is not None else rows),
+            },
+            "doc_citations": [],
+            "filters_applied": filters,
+            "disclaimers": ["Answered from the dataset catalog"],
+        }
+
+    def _catalog_response(self, intent: Dict[str, Any], filters: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        if intent.get("slugs"):
+            datasets = [self._dataset(slug) for slug in intent["slugs"]]
+            topic = "matching datasets"
+        elif intent.get("categories"):
+            datasets = [dataset for dataset in self.datasets if dataset.get("category") in intent["categories"]]
+            topic = f"{' and '.join(intent['categories'])} datasets"
+        else:
+            datasets = list(self.datasets)
+            topic = "datasets"
+        datasets = [dataset for dataset in datasets if dataset]
+        if not datasets:
+            return None
+
+        rows = [
+            [dataset["title"], dataset.get("category"), dataset.get("geographic_level"),
+             dataset.get("time_granularity"), dataset.get("indicators_count", 0)]
+            for dataset in datasets
+        ]
+        per_category: Dict[str, int] = {}
+        for dataset in datasets:
+            per_category[dataset.get("category") or "Other"] = per_category.get(dataset.get("category") or "Other", 0) + 1
+        lines = "\n".join(f"• **{dataset['title']}** ({dataset.get('category')}, {dataset.get('time_granularity')})" for dataset in datasets[:15])
+        more = f"\n…and {len(datasets) - 15} more" if len(datasets) > 15 else ""
+        return self._response(
+            f"## Available Data\nThere are {len(datasets)} {topic}:\n{lines}{more}",
+            ["Dataset", "Category", "Geographic Level", "Time Granularity", "Indicators"],
+            rows,
+            filters,
+            chart_columns=["category", "datasets"],
+            chart_rows=sorted(per_category.items()),
+        )
+
+    def _categories_response(self, filters: Dict[str, Any]) -> Dict[str, Any]:
+        per_category: Dict[str, int] = {}
+        for dataset in self.datasets:
+            per_category[dataset.get("category") or "Other"] = per_category.get(dataset.get("category") or "Other", 0) + 1
+        rows = [[category, count] for category, count in sorted(per_category.items())]
+        lines = "\n".join(f"• **{category}**: {count} datasets" for category, count in rows)
+        return self._response(f"## Dataset Categories\n{lines}", ["category", "datasets"], rows, filters)
+
+    async def _coverage_response(self, intent: Dict[str, Any], filters: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        dataset = self._dataset(intent["slug"])
+        parts = [f"## Coverage: {dataset['title']}"]
+        columns: List[str] = []
+        rows: List[List[Any]] = []
+        if intent["time"]:
+            periods = await run_in_query_executor(government_data_service.get_time_coverage, intent["slug"])
+            years = sorted({period["year"] for period in periods if period.get("year") is not None})
+            parts.append(f"Time: {years[0]}–{years[-1]} ({len(periods)} periods)" if years else "Time: no periods loaded yet")
+            columns, rows = ["year", "periods"], [[year, sum(1 for p in periods if p.get("year") == year)] for year in years]
+        if intent["geographic"]:
+            places = await run_in_query_executor(government_data_service.get_geographic_coverage, intent["slug"])
+            names = sorted(place["name"] for place in places)
+            listed = ", ".join(names[:20]) + (f" and {len(names) - 20} more" if len(names) > 20 else "")
+            parts.append(f"Geography: {len(names)} locations" + (f" — {listed}" if names else ""))
+            if not intent["time"]:
+                columns, rows = ["name", "type"], [[place["name"], place["type"]] for place in places]
+        return self._response("\n".join(parts), columns, rows, filters)
+
+    async def _statistics_response(self, slug: str, filters: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        stats = await run_in_query_executor(government_data_service.get_dataset_statistics, slug)
+        if not stats:
+            return None
+        rows = [
+            ["total_records", stats["total_records"]],
+            ["indicators", stats["indicators_count"]],
+            ["locations", stats["geographic_coverage"]],
+            ["time_periods", stats["time_coverage"]],
+        ]
+        return self._response(
+            f"## Statistics: {stats['dataset']['title']}\n"
+            f"{stats['total_records']} records across {stats['indicators_count']} indicators, "
+            f"{stats['geographic_coverage']} locations and {stats['time_coverage']} time periods.",
+            ["metric", "value"],
+            rows,
+            filters,
+        )
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return routing counters."""
+        routed = sum(self.routed.values())
+        total = routed + self.passed_through
+        return {
+            "datasets_loaded": len(self.datasets),
+            "routed": dict(self.routed),
+            "passed_through": self.passed_through,
+            "routed_ratio": round(routed / total, 3) if total else 0.0,
+        }
+
+
+# Global instance
+intent_router = IntentRouter()
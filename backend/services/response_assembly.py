@@ -0,0 +1,130 @@
+"""Server-side assembly of data previews and chart data for insight responses."""
+
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, List
+
+INLINE_DATA_PLACEHOLDER = "__INLINE_DATA__"
+
+
+def to_json_value(value: Any) -> Any:
+    """Convert database values into plain JSON types for previews and charts."""
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def build_data_preview(result: Dict[str, Any], max_rows: int) -> Dict[str, Any]:
+    """Build the data_preview block from a query result."""
+    return {
+        "columns": list(result.get("columns", [])),
+        "rows": [[to_json_value(value) for value in row] for row in result.get("rows", [])[:max_rows]],
+    }
+
+
+def rows_to_records(columns: List[str], rows: List[List[Any]]) -> List[Dict[str, Any]]:
+    """Turn column/row lists into the record format Vega-Lite expects."""
+    return [
+        {column: to_json_value(value) for column, value in zip(columns, row)}
+        for row in rows
+    ]
+
+
+def inline_chart_data(spec: Any, records: List[Dict[str, Any]]) -> int:
+    """Replace every ``__INLINE_DATA__`` placeholder in a Vega-Lite spec with records.
+
+    Layered and concatenated specs are handled by walking the whole tree.
+    A bare ``"data": "__INLINE_DATA__"`` becomes ``{"values": records}`` as
+    Vega-Lite requires. Returns the number of placeholders replaced.
+    """
+    replaced = 0
+    if isinstance(spec, dict):
+        for key, value in spec.items():
+            if value == INLINE_DATA_PLACEHOLDER:
+                spec[key] = {"values": records} if key == "data" else records
+                replaced += 1
+            else:
+                replaced += inline_chart_data(value, records)
+    elif isinstance(spec, list):
+        for item in spec:
+            replaced += inline_chart_data(item, records)
+    return replaced
+
+
+def _is_numeric_column(records: List[Dict[str, Any]], column: str) -> bool:
+    values = [record[column] for record in records if record.get(column) is not None]
+    return bool(values) and all(
+        isinstance(value, (int, float)) and not isinstance(value, bool) for value in values
+    )
+
+
+def _has_encoding(spec: Any) -> bool:
+    """Whether any view in a (possibly layered or concatenated) spec has an encoding."""
+    if isinstance(spec, dict):
+        return bool(spec.get("encoding")) or any(_has_encoding(value) for value in spec.values())
+    if isinstance(spec, list):
+        return any(_has_encoding(item) for item in spec)
+    return False
+
+
+def build_default_chart_spec(columns: List[str], rows: List[List[Any]]) -> Dict[str, Any]:
+    """Generate a simple bar/line chart for a result when no usable spec exists."""
+    records = rows_to_records(columns, rows)
+    numeric = [column for column in columns if _is_numeric_column(records, column)]
+    categorical = [column for column in columns if column not in numeric]
+    if not numeric or not records:
+        return {}
+
+    y_field = numeric[-1]
+    temporal = [column for column in columns if column.lower() in ("year", "date", "period", "month", "quarter")]
+    if temporal:
+        x_field, x_type, mark = temporal[0], "ordinal", {"type": "line", "point": True}
+    elif categorical:
+        x_field, x_type, mark = categorical[0], "nominal", {"type": "bar"}
+    else:
+        x_field, x_type, mark = numeric[0], "quantitative", {"type": "point"}
+
+    encoding: Dict[str, Any] = {
+        "x": {"field": x_field, "type": x_type},
+        "y": {"field": y_field, "type": "quantitative"},
+    }
+    series = [column for column in categorical if column != x_field]
+    if series and x_type == "ordinal":
+        encoding["color"] = {"field": series[0], "type": "nominal"}
+
+    return {
+        "$schema": "https://vega.github.io/schema/vega-lite/v5.json",
+        "data": {"values": records},
+        "mark": mark,
+        "encoding": encoding,
+    }
+
+
+def assemble_result_data(
+    response: Dict[str, Any],
+    result: Dict[str, Any],
+    max_preview_rows: int
+) -> Dict[str, Any]:
+    """Fill data_preview, sql_used and chart data from the last successful query.
+
+    The model only writes the narrative and the chart encoding; rows are
+    never round-tripped through the LLM.
+    """
+    response["sql_used"] = result.get("query", response.get("sql_used", ""))
+    response["data_preview"] = build_data_preview(result, max_preview_rows)
+
+    viz = response.get("viz")
+    spec = viz.get("spec") if isinstance(viz, dict) else None
+    records = rows_to_records(result.get("columns", []), result.get("rows", []))
+    replaced = inline_chart_data(spec, records) if isinstance(spec, dict) else 0
+    if not replaced and isinstance(spec, dict) and _has_encoding(spec):
+        # Top-level data is inherited by layered and concatenated views
+        spec["data"] = {"values": records}
+    elif not replaced:
+        response["viz"] = {
+            "type": "vega-lite",
+            "spec": build_default_chart_spec(result.get("columns", []), result.get("rows", [])),
+        }
+    return response
@@ -0,0 +1,171 @@
+"""In-process response cache for /api/insights."""
+
+import copy
+import json
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from core.config import settings
+from core.logging import get_logger
+
+logger = get_logger(__name__)
+
+
+# Words that do not change the meaning of an analytics question
+STOPWORDS = {
+    "a", "an", "the", "of", "in", "on", "for", "to", "and", "or", "by", "with",
+    "me", "show", "tell", "give", "what", "whats", "is", "are", "was", "were",
+    "please", "can", "you", "i", "we", "about", "do", "does", "how", "much",
+    "many", "list", "get", "display", "data", "some", "all", "at", "from",
+}
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Normalize a prompt for cache lookups (case, punctuation, whitespace, stopwords)."""
+    tokens = re.findall(r"[a-z0-9]+", prompt.lower())
+    return " ".join(token for token in tokens if token not in STOPWORDS)
+
+
+def canonicalize_filters(filters: Optional[Dict[str, Any]]) -> str:
+    """Serialize filters deterministically, ignoring empty values and key order."""
+    def _clean(value: Any) -> Any:
+        if isinstance(value, dict):
+            cleaned = {k: _clean(v) for k, v in value.items()}
+            return {k: v for k, v in cleaned.items() if v not in (None, "", {}, [])}
+        if isinstance(value, str):
+            return value.strip().lower()
+        return value
+
+    return json.dumps(_clean(filters or {}), sort_keys=True, separators=(",", ":"))
+
+
+def make_cache_key(prompt: str, filters: Optional[Dict[str, Any]]) -> str:
+    """Build the cache key for a prompt and its filters."""
+    return f"{normalize_prompt(prompt)}|{canonicalize_filters(filters)}"
+
+
+# Keys whose lists hold result rows; copies share the rows themselves
+ROW_KEYS = {"rows", "values"}
+
+
+def copy_response(value: Any, key: Optional[str] = None) -> Any:
+    """Copy a response's dicts and lists, sharing the (read-only) result rows."""
+    if isinstance(value, dict):
+        return {k: copy_response(v, k) for k, v in value.items()}
+    if isinstance(value, list):
+        if key in ROW_KEYS:
+            return list(value)
+        return [copy_response(item) for item in value]
+    return value
+
+
+def count_rows(response: Dict[str, Any]) -> int:
+    """Count the result rows a response carries (full result, preview and inline chart data)."""
+    rows = len((response.get("full_result") or {}).get("rows") or [])
+    rows += len((response.get("data_preview") or {}).get("rows") or [])
+    viz = response.get("viz")
+    spec = viz.get("spec") if isinstance(viz, dict) else None
+    data = spec.get("data") if isinstance(spec, dict) else None
+    if isinstance(data, dict) and isinstance(data.get("values"), list):
+        rows += len(data["values"])
+    return rows
+
+
+class ResponseCache:
+    """Bounded LRU cache with per-entry TTL and data-version invalidation.
+
+    Both the number of entries and the total result rows they hold are
+    bounded. Hits copy the response structure but share its result rows,
+    which callers treat as read-only.
+    """
+
+    def __init__(self, max_entries: int = None, ttl_seconds: float = None, max_rows: int = None):
+        self.max_entries = max_entries or settings.response_cache_max_entries
+        self.ttl_seconds = ttl_seconds or settings.response_cache_ttl_seconds
+        self.max_rows = max_rows or settings.response_cache_max_rows
+        # key -> (expires_at, response, rows)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.rows = 0
+        self.data_version: Optional[str] = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return a copy of the cached response, or None on miss/expiry."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, response, _ = entry
+        if expires_at < time.monotonic():
+            self._drop(key)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return copy_response(response)
+
+    def set(self, key: str, response: Dict[str, Any]) -> None:
+        """Store a response, evicting the least recently used entries over the entry or row budget."""
+        rows = count_rows(response)
+        if key in self._entries:
+            self._drop(key)
+        if rows > self.max_rows:
+            logger.info(f"Not caching an insight response with {rows} rows")
+            return
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, copy.deepcopy(response), rows)
+        self.rows += rows
+        while len(self._entries) > self.max_entries or self.rows > self.max_rows:
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _drop(self, key: str) -> None:
+        self.rows -= self._entries.pop(key)[2]
+
+    def invalidate(self, reason: str = "manual") -> None:
+        """Drop every cached response."""
+        if self._entries:
+            logger.info(f"Invalidating {len(self._entries)} cached insight responses ({reason})")
+        self._entries.clear()
+        self.rows = 0
+        self.invalidations += 1
+
+    def observe_data_version(self, version: Optional[str]) -> bool:
+        """Invalidate the cache when the underlying data version changes.
+        
+        Returns True when a change was detected.
+        """
+        if version is None:
+            return False
+        changed = self.data_version is not None and version != self.data_version
+        if changed:
+            self.invalidate(reason=f"data version {self.data_version} -> {version}")
+        self.data_version = version
+        return changed
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and occupancy."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "rows": self.rows,
+            "max_rows": self.max_rows,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "data_version": self.data_version,
+        }
+
+
+# Global instance
+response_cache = ResponseCache()
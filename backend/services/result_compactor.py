@@ -0,0 +1,93 @@
+"""Compaction of SQL results before they are fed back into the LLM conversation."""
+
+import json
+from collections import Counter
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+
+from core.config import settings
+
+# Rough characters-per-token ratio used to estimate prompt size
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(payload: Any) -> int:
+    """Estimate the prompt tokens a JSON payload will cost."""
+    return len(json.dumps(payload, default=str)) // CHARS_PER_TOKEN + 1
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float, Decimal)) and not isinstance(value, bool)
+
+
+def summarize_column(name: str, values: List[Any], top_n: int = 5) -> Dict[str, Any]:
+    """Compute count, distinct count, range, mean and top values for one column."""
+    present = [value for value in values if value is not None]
+    summary: Dict[str, Any] = {
+        "name": name,
+        "count": len(present),
+        "nulls": len(values) - len(present),
+    }
+    if not present:
+        return summary
+
+    if all(_is_number(value) for value in present):
+        numbers = [float(value) for value in present]
+        summary.update({
+            "min": min(numbers),
+            "max": max(numbers),
+            "mean": round(sum(numbers) / len(numbers), 4),
+            "distinct": len(set(numbers)),
+        })
+        return summary
+
+    as_text = [str(value) for value in present]
+    counts = Counter(as_text)
+    summary.update({
+        "min": min(as_text),
+        "max": max(as_text),
+        "distinct": len(counts),
+        "top_values": [[value, count] for value, count in counts.most_common(top_n)],
+    })
+    return summary
+
+
+def compact_result(
+    result: Dict[str, Any],
+    sample_rows: Optional[int] = None,
+    token_budget: Optional[int] = None
+) -> Dict[str, Any]:
+    """Return a bounded sample plus column statistics for a query result.
+
+    The sample is halved until the payload fits ``token_budget``; column
+    statistics always describe the full result.
+    """
+    sample_rows = settings.llm_result_sample_rows if sample_rows is None else sample_rows
+    token_budget = settings.llm_result_token_budget if token_budget is None else token_budget
+
+    columns = result.get("columns", [])
+    rows = result.get("rows", [])
+    column_stats = [
+        summarize_column(name, [row[index] for row in rows])
+        for index, name in enumerate(columns)
+    ]
+
+    compacted: Dict[str, Any] = {
+        "columns": columns,
+        "row_count": result.get("row_count", len(rows)),
+        "column_stats": column_stats,
+        "sample_rows": rows[:sample_rows],
+    }
+    if "duration_ms" in result:
+        compacted["duration_ms"] = result["duration_ms"]
+
+    while estimate_tokens(compacted) > token_budget and compacted["sample_rows"]:
+        compacted["sample_rows"] = compacted["sample_rows"][:len(compacted["sample_rows"]) // 2]
+
+    if estimate_tokens(compacted) > token_budget:
+        for stats in column_stats:
+            stats.pop("top_values", None)
+
+    compacted["sample_size"] = len(compacted["sample_rows"])
+    compacted["truncated"] = compacted["sample_size"] < len(rows)
+    return compacted
@@ -0,0 +1,109 @@
+"""Local filtering, grouping and sorting of cached query results with pandas."""
+
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+
+from services.response_assembly import to_json_value
+
+AGGREGATES = {"sum", "mean", "avg", "min", "max", "count"}
+OPERATORS = {"=", "!=", ">", ">=", "<", "<=", "in", "contains"}
+
+
+class RefineError(Exception):
+    """Exception raised when a refinement does not fit the cached result."""
+    pass
+
+
+def _check_columns(frame: pd.DataFrame, columns: List[str]) -> None:
+    missing = [column for column in columns if column not in frame.columns]
+    if missing:
+        raise RefineError(f"Unknown columns {missing}; available: {list(frame.columns)}")
+
+
+def _mask(frame: pd.DataFrame, condition: Dict[str, Any]) -> pd.Series:
+    column, op, value = condition.get("column"), condition.get("op", "="), condition.get("value")
+    _check_columns(frame, [column])
+    if op not in OPERATORS:
+        raise RefineError(f"Unsupported operator '{op}'")
+    series = frame[column]
+    if op == "contains":
+        return series.astype(str).str.contains(str(value), case=False, regex=False)
+    if op == "in":
+        values = value if isinstance(value, list) else [value]
+        if series.dtype == object:
+            return series.astype(str).str.lower().isin([str(item).lower() for item in values])
+        return series.isin(values)
+    if series.dtype == object and isinstance(value, str) and op in ("=", "!="):
+        # Place names come from users in any casing
+        matches = series.astype(str).str.lower() == value.lower()
+        return matches if op == "=" else ~matches
+    comparisons = {
+        "=": series.__eq__, "!=": series.__ne__, ">": series.__gt__,
+        ">=": series.__ge__, "<": series.__lt__, "<=": series.__le__,
+    }
+    try:
+        return comparisons[op](value)
+    except TypeError as e:
+        raise RefineError(f"Cannot compare {column} with {value!r}: {e}")
+
+
+def _plain(value: Any) -> Any:
+    """Convert numpy scalars back to JSON-serializable Python values."""
+    if isinstance(value, np.generic):
+        return value.item()
+    return to_json_value(value)
+
+
+def refine_result(result: Dict[str, Any], spec: Dict[str, Any]) -> Dict[str, Any]:
+    """Apply ``spec`` to a ``{"columns", "rows"}`` result and return a new result.
+
+    ``spec`` keys, applied in this order: ``where`` (list of ``{column, op,
+    value}``), ``group_by`` (columns) with ``aggregate`` (``{column:
+    func}``), ``columns`` (projection), ``sort_by``/``descending`` and
+    ``limit``.
+    """
+    frame = pd.DataFrame(result.get("rows", []), columns=result.get("columns", []))
+    # Decimal values from Postgres become floats so comparisons and sums vectorize
+    for column in frame.columns:
+        if frame[column].dtype == object:
+            converted = pd.to_numeric(frame[column], errors="coerce")
+            if converted.notna().sum() == frame[column].notna().sum():
+                frame[column] = converted
+
+    for condition in spec.get("where") or []:
+        frame = frame[_mask(frame, condition)]
+
+    group_by = spec.get("group_by") or []
+    if group_by:
+        aggregate = spec.get("aggregate") or {}
+        _check_columns(frame, group_by + list(aggregate))
+        functions = {column: ("mean" if func == "avg" else func) for column, func in aggregate.items()}
+        unknown = set(aggregate.values()) - AGGREGATES
+        if unknown:
+            raise RefineError(f"Unsupported aggregates {sorted(unknown)}")
+        # Summing text would concatenate it
+        non_numeric = sorted(
+            column for column, func in functions.items()
+            if func != "count" and not pd.api.types.is_numeric_dtype(frame[column])
+        )
+        if non_numeric:
+            raise RefineError(f"Columns {non_numeric} are not numeric; only count applies to them")
+        if functions:
+            frame = frame.groupby(group_by, as_index=False, sort=True).agg(functions)
+        else:
+            frame = frame.groupby(group_by, as_index=False, sort=True).size().rename(columns={"size": "count"})
+
+    if spec.get("columns"):
+        _check_columns(frame, spec["columns"])
+        frame = frame[spec["columns"]]
+    if spec.get("sort_by"):
+        _check_columns(frame, [spec["sort_by"]])
+        frame = frame.sort_values(spec["sort_by"], ascending=not spec.get("descending", False), kind="stable")
+    if spec.get("limit"):
+        frame = frame.head(int(spec["limit"]))
+
+    frame = frame.astype(object).where(frame.notna(), None)
+    rows = [[_plain(value) for value in row] for row in frame.itertuples(index=False, name=None)]
+    return {"columns": [str(column) for column in frame.columns], "rows": rows, "row_count": len(rows)}
@@ -1,15 +1,48 @@
 """Schema service for providing sanitized database schema information."""
 
-from typing import Dict, List, Any
+import time
+from functools import lru_cache
+from typing import Dict, List, Any, Optional, Set
+from core.config import settings
 from core.logging import get_logger
+from services.result_compactor import estimate_tokens
+from services.text_index import BM25Index, ngram_terms
 
 logger = get_logger(__name__)
 
 
+# Small value hints for the schema digest; refreshed from the catalog at startup
+DEFAULT_VALUE_HINTS: Dict[str, List[str]] = {
+    "dataset_registry.category": ["Economic", "Infrastructure", "Social", "Environmental"],
+    "dataset_registry.geographic_level": ["national", "state", "district"],
+    "dataset_registry.time_granularity": ["annual", "quarterly", "monthly"],
+    "dim_geo.level": ["state", "district", "zone", "ward"],
+}
+
+# Max dataset slugs listed in the digest
+MAX_DIGEST_SLUGS = 40
+
+# Table groups used when selecting a per-request schema subset
+GOVERNMENT_TABLES = ["extended_fact_measure", "dataset_registry", "dataset_indicator"]
+LEGACY_TABLES = ["fact_measure", "dim_indicator"]
+DIMENSION_TABLES = ["dim_time", "dim_geo"]
+# Words that point at the legacy municipal tables
+LEGACY_TERMS = {"ward", "wards", "zone", "zones", "municipal", "forest", "cover", "indicator_slug"}
+
+
 class SchemaService:
     """Service for providing sanitized database schema information to the LLM."""
     
+    _value_hints: Dict[str, List[str]] = dict(DEFAULT_VALUE_HINTS)
+    _digest: Optional[str] = None
+    # Prompt tokens of describing every table, the baseline the subset is measured against
+    _full_tables_tokens: Optional[int] = None
+    # Active datasets with their indicators, and a BM25 index over their metadata
+    _catalog: List[Dict[str, Any]] = []
+    _catalog_index: Optional[BM25Index] = None
+    
     @staticmethod
+    @lru_cache(maxsize=1)
     def get_sanitized_schema() -> Dict[str, Any]:
         """Return a sanitized view of the analytical schema."""
         
@@ -37,7 +70,7 @@ class SchemaService:
                         {"name": "geo_id", "type": "int", "description": "Geographic location reference"},
                         {"name": "time_id", "type": "int", "description": "Time period reference"},
                         {"name": "numeric_value", "type": "numeric", "description": "Numeric measurement value"},
-                        {"name": "text_value", "type": "text", "description": "Text measurement value"},
+                        {"name": "string_value", "type": "text", "description": "Text measurement value"},
                         {"name": "quality_flag", "type": "text", "description": "Data quality indicator"},
                         {"name": "ingestion_timestamp", "type": "date", "description": "When data was ingested"}
                     ]
@@ -136,6 +169,16 @@ class SchemaService:
                     "from": "dataset_indicator.dataset_id",
                     "to": "dataset_registry.id",
                     "description": "Link indicators to their datasets"
+                },
+                {
+                    "from": "extended_fact_measure.geo_id",
+                    "to": "dim_geo.id",
+                    "description": "Link government dataset measurements to geographic locations"
+                },
+                {
+                    "from": "extended_fact_measure.time_id",
+                    "to": "dim_time.id",
+                    "description": "Link government dataset measurements to time periods"
                 }
             ],
             "sample_queries": [
@@ -197,3 +240,209 @@ class SchemaService:
         }
         
         return schema
+    
+    @classmethod
+    def get_schema_digest(cls) -> str:
+        """Return a token-minimal digest of table names and value hints.
+        
+        The digest is built once per process and embedded in the agent's
+        system prompt. Columns and join keys are only sent for the tables
+        relevant to a request, in the user message (see ``describe_subset``).
+        """
+        if cls._digest is None:
+            cls._digest = cls._build_digest()
+        return cls._digest
+    
+    @classmethod
+    def _build_digest(cls) -> str:
+        schema = cls.get_sanitized_schema()
+        lines = ["Tables: " + ", ".join(table["name"] for table in schema["tables"])]
+        lines.append("Value hints:")
+        for column, values in cls._value_hints.items():
+            lines.append(f"- {column}: {' | '.join(values)}")
+        return "\n".join(lines)
+    
+    @classmethod
+    def get_full_tables_tokens(cls) -> int:
+        """Return the estimated tokens of describing every table, computed once per process."""
+        if cls._full_tables_tokens is None:
+            schema = cls.get_sanitized_schema()
+            cls._full_tables_tokens = estimate_tokens(
+                "\n".join(cls.describe_tables(schema["tables"], schema["joins"]))
+            )
+        return cls._full_tables_tokens
+    
+    @classmethod
+    def refresh_value_hints(cls) -> None:
+        """Load categories and dataset slugs from the catalog and rebuild the digest."""
+        from sqlalchemy import text
+        from db.session import readonly_engine
+        
+        with readonly_engine.connect() as conn:
+            categories = conn.execute(text(
+                "SELECT DISTINCT category FROM dataset_registry WHERE is_active ORDER BY category"
+            )).scalars().all()
+            slugs = conn.execute(text(
+                "SELECT slug FROM dataset_registry WHERE is_active ORDER BY slug LIMIT :limit"
+            ), {"limit": MAX_DIGEST_SLUGS}).scalars().all()
+        
+        hints = dict(DEFAULT_VALUE_HINTS)
+        if categories:
+            hints["dataset_registry.category"] = list(categories)
+        if slugs:
+            hints["dataset_registry.slug"] = list(slugs)
+        cls._value_hints = hints
+        cls._digest = None
+        logger.info(f"Schema digest refreshed with {len(categories)} categories and {len(slugs)} datasets")
+    
+    @classmethod
+    def refresh_catalog_index(cls) -> None:
+        """Load dataset and indicator metadata and index it for schema subsetting."""
+        from sqlalchemy import text
+        from db.session import readonly_engine
+        
+        with readonly_engine.connect() as conn:
+            rows = conn.execute(text(
+                "SELECT dr.id, dr.slug, dr.title, dr.category, dr.subcategory, dr.description, "
+                "di.field_name, di.display_name, di.unit "
+                "FROM dataset_registry dr LEFT JOIN dataset_indicator di ON di.dataset_id = dr.id "
+                "WHERE dr.is_active ORDER BY dr.id, di.id"
+            )).mappings().all()
+        
+        datasets: Dict[int, Dict[str, Any]] = {}
+        for row in rows:
+            dataset = datasets.setdefault(row["id"], {
+                "id": row["id"],
+                "slug": row["slug"],
+                "title": row["title"],
+                "category": row["category"],
+                "subcategory": row["subcategory"],
+                "description": row["description"],
+                "indicators": [],
+            })
+            if row["field_name"]:
+                dataset["indicators"].append({
+                    "field_name": row["field_name"],
+                    "display_name": row["display_name"],
+                    "unit": row["unit"],
+                })
+        cls.load_catalog(list(datasets.values()))
+    
+    @classmethod
+    def has_catalog(cls) -> bool:
+        """Whether catalog entries have been loaded for schema subsetting."""
+        return bool(cls._catalog)
+    
+    @classmethod
+    def load_catalog(cls, datasets: List[Dict[str, Any]]) -> None:
+        """Index catalog entries (``id``, ``slug``, ``title``, ``category``, ``indicators``...)."""
+        index = BM25Index()
+        for dataset in datasets:
+            words = [
+                dataset.get("slug", "").replace("-", " ").replace("_", " "),
+                dataset.get("title") or "",
+                dataset.get("category") or "",
+                dataset.get("subcategory") or "",
+                dataset.get("description") or "",
+            ]
+            for indicator in dataset.get("indicators", []):
+                words.append(indicator.get("display_name") or "")
+                words.append((indicator.get("field_name") or "").replace("_", " "))
+            index.add(ngram_terms(" ".join(words)))
+        cls._catalog = datasets
+        cls._catalog_index = index
+        logger.info(f"Schema catalog index built for {len(datasets)} datasets")
+    
+    @classmethod
+    def select_schema(cls, prompt: str, filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Return only the tables, joins, sample queries and datasets relevant to a request.
+        
+        Candidate datasets come from BM25 over registry and indicator
+        metadata, restricted to the ``extra.category`` filter when set.
+        Government tables are chosen when any dataset matches; the legacy
+        municipal tables when none does or the prompt uses their vocabulary.
+        Without a loaded catalog the full schema is returned.
+        """
+        started = time.monotonic()
+        schema = cls.get_sanitized_schema()
+        category = ((filters or {}).get("extra") or {}).get("category")
+        
+        candidates: List[Dict[str, Any]] = []
+        if cls._catalog_index is not None:
+            terms = ngram_terms(f"{prompt} {category or ''}")
+            for doc_id, _ in cls._catalog_index.search(terms, len(cls._catalog)):
+                dataset = cls._catalog[doc_id]
+                if category and (dataset.get("category") or "").lower() != category.lower():
+                    continue
+                candidates.append(dataset)
+                if len(candidates) >= settings.schema_subset_max_datasets:
+                    break
+        
+        if cls._catalog_index is None:
+            tables: Set[str] = {table["name"] for table in schema["tables"]}
+        else:
+            tables = set(DIMENSION_TABLES)
+            prompt_words = set(prompt.lower().split())
+            if candidates or category:
+                tables.update(GOVERNMENT_TABLES)
+            if not candidates or prompt_words & LEGACY_TERMS:
+                tables.update(LEGACY_TABLES)
+        
+        subset = {
+            "tables": [table for table in schema["tables"] if table["name"] in tables],
+            "joins": [
+                join for join in schema["joins"]
+                if join["from"].split(".")[0] in tables and join["to"].split(".")[0] in tables
+            ],
+            "sample_queries": [
+                sample for sample in schema.get("sample_queries", [])
+                if any(f"FROM {table}" in sample["sql"] for table in tables)
+            ],
+            "candidate_datasets": [
+                {
+                    "id": dataset["id"],
+                    "slug": dataset["slug"],
+                    "title": dataset["title"],
+                    "category": dataset.get("category"),
+                    "indicators": [
+                        {key: indicator[key] for key in ("field_name", "display_name", "unit")}
+                        for indicator in dataset.get("indicators", [])[:settings.schema_subset_max_indicators]
+                    ],
+                }
+                for dataset in candidates
+            ],
+        }
+        subset["selection_ms"] = round((time.monotonic() - started) * 1000, 2)
+        return subset
+    
+    @staticmethod
+    def describe_tables(tables: List[Dict[str, Any]], joins: List[Dict[str, str]]) -> List[str]:
+        """Render one ``- table(col, col->table.col)`` line per table."""
+        foreign_keys = {join["from"]: join["to"] for join in joins}
+        lines = []
+        for table in tables:
+            columns = []
+            for column in table["columns"]:
+                target = foreign_keys.get(f"{table['name']}.{column['name']}")
+                columns.append(f"{column['name']}->{target}" if target else column["name"])
+            lines.append(f"- {table['name']}({', '.join(columns)})")
+        return lines
+    
+    @classmethod
+    def describe_subset(cls, subset: Dict[str, Any]) -> str:
+        """Render the subset's tables with their columns and join keys, and its candidate datasets."""
+        lines = [
+            "RELEVANT TABLES: " + ", ".join(table["name"] for table in subset["tables"])
+            + " (col->table.col marks a join key)"
+        ]
+        lines += cls.describe_tables(subset["tables"], subset["joins"])
+        if subset["candidate_datasets"]:
+            lines.append("CANDIDATE DATASETS (id, slug: title [category] -> indicator field_name=display name (unit)):")
+            for dataset in subset["candidate_datasets"]:
+                indicators = "; ".join(
+                    f"{indicator['field_name']}={indicator['display_name']}"
+                    + (f" ({indicator['unit']})" if indicator.get("unit") else "")
+                    for indicator in dataset["indicators"]
+                )
+                lines.append(f"- {dataset['id']}, {dataset['slug']}: {dataset['title']} [{dataset['category']}] -> {indicators}")
+        return "\n".join(lines)
@@ -0,0 +1,75 @@
+"""Coalescing of identical in-flight requests."""
+
+import asyncio
+import copy
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from core.logging import get_logger
+
+logger = get_logger(__name__)
+
+
+class SingleFlight:
+    """Run at most one call per key at a time; concurrent callers share its result.
+
+    The shared call runs as its own task, so a leader whose client goes away
+    does not cancel the work its followers are waiting on. Errors raised by
+    the call propagate to the leader and every follower.
+    """
+
+    def __init__(self):
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.follower_timeouts = 0
+        self.errors = 0
+
+    async def do(
+        self,
+        key: str,
+        func: Callable[[], Awaitable[Any]],
+        timeout: Optional[float] = None
+    ) -> Tuple[Any, bool]:
+        """Return ``(result, coalesced)`` for ``func``, sharing any identical call in flight.
+
+        Followers get a deep copy of the result so callers can mutate it
+        freely; ``timeout`` bounds how long a follower waits.
+        """
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            logger.info(f"Coalescing request onto in-flight call ({self.coalesced} total)")
+            try:
+                result = await asyncio.wait_for(asyncio.shield(task), timeout)
+            except asyncio.TimeoutError:
+                self.follower_timeouts += 1
+                raise
+            return copy.deepcopy(result), True
+
+        self.leaders += 1
+        task = asyncio.create_task(func())
+        self._in_flight[key] = task
+        task.add_done_callback(lambda done: self._forget(key, done))
+        return await asyncio.shield(task), False
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if not task.cancelled() and task.exception() is not None:
+            self.errors += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return leader/follower counters."""
+        total = self.leaders + self.coalesced
+        return {
+            "in_flight": len(self._in_flight),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "coalesced_ratio": round(self.coalesced / total, 3) if total else 0.0,
+            "follower_timeouts": self.follower_timeouts,
+            "errors": self.errors,
+        }
+
+
+# Global instance for /api/insights
+insight_flights = SingleFlight()
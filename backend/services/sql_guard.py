@@ -1,10 +1,14 @@
 """SQL validation and safety mechanisms."""
 
-import re
-from typing import List, Set
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Set, Tuple
 from sqlalchemy import text
 from core.config import settings
 from core.logging import get_logger
+from services.sql_parser import LITERAL_KINDS, SQLParseError, Token, fingerprint, parse, tokenize
 
 logger = get_logger(__name__)
 
@@ -14,122 +18,455 @@ class SQLGuardError(Exception):
     pass
 
 
+# Every column of every public table the connected role may SELECT from
+REFLECT_COLUMNS_SQL = """
+SELECT c.table_name, c.column_name
+FROM information_schema.columns c
+WHERE c.table_schema = 'public'
+  AND has_table_privilege(
+      current_user, quote_ident(c.table_schema) || '.' || quote_ident(c.table_name), 'SELECT'
+  )
+ORDER BY c.table_name, c.ordinal_position
+"""
+
+
+@lru_cache(maxsize=1)
+def catalog_columns() -> Dict[str, Set[str]]:
+    """Return the tables shown to the LLM with their columns from the ORM models.
+
+    This is the fallback catalog until the database has been reflected.
+    """
+    from db.models import Base
+    from db.models_extended import Base as ExtendedBase
+    from services.schema import SchemaService
+
+    # The LLM's schema only describes the most useful columns; the models list them all
+    model_tables = {**Base.metadata.tables, **ExtendedBase.metadata.tables}
+    catalog = {}
+    for table in SchemaService.get_sanitized_schema()["tables"]:
+        columns = {column["name"] for column in table["columns"]}
+        if table["name"] in model_tables:
+            columns |= {column.name for column in model_tables[table["name"]].columns}
+        catalog[table["name"]] = columns
+    return catalog
+
+
+class StatementCache:
+    """Thread-safe LRU of validated statement templates keyed by fingerprint."""
+
+    def __init__(self, max_entries: Optional[int] = None):
+        self.max_entries = max_entries or settings.sql_guard_cache_size
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            template = self._entries.get(key)
+            if template is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return template
+
+    def put(self, key: str, template: Dict[str, Any]) -> None:
+        with self._lock:
+            self._entries[key] = template
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+# Global instance shared by every guard that checks against the default catalog
+statement_cache = StatementCache()
+
+
+class TableCatalog:
+    """Tables and columns the read-only role can query, reflected from the database.
+
+    The reflected catalog is swapped in whole and cached until the next
+    refresh; cached statement verdicts are dropped whenever it changes.
+    Until the first successful refresh the ORM-based catalog is used.
+    """
+
+    def __init__(self):
+        self._columns: Optional[Dict[str, Set[str]]] = None
+        self.version: Optional[str] = None
+        self.refreshes = 0
+        self.changes = 0
+
+    def get_columns(self) -> Dict[str, Set[str]]:
+        columns = self._columns
+        return columns if columns is not None else catalog_columns()
+
+    def refresh(self) -> bool:
+        """Reflect the read-only role's tables and columns; returns True if the catalog changed."""
+        from db.session import readonly_engine
+
+        with readonly_engine.connect() as conn:
+            rows = conn.execute(text(REFLECT_COLUMNS_SQL)).all()
+        return self.load(rows)
+
+    def load(self, rows: List[Tuple[str, str]]) -> bool:
+        """Install a catalog from ``(table, column)`` rows; returns True if it changed."""
+        excluded = set(settings.sql_guard_excluded_tables)
+        columns: Dict[str, Set[str]] = {}
+        for table, column in rows:
+            if table not in excluded:
+                columns.setdefault(table, set()).add(column)
+        version = hashlib.sha256(
+            repr(sorted((table, sorted(names)) for table, names in columns.items())).encode()
+        ).hexdigest()[:16]
+
+        self.refreshes += 1
+        if version == self.version:
+            return False
+        self._columns = columns
+        self.version = version
+        self.changes += 1
+        # Verdicts cached against the old catalog may now be wrong either way
+        statement_cache.clear()
+        logger.info(f"SQL guard catalog reflected: {len(columns)} tables (version {version})")
+        return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "source": "reflected" if self._columns is not None else "models",
+            "version": self.version,
+            "tables": len(self.get_columns()),
+            "refreshes": self.refreshes,
+            "changes": self.changes,
+        }
+
+
+# Global instance refreshed on startup and by the data version watcher
+table_catalog = TableCatalog()
+
+
 class SQLGuard:
-    """SQL validation and safety guard."""
-    
-    # Allowed table names
-    ALLOWED_TABLES: Set[str] = {
-        "fact_measure",
-        "dim_time", 
-        "dim_geo",
-        "dim_indicator"
-    }
-    
+    """SQL validation and safety guard.
+
+    Statements are tokenized and parsed, table references are resolved
+    through CTE and subquery scopes, and every table and column must exist
+    in the catalog. A validated statement is stored as a template keyed by
+    its literal-stripped fingerprint, so later statements of the same shape
+    only need tokenizing.
+    """
+
     # Forbidden SQL keywords (DDL/DML operations)
     FORBIDDEN_KEYWORDS: Set[str] = {
-        "INSERT", "UPDATE", "DELETE", "DROP", "ALTER", "CREATE", 
+        "INSERT", "UPDATE", "DELETE", "DROP", "ALTER", "CREATE",
         "GRANT", "REVOKE", "TRUNCATE", "REPLACE", "MERGE"
     }
-    
-    # Allowed SQL keywords (DQL operations)
-    ALLOWED_KEYWORDS: Set[str] = {
-        "SELECT", "WITH", "FROM", "WHERE", "JOIN", "INNER", "LEFT", 
-        "RIGHT", "OUTER", "ON", "AS", "AND", "OR", "NOT", "IN", 
-        "EXISTS", "BETWEEN", "LIKE", "ORDER", "BY", "GROUP", "HAVING",
-        "LIMIT", "OFFSET", "UNION", "INTERSECT", "EXCEPT", "CASE", 
-        "WHEN", "THEN", "ELSE", "END", "DISTINCT", "ALL", "ANY", "SOME"
+
+    # Set-returning functions allowed in FROM
+    TABLE_FUNCTIONS: Set[str] = {"generate_series", "unnest"}
+
+    # Functions allowed anywhere in an expression. Everything else is refused:
+    # server functions such as query_to_xml, pg_read_file, lo_import, dblink
+    # or set_config would run other SQL, touch the host or change settings
+    FUNCTIONS: Set[str] = TABLE_FUNCTIONS | {
+        # Aggregates and ordered-set aggregates
+        "count", "sum", "avg", "min", "max", "stddev", "stddev_pop", "stddev_samp",
+        "variance", "var_pop", "var_samp", "corr", "covar_pop", "covar_samp",
+        "regr_slope", "regr_intercept", "regr_r2", "array_agg", "string_agg",
+        "bool_and", "bool_or", "every", "percentile_cont", "percentile_disc", "mode",
+        "grouping",
+        # Window functions
+        "row_number", "rank", "dense_rank", "percent_rank", "cume_dist", "ntile",
+        "lag", "lead", "first_value", "last_value", "nth_value",
+        # Math
+        "abs", "ceil", "ceiling", "floor", "round", "trunc", "sqrt", "cbrt", "power",
+        "pow", "exp", "ln", "log", "log10", "mod", "sign", "div", "width_bucket",
+        # Conditionals
+        "coalesce", "nullif", "greatest", "least",
+        # Strings
+        "lower", "upper", "initcap", "length", "char_length", "character_length",
+        "trim", "btrim", "ltrim", "rtrim", "substring", "substr", "position", "strpos",
+        "replace", "concat", "concat_ws", "left", "right", "lpad", "rpad", "split_part",
+        "starts_with", "reverse", "repeat", "regexp_replace", "regexp_match",
+        "to_char", "to_number", "format",
+        # Dates and times
+        "extract", "date_part", "date_trunc", "age", "now", "make_date",
+        "make_interval", "to_date", "to_timestamp", "justify_days", "justify_interval",
+        # Arrays and JSON
+        "array_length", "cardinality", "array_to_string", "string_to_array",
+        "json_build_object", "jsonb_build_object", "json_build_array", "json_agg",
+        "jsonb_agg",
     }
-    
-    def __init__(self):
+
+    def __init__(self, allowed_columns: Optional[Dict[str, Set[str]]] = None):
         self.max_rows = settings.max_rows_returned
-        
+        if allowed_columns is None:
+            self.allowed_columns = table_catalog.get_columns()
+            self.cache = statement_cache
+        else:
+            # A custom catalog must not share cached verdicts with the default one
+            self.allowed_columns = allowed_columns
+            self.cache = StatementCache()
+
     def validate_and_sanitize(self, query: str) -> text:
         """Validate SQL query and return sanitized version."""
         if not query or not query.strip():
             raise SQLGuardError("Query cannot be empty")
-        
-        # Normalize whitespace and remove comments
-        query = self._normalize_query(query)
-        
+
+        # Tokenizing drops comments and extra whitespace
+        try:
+            tokens = tokenize(query)
+        except SQLParseError as e:
+            raise SQLGuardError(f"Could not parse query: {e}")
+        if tokens and tokens[-1].kind == "punct" and tokens[-1].text == ";":
+            tokens = tokens[:-1]
+        if not tokens:
+            raise SQLGuardError("Query cannot be empty")
+
+        key = fingerprint(tokens)
+        template = self.cache.get(key)
+        if template is None:
+            template = self._validate(tokens)
+            self.cache.put(key, template)
+
+        return text(self._render(template, tokens))
+
+    def _validate(self, tokens: List[Token]) -> Dict[str, Any]:
+        """Run every check on a statement not seen before and return its template."""
         # Check for forbidden keywords
-        self._check_forbidden_keywords(query)
-        
-        # Validate table names
-        self._validate_table_names(query)
-        
+        self._check_forbidden_keywords(tokens)
+
         # Ensure query starts with SELECT or WITH
-        self._validate_query_type(query)
-        
+        self._validate_query_type(tokens)
+
+        try:
+            statement = parse(tokens)
+        except SQLParseError as e:
+            raise SQLGuardError(f"Could not parse query: {e}")
+
+        # Validate table and column references
+        self._validate_references(statement)
+
         # Add LIMIT if not present
-        query = self._ensure_limit(query)
-        
-        return text(query)
-    
-    def _normalize_query(self, query: str) -> str:
-        """Normalize query by removing comments and extra whitespace."""
-        # Remove SQL comments
-        query = re.sub(r'--.*$', '', query, flags=re.MULTILINE)
-        query = re.sub(r'/\*.*?\*/', '', query, flags=re.DOTALL)
-        
-        # Normalize whitespace
-        query = ' '.join(query.split())
-        
-        return query.strip()
-    
-    def _check_forbidden_keywords(self, query: str) -> None:
-        """Check for forbidden SQL keywords."""
-        # Extract keywords (words that are not quoted)
-        keywords = re.findall(r'\b[A-Za-z_][A-Za-z0-9_]*\b', query.upper())
-        
-        forbidden_found = [kw for kw in keywords if kw in self.FORBIDDEN_KEYWORDS]
+        return self._build_template(tokens, statement)
+
+    def _check_forbidden_keywords(self, tokens: List[Token]) -> None:
+        """Check for forbidden SQL keywords outside string literals and quoted names."""
+        forbidden_found = [
+            token.text.upper() for token in tokens
+            if token.kind == "ident" and token.text.upper() in self.FORBIDDEN_KEYWORDS
+        ]
         if forbidden_found:
             raise SQLGuardError(f"Forbidden SQL keywords detected: {forbidden_found}")
-    
-    def _validate_table_names(self, query: str) -> None:
-        """Validate that only allowed tables are referenced."""
-        # Extract table names after FROM and JOIN keywords
-        from_pattern = r'\bFROM\s+([A-Za-z_][A-Za-z0-9_]*)'
-        join_pattern = r'\bJOIN\s+([A-Za-z_][A-Za-z0-9_]*)'
-        
-        from_tables = re.findall(from_pattern, query, re.IGNORECASE)
-        join_tables = re.findall(join_pattern, query, re.IGNORECASE)
-        
-        all_tables = set(from_tables + join_tables)
-        
-        # Convert to lowercase for comparison
-        all_tables = {table.lower() for table in all_tables}
-        
-        disallowed_tables = all_tables - self.ALLOWED_TABLES
-        if disallowed_tables:
-            raise SQLGuardError(f"Access to tables not allowed: {disallowed_tables}")
-    
-    def _validate_query_type(self, query: str) -> None:
+
+    def _validate_query_type(self, tokens: List[Token]) -> None:
         """Ensure query is a valid SELECT or WITH statement."""
-        query_upper = query.upper().strip()
-        
-        if not (query_upper.startswith('SELECT') or query_upper.startswith('WITH')):
+        if tokens[0].kind != "ident" or tokens[0].value not in ("select", "with"):
             raise SQLGuardError("Only SELECT and WITH queries are allowed")
-    
-    def _ensure_limit(self, query: str) -> str:
-        """Add LIMIT clause if not present."""
-        query_upper = query.upper()
-        
-        # Check if LIMIT is already present
-        if 'LIMIT' in query_upper:
-            # Extract the limit value and ensure it's not too high
-            limit_match = re.search(r'\bLIMIT\s+(\d+)', query_upper)
-            if limit_match:
-                limit_value = int(limit_match.group(1))
-                if limit_value > self.max_rows:
-                    # Replace with our max limit
-                    query = re.sub(
-                        r'\bLIMIT\s+\d+', 
-                        f'LIMIT {self.max_rows}', 
-                        query, 
-                        flags=re.IGNORECASE
-                    )
-        else:
-            # Add LIMIT clause
+
+    def _validate_references(self, statement: Dict[str, Any]) -> None:
+        """Validate that only allowed tables and their existing columns are referenced."""
+        problems = {"tables": set(), "functions": set(), "calls": set(), "columns": set()}
+        self._check_query(statement, {}, [], problems)
+
+        if problems["tables"]:
+            raise SQLGuardError(f"Access to tables not allowed: {problems['tables']}")
+        if problems["functions"]:
+            raise SQLGuardError(f"Table functions not allowed: {sorted(problems['functions'])}")
+        if problems["calls"]:
+            raise SQLGuardError(f"Functions not allowed: {sorted(problems['calls'])}")
+        if problems["columns"]:
+            raise SQLGuardError(f"Unknown columns referenced: {sorted(problems['columns'])}")
+
+    def _check_query(
+        self,
+        query: Dict[str, Any],
+        ctes: Dict[str, Optional[Set[str]]],
+        outer: List[Dict[str, Any]],
+        problems: Dict[str, Set[str]]
+    ) -> Optional[List[str]]:
+        """Check a query and return its output column names (None when unknown)."""
+        ctes = dict(ctes)
+        for cte in query["ctes"]:
+            declared = set(cte["columns"]) if cte["columns"] else None
+            if query["recursive"]:
+                # The recursive term sees the CTE itself
+                ctes[cte["name"]] = declared
+            columns = self._check_query(cte["query"], ctes, outer, problems)
+            ctes[cte["name"]] = declared if declared is not None else (set(columns) if columns is not None else None)
+
+        output = None
+        frame = None
+        for index, term in enumerate(query["body"]):
+            if term["type"] == "query":
+                columns, term_frame = self._check_query(term, ctes, outer, problems), None
+            elif term["type"] == "values":
+                for expr in term["exprs"]:
+                    self._check_expr(expr, outer, ctes, problems)
+                # Postgres names VALUES columns column1, column2, ...
+                columns, term_frame = [f"column{index + 1}" for index in range(term["width"])], None
+            else:
+                columns, term_frame = self._check_select(term, ctes, outer, problems)
+            if index == 0:
+                output, frame = columns, term_frame
+
+        if query["order_by"] is not None:
+            if len(query["body"]) > 1 or frame is None:
+                # ORDER BY of a set operation sees only the output columns
+                frame = {"sources": {} if output is not None else {"": None}, "outputs": set(output or [])}
+            self._check_expr(query["order_by"], [frame] + outer, ctes, problems)
+        for expr in query["tail"]:
+            self._check_expr(expr, outer, ctes, problems)
+        return output
+
+    def _check_select(
+        self,
+        select: Dict[str, Any],
+        ctes: Dict[str, Optional[Set[str]]],
+        outer: List[Dict[str, Any]],
+        problems: Dict[str, Set[str]]
+    ) -> Tuple[Optional[List[str]], Dict[str, Any]]:
+        """Check one SELECT and return its output columns and name scope."""
+        frame = {"sources": {}, "outputs": set()}
+        for source in select["sources"]:
+            if source["kind"] == "table":
+                name, schema = source["name"], source["schema"]
+                if schema is None and name in ctes:
+                    columns = ctes[name]
+                elif schema in (None, "public") and name in self.allowed_columns:
+                    columns = self.allowed_columns[name]
+                else:
+                    problems["tables"].add(f"{schema}.{name}" if schema else name)
+                    columns = None
+            elif source["kind"] == "subquery":
+                scope = [frame] + outer if source["lateral"] else outer
+                output = self._check_query(source["query"], ctes, scope, problems)
+                columns = set(output) if output is not None else None
+            else:
+                name, schema = source["name"], source["schema"]
+                if schema is not None or name not in self.TABLE_FUNCTIONS:
+                    problems["functions"].add(f"{schema}.{name}" if schema else name)
+                self._check_expr(source["args"], [frame] + outer, ctes, problems)
+                columns = None
+            if source["columns"]:
+                columns = set(source["columns"])
+            frame["sources"][source["alias"] or source["name"]] = columns
+
+        outputs: Optional[List[str]] = []
+        for item in select["items"]:
+            if item["star"] is not None:
+                starred = [
+                    columns for alias, columns in frame["sources"].items()
+                    if item["star"] in ("", alias)
+                ]
+                if item["star"] and not starred:
+                    problems["columns"].add(f"{item['star']}.*")
+                if outputs is None or any(columns is None for columns in starred):
+                    outputs = None
+                else:
+                    outputs.extend(sorted(set().union(*starred)))
+            elif item["alias"] or item["column"]:
+                if outputs is not None:
+                    outputs.append(item["alias"] or item["column"])
+            else:
+                outputs = None
+
+        scope = [frame] + outer
+        for item in select["items"]:
+            self._check_expr(item["expr"], scope, ctes, problems)
+        # Output names are visible to GROUP BY and ORDER BY
+        frame["outputs"] = {item["alias"] or item["column"] for item in select["items"] if item["alias"] or item["column"]}
+        for expr in select["exprs"]:
+            self._check_expr(expr, scope, ctes, problems)
+        return outputs, frame
+
+    def _check_expr(
+        self,
+        expr: Dict[str, Any],
+        scope: List[Dict[str, Any]],
+        ctes: Dict[str, Optional[Set[str]]],
+        problems: Dict[str, Set[str]]
+    ) -> None:
+        """Check an expression's column references against the frames in scope, innermost first."""
+        for subquery in expr["subqueries"]:
+            self._check_query(subquery, ctes, scope, problems)
+
+        for schema, name in expr["functions"]:
+            if schema is not None or name not in self.FUNCTIONS:
+                problems["calls"].add(f"{schema}.{name}" if schema else name)
+
+        for qualifier, column in expr["refs"]:
+            if qualifier is not None:
+                frame = next((frame for frame in scope if qualifier in frame["sources"]), None)
+                if frame is None:
+                    problems["columns"].add(f"{qualifier}.{column}")
+                    continue
+                columns = frame["sources"][qualifier]
+                if columns is not None and column not in columns:
+                    problems["columns"].add(f"{qualifier}.{column}")
+                continue
+
+            known = False
+            for frame in scope:
+                if column in frame["outputs"]:
+                    known = True
+                    break
+                # A source with unknown columns could provide any name
+                if any(columns is None or column in columns for columns in frame["sources"].values()):
+                    known = True
+                    break
+            if not known:
+                problems["columns"].add(column)
+
+    def _build_template(self, tokens: List[Token], statement: Dict[str, Any]) -> Dict[str, Any]:
+        """Turn a validated statement into text pieces and literal slots, with the row limit applied."""
+        limit = statement["limit"]
+        append_limit = limit is None or (limit["kind"] == "limit" and limit["count"] is None)
+        skip = range(limit["start"], limit["end"]) if limit is not None and append_limit else range(0)
+
+        pieces: List[Any] = []
+        literal = 0
+        limit_slot = None
+        for index, token in enumerate(tokens):
+            is_literal = token.kind in LITERAL_KINDS
+            if index in skip:
+                literal += is_literal
+                continue
+            prefix = " " if token.space and pieces else ""
+            if is_literal:
+                if prefix:
+                    pieces.append(prefix)
+                pieces.append(literal)
+                if limit is not None and index == limit["count"]:
+                    limit_slot = literal
+                literal += 1
+            elif pieces and isinstance(pieces[-1], str):
+                pieces[-1] += prefix + token.text
+            else:
+                pieces.append(prefix + token.text)
+
+        return {"pieces": pieces, "limit_slot": limit_slot, "append_limit": append_limit}
+
+    def _render(self, template: Dict[str, Any], tokens: List[Token]) -> str:
+        """Fill a template with this statement's literals and cap the row limit."""
+        literals = [token.text for token in tokens if token.kind in LITERAL_KINDS]
+        slot = template["limit_slot"]
+        if slot is not None and int(literals[slot]) > self.max_rows:
+            literals[slot] = str(self.max_rows)
+        query = "".join(piece if isinstance(piece, str) else literals[piece] for piece in template["pieces"])
+        if template["append_limit"]:
             query = f"{query} LIMIT {self.max_rows}"
-        
         return query
@@ -0,0 +1,527 @@
+"""Tokenizer and parser for the read-only SQL subset the agent may run.
+
+The parser understands SELECT statements with CTEs, set operations, joins,
+subqueries and the usual clauses, and produces a small AST of dicts:
+
+- query: ``{"type": "query", "ctes", "recursive", "body", "order_by", "limit",
+  "tail"}`` where ``body`` holds the set operation's terms (selects, VALUES
+  lists or nested queries) and ``tail`` the LIMIT/OFFSET expressions
+- select: ``{"type": "select", "items", "sources", "exprs"}``
+- values: ``{"type": "values", "width", "exprs"}`` for ``VALUES (...), (...)``
+- source: ``{"kind": "table" | "subquery" | "function", "name", "schema",
+  "query", "alias", "columns", "lateral"}``
+- expression: ``{"refs": [(qualifier, column)], "subqueries": [query],
+  "functions": [(schema, name)]}``
+
+Expressions are not parsed into operator trees; the guard only needs the
+column references, function calls and subqueries inside them.
+"""
+
+import re
+from collections import namedtuple
+from typing import Any, Dict, List, Optional, Set
+
+
+class SQLParseError(Exception):
+    """Exception raised when a statement is outside the supported SQL subset."""
+    pass
+
+
+# ``value`` is the lowercased word for identifiers, the unquoted name for quoted
+# identifiers and the text otherwise; ``space`` marks whitespace or a comment before it
+Token = namedtuple("Token", "kind text value space")
+
+LITERAL_KINDS = ("string", "number")
+
+TOKEN_RE = re.compile(r"""
+    (?P<space>\s+|--[^\n]*|/\*.*?\*/)
+  | (?P<string>'(?:[^']|'')*')
+  | (?P<qident>"(?:[^"]|"")+")
+  | (?P<number>(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?)
+  | (?P<ident>[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<op>::|<=|>=|<>|!=|\|\||=>|/(?!\*)|[-+*%<>=~!^&|#@])
+  | (?P<punct>[(),.;\[\]])
+""", re.VERBOSE | re.DOTALL)
+
+# Words that never name a column, so bare occurrences in expressions are skipped
+NON_COLUMN_WORDS: Set[str] = {
+    "select", "from", "where", "and", "or", "not", "in", "is", "null", "true", "false",
+    "case", "when", "then", "else", "end", "as", "on", "using", "distinct", "all", "any",
+    "some", "exists", "between", "symmetric", "like", "ilike", "similar", "escape", "cast",
+    "over", "partition", "by", "order", "group", "having", "limit", "offset", "fetch",
+    "asc", "desc", "nulls", "first", "last", "filter", "within", "interval", "array", "row",
+    "rows", "range", "groups", "unbounded", "preceding", "following", "current", "exclude",
+    "ties", "others", "no", "collate", "at", "time", "zone", "with", "without", "precision",
+    "varying", "both", "leading", "trailing", "for", "only", "next", "lateral", "natural",
+    "join", "inner", "left", "right", "full", "outer", "cross", "union", "intersect",
+    "except", "into", "recursive", "materialized", "ordinality", "values", "grouping",
+    "sets", "cube", "rollup", "window", "isnull", "notnull", "unknown", "current_date",
+    "current_time", "current_timestamp", "localtime", "localtimestamp", "current_user",
+    "session_user", "user", "default",
+}
+
+# Keywords that complete an operand, so a following name is an alias
+OPERAND_WORDS: Set[str] = {
+    "end", "null", "true", "false", "unknown", "current_date", "current_time", "current_timestamp",
+    "localtime", "localtimestamp", "current_user", "session_user", "user",
+}
+
+# Keywords that end a select list item or a WHERE/HAVING/GROUP BY expression
+CLAUSE_STOPS = {
+    "where", "group", "having", "window", "order", "limit", "offset", "fetch",
+    "union", "intersect", "except", ")", ";",
+}
+ITEM_STOPS = CLAUSE_STOPS | {",", "from", "as", "into"}
+JOIN_WORDS = {"join", "inner", "left", "right", "full", "cross", "natural"}
+ON_STOPS = CLAUSE_STOPS | JOIN_WORDS | {","}
+TAIL_STOPS = {"limit", "offset", "fetch", ")", ";"}
+SET_OPERATORS = {"union", "intersect", "except"}
+
+
+def tokenize(sql: str) -> List[Token]:
+    """Split ``sql`` into tokens, dropping whitespace and comments."""
+    tokens: List[Token] = []
+    position = 0
+    space = False
+    while position < len(sql):
+        match = TOKEN_RE.match(sql, position)
+        if match is None:
+            raise SQLParseError(f"Unsupported or unterminated token at position {position}: {sql[position:position + 20]!r}")
+        kind = match.lastgroup
+        text = match.group()
+        position = match.end()
+        if kind == "space":
+            space = True
+            continue
+        if kind == "string" and tokens and not space and tokens[-1].kind == "ident" and tokens[-1].value == "e":
+            # Backslash escapes would make Postgres end the string somewhere else
+            raise SQLParseError("Escape string literals (E'...') are not supported")
+        if kind == "ident":
+            value = text.lower()
+        elif kind == "qident":
+            value = text[1:-1].replace('""', '"')
+        else:
+            value = text
+        tokens.append(Token(kind, text, value, space))
+        space = False
+    return tokens
+
+
+def fingerprint(tokens: List[Token]) -> str:
+    """Return the statement's shape with literals stripped and unquoted words lowercased."""
+    parts = []
+    for token in tokens:
+        if token.kind == "string":
+            parts.append("?s")
+        elif token.kind == "number":
+            parts.append("?i" if token.text.isdigit() else "?n")
+        elif token.kind == "ident":
+            parts.append(token.value)
+        else:
+            parts.append(token.text)
+    return " ".join(parts)
+
+
+def parse(tokens: List[Token]) -> Dict[str, Any]:
+    """Parse one SELECT/WITH statement (an optional trailing ``;`` is allowed)."""
+    return _Parser(tokens).statement()
+
+
+def _expr_node() -> Dict[str, Any]:
+    return {"refs": [], "subqueries": [], "functions": []}
+
+
+class _Parser:
+    """Recursive-descent parser over a token list."""
+
+    def __init__(self, tokens: List[Token]):
+        self.tokens = tokens
+        self.pos = 0
+
+    # Token helpers
+
+    def peek(self, offset: int = 0) -> Optional[Token]:
+        index = self.pos + offset
+        return self.tokens[index] if index < len(self.tokens) else None
+
+    def is_word(self, words, offset: int = 0) -> bool:
+        token = self.peek(offset)
+        if token is None or token.kind != "ident":
+            return False
+        return token.value == words if isinstance(words, str) else token.value in words
+
+    def is_punct(self, text: str, offset: int = 0) -> bool:
+        token = self.peek(offset)
+        return token is not None and token.kind == "punct" and token.text == text
+
+    def accept(self, word: str) -> bool:
+        if self.is_word(word) or self.is_punct(word):
+            self.pos += 1
+            return True
+        return False
+
+    def expect(self, word: str) -> None:
+        if not self.accept(word):
+            token = self.peek()
+            found = token.text if token else "end of query"
+            raise SQLParseError(f"Expected {word.upper()} but found {found!r}")
+
+    def name(self) -> str:
+        token = self.peek()
+        if token is None or token.kind not in ("ident", "qident"):
+            raise SQLParseError(f"Expected a name but found {token.text if token else 'end of query'!r}")
+        self.pos += 1
+        return token.value
+
+    def starts_query(self, offset: int = 0) -> bool:
+        return self.is_word(("select", "with", "values"), offset)
+
+    # Statements and queries
+
+    def statement(self) -> Dict[str, Any]:
+        query = self.query()
+        self.accept(";")
+        if self.peek() is not None:
+            raise SQLParseError(f"Unexpected {self.peek().text!r}; only one statement is allowed")
+        return query
+
+    def query(self) -> Dict[str, Any]:
+        query = {"type": "query", "ctes": [], "recursive": False, "body": [], "order_by": None, "limit": None,
+                 "tail": []}
+        if self.accept("with"):
+            query["recursive"] = self.accept("recursive")
+            while True:
+                query["ctes"].append(self.cte())
+                if not self.accept(","):
+                    break
+
+        query["body"].append(self.set_term())
+        while self.is_word(SET_OPERATORS):
+            self.pos += 1
+            self.accept("all") or self.accept("distinct")
+            query["body"].append(self.set_term())
+
+        if self.accept("order"):
+            self.expect("by")
+            query["order_by"] = self.expr(TAIL_STOPS)
+        self.tail(query)
+        return query
+
+    def cte(self) -> Dict[str, Any]:
+        name = self.name()
+        columns = self.name_list() if self.is_punct("(") else None
+        self.expect("as")
+        self.accept("not")
+        self.accept("materialized")
+        self.expect("(")
+        query = self.query()
+        self.expect(")")
+        return {"name": name, "columns": columns, "query": query}
+
+    def tail(self, query: Dict[str, Any]) -> None:
+        """Parse LIMIT, OFFSET and FETCH, remembering where the row limit sits."""
+        while True:
+            start = self.pos
+            if self.accept("limit"):
+                count = None
+                if self.accept("all"):
+                    pass
+                elif self.peek() is not None and self.peek().kind == "number" and self.peek().text.isdigit() \
+                        and (self.peek(1) is None or self.is_word(("offset", "fetch"), 1) or self.is_punct(")", 1) or self.is_punct(";", 1)):
+                    count = self.pos
+                    self.pos += 1
+                else:
+                    query["tail"].append(self.expr(TAIL_STOPS))
+                query["limit"] = {"kind": "limit", "start": start, "end": self.pos, "count": count}
+            elif self.accept("offset"):
+                query["tail"].append(self.expr(TAIL_STOPS | {"row", "rows"}))
+                self.accept("row") or self.accept("rows")
+            elif self.accept("fetch"):
+                self.accept("first") or self.accept("next")
+                count = None
+                if self.peek() is not None and self.peek().kind == "number" and self.peek().text.isdigit():
+                    count = self.pos
+                    self.pos += 1
+                self.accept("row") or self.accept("rows")
+                if not self.accept("only"):
+                    self.expect("with")
+                    self.expect("ties")
+                query["limit"] = {"kind": "fetch", "start": start, "end": self.pos, "count": count}
+            else:
+                return
+
+    def set_term(self) -> Dict[str, Any]:
+        if self.is_punct("("):
+            self.pos += 1
+            query = self.query()
+            self.expect(")")
+            return query
+        if self.is_word("values"):
+            return self.values()
+        return self.select()
+
+    def values(self) -> Dict[str, Any]:
+        """Parse ``VALUES (...), (...)`` row lists."""
+        self.expect("values")
+        term = {"type": "values", "width": 0, "exprs": []}
+        while True:
+            self.expect("(")
+            width = 0
+            while True:
+                term["exprs"].append(self.expr({",", ")"}))
+                width += 1
+                if not self.accept(","):
+                    break
+            self.expect(")")
+            term["width"] = max(term["width"], width)
+            if not self.accept(","):
+                return term
+
+    def select(self) -> Dict[str, Any]:
+        self.expect("select")
+        select = {"type": "select", "items": [], "sources": [], "exprs": []}
+        if self.accept("distinct"):
+            if self.accept("on"):
+                self.expect("(")
+                select["exprs"].append(self.expr({")"}))
+                self.expect(")")
+        else:
+            self.accept("all")
+
+        while True:
+            select["items"].append(self.item())
+            if not self.accept(","):
+                break
+        if self.is_word("into"):
+            raise SQLParseError("SELECT INTO is not allowed")
+
+        if self.accept("from"):
+            while True:
+                self.from_item(select)
+                if not self.accept(","):
+                    break
+        if self.accept("where"):
+            select["exprs"].append(self.expr(CLAUSE_STOPS))
+        if self.accept("group"):
+            self.expect("by")
+            select["exprs"].append(self.expr(CLAUSE_STOPS))
+        if self.accept("having"):
+            select["exprs"].append(self.expr(CLAUSE_STOPS))
+        if self.accept("window"):
+            while True:
+                self.name()
+                self.expect("as")
+                self.expect("(")
+                select["exprs"].append(self.expr({")"}))
+                self.expect(")")
+                if not self.accept(","):
+                    break
+        return select
+
+    def item(self) -> Dict[str, Any]:
+        """Parse one select list entry into its expression, alias, column name and star."""
+        item = {"expr": None, "alias": None, "column": None, "star": None}
+        start = self.pos
+        token = self.peek()
+        if token is not None and token.text == "*" and token.kind == "op":
+            self.pos += 1
+            item["star"] = ""
+            item["expr"] = _expr_node()
+            return item
+        if token is not None and token.kind in ("ident", "qident") and self.is_punct(".", 1) \
+                and self.peek(2) is not None and self.peek(2).text == "*":
+            self.pos += 3
+            item["star"] = token.value
+            item["expr"] = _expr_node()
+            return item
+
+        expr = self.expr(ITEM_STOPS, item=True)
+        item["alias"] = expr.pop("alias", None)
+        if self.accept("as"):
+            item["alias"] = self.name()
+        item["expr"] = expr
+
+        # A bare column keeps its name as the output column name
+        span = self.tokens[start:self.pos]
+        if item["alias"] is None and len(expr["refs"]) == 1 and not expr["subqueries"]:
+            if len(span) == 1 or (len(span) == 3 and span[1].text == "."):
+                item["column"] = expr["refs"][0][1]
+        return item
+
+    def from_item(self, select: Dict[str, Any]) -> None:
+        self.primary(select)
+        while True:
+            natural = self.accept("natural")
+            if self.accept("cross"):
+                self.expect("join")
+            elif self.is_word(("left", "right", "full")):
+                self.pos += 1
+                self.accept("outer")
+                self.expect("join")
+            elif self.accept("inner"):
+                self.expect("join")
+            elif not self.accept("join"):
+                if natural:
+                    raise SQLParseError("Expected JOIN after NATURAL")
+                return
+            self.primary(select)
+            if self.accept("on"):
+                select["exprs"].append(self.expr(ON_STOPS))
+            elif self.accept("using"):
+                expr = _expr_node()
+                expr["refs"] = [(None, column) for column in self.name_list()]
+                select["exprs"].append(expr)
+
+    def primary(self, select: Dict[str, Any]) -> None:
+        """Parse a table, subquery, table function or parenthesized join into ``select["sources"]``."""
+        lateral = self.accept("lateral")
+        source = {"kind": "table", "name": None, "schema": None, "query": None, "alias": None,
+                  "columns": None, "lateral": lateral, "args": None}
+        if self.is_punct("("):
+            if self.starts_query(1):
+                self.pos += 1
+                source["kind"] = "subquery"
+                source["query"] = self.query()
+                self.expect(")")
+            else:
+                self.pos += 1
+                self.from_item(select)
+                self.expect(")")
+                return
+        else:
+            source["name"] = self.name()
+            if self.accept("."):
+                source["schema"], source["name"] = source["name"], self.name()
+            if self.is_punct("("):
+                source["kind"] = "function"
+                self.pos += 1
+                source["args"] = self.expr({")"})
+                self.expect(")")
+                if self.accept("with"):
+                    self.expect("ordinality")
+
+        if self.accept("as"):
+            source["alias"] = self.name()
+        else:
+            token = self.peek()
+            if token is not None and (token.kind == "qident" or (token.kind == "ident" and token.value not in NON_COLUMN_WORDS)):
+                source["alias"] = self.name()
+        if source["alias"] is not None and self.is_punct("("):
+            source["columns"] = self.name_list()
+        if source["kind"] == "subquery" and source["alias"] is None:
+            raise SQLParseError("Subquery in FROM must have an alias")
+        select["sources"].append(source)
+
+    def name_list(self) -> List[str]:
+        self.expect("(")
+        names = [self.name()]
+        while self.accept(","):
+            names.append(self.name())
+        self.expect(")")
+        return names
+
+    # Expressions
+
+    def expr(self, stops: Set[str], item: bool = False) -> Dict[str, Any]:
+        node = _expr_node()
+        self.scan(node, stops, item)
+        return node
+
+    def at_stop(self, stops: Set[str], previous: Optional[Token]) -> bool:
+        token = self.peek()
+        if token is None:
+            return True
+        if token.kind == "punct":
+            return token.text in stops
+        if token.kind != "ident" or token.value not in stops:
+            return False
+        if token.value in ("left", "right") and self.is_punct("(", 1):
+            # LEFT(...) and RIGHT(...) are string functions here
+            return False
+        if token.value == "from" and previous is not None and previous.value == "distinct":
+            # IS [NOT] DISTINCT FROM
+            return False
+        if token.value == "group" and previous is not None and previous.value == "within":
+            # Ordered-set aggregates: percentile_cont(0.5) WITHIN GROUP (ORDER BY ...)
+            return False
+        return True
+
+    def scan(self, node: Dict[str, Any], stops: Set[str], item: bool = False) -> None:
+        """Collect column references and subqueries until a stop word at this nesting level."""
+        previous: Optional[Token] = None
+        while not self.at_stop(stops, previous):
+            token = self.peek()
+            if token.kind == "punct" and token.text == "(":
+                self.pos += 1
+                if self.starts_query():
+                    node["subqueries"].append(self.query())
+                else:
+                    self.scan(node, {")"})
+                self.expect(")")
+                previous = Token("punct", ")", ")", False)
+                continue
+            if token.kind == "punct" and token.text in (")", ";"):
+                raise SQLParseError(f"Unbalanced {token.text!r}")
+
+            if token.kind in ("ident", "qident"):
+                self.word(node, token, previous, item)
+                previous = self.tokens[self.pos - 1]
+                continue
+
+            self.pos += 1
+            previous = token
+
+    def word(self, node: Dict[str, Any], token: Token, previous: Optional[Token], item: bool) -> None:
+        """Classify the identifier at the cursor and advance past it."""
+        following = self.peek(1)
+        after_operand = previous is not None and (
+            previous.kind in ("string", "number", "qident")
+            or (previous.kind == "ident" and (previous.value not in NON_COLUMN_WORDS or previous.value in OPERAND_WORDS))
+            or previous.text in (")", "]")
+        )
+        quoted_or_column = token.kind == "qident" or token.value not in NON_COLUMN_WORDS
+
+        if following is not None and following.kind == "punct" and following.text == "(":
+            self.pos += 1
+            type_name = previous is not None and (previous.text == "::" or previous.value == "as")
+            if (quoted_or_column or token.value in ("left", "right")) and not type_name:
+                # Keywords such as IN, EXISTS, OVER or CAST take parentheses too
+                node["functions"].append((None, token.value))
+            if token.value == "extract":
+                # EXTRACT(field FROM source): the field is not a column
+                self.pos += 2
+                self.scan(node, {")"})
+                self.expect(")")
+            return
+        if following is not None and following.kind == "punct" and following.text == ".":
+            parts = [token.value]
+            self.pos += 1
+            while self.is_punct("."):
+                self.pos += 1
+                nxt = self.peek()
+                if nxt is None:
+                    raise SQLParseError("Query ends after '.'")
+                self.pos += 1
+                parts.append(nxt.value)
+            if self.is_punct("("):
+                # schema-qualified function call
+                node["functions"].append((parts[-2], parts[-1]))
+                return
+            if parts[-1] != "*":
+                node["refs"].append((parts[-2], parts[-1]))
+            return
+
+        self.pos += 1
+        if previous is not None and (previous.text == "::" or previous.value in ("as", "over")):
+            # Type name, CAST target or named window
+            return
+        if following is not None and following.kind == "string":
+            # Typed literal such as DATE '2024-01-01'
+            return
+        if not quoted_or_column:
+            return
+        if after_operand:
+            if item:
+                node["alias"] = token.value
+            return
+        node["refs"].append((None, token.value))
@@ -0,0 +1,301 @@
+"""Question-pattern to parameterized-SQL templates learned from successful agent runs."""
+
+import re
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from core.config import settings
+from core.logging import get_logger
+from services.response_cache import canonicalize_filters, normalize_prompt
+
+logger = get_logger(__name__)
+
+# SQL string literals ('' escapes a quote) and bare four-digit years
+SQL_LITERAL_PATTERN = re.compile(r"'(?:[^']|'')*'|\b(?:19|20)\d{2}\b")
+YEAR_PATTERN = re.compile(r"^(?:19|20)\d{2}$")
+# Values we are willing to splice back into SQL
+SAFE_PLACE_PATTERN = re.compile(r"^[a-z0-9][a-z0-9 .\-]{0,60}$")
+SLOT_MARKER = "__SLOT_{}__"
+# Templates need some fixed wording besides their slots to be trusted
+MIN_LITERAL_WORDS = 2
+
+
+def _filter_values(filters: Dict[str, Any]) -> Dict[str, str]:
+    """Flatten place/time filters into ``{"place.district": "ranchi", ...}``."""
+    values = {}
+    for group in ("place", "time"):
+        for key, value in ((filters or {}).get(group) or {}).items():
+            if value not in (None, ""):
+                values[f"{group}.{key}"] = str(value).strip().lower()
+    return values
+
+
+def _restyle(value: str, original: str) -> str:
+    """Give a re-bound value the casing of the literal it replaces."""
+    if original.isupper():
+        return value.upper()
+    if original.istitle():
+        return value.title()
+    if original.islower():
+        return value.lower()
+    return value
+
+
+def _filter_shape(filters: Dict[str, Any]) -> str:
+    """Canonical filters with place/time values blanked, so re-bindable values do not split templates."""
+    shaped = {}
+    for group, values in (filters or {}).items():
+        if group in ("place", "time") and isinstance(values, dict):
+            shaped[group] = {key: "*" for key, value in values.items() if value not in (None, "")}
+        else:
+            shaped[group] = values
+    return canonicalize_filters(shaped)
+
+
+def _known(value: str, source: str, kind: str, vocabulary: Dict[str, Set[str]]) -> bool:
+    """Whether a slot value may be bound: filter values are trusted, prompt values must be real places/years."""
+    if kind == "year" and not YEAR_PATTERN.match(value):
+        return False
+    if source != "prompt":
+        return True
+    return value in vocabulary["years" if kind == "year" else "places"]
+
+
+class SQLTemplate:
+    """One learned question pattern with its parameterized SQL."""
+
+    def __init__(self, pattern: str, sql: str, slots: List[Dict[str, Any]], filter_shape: str):
+        self.pattern = pattern
+        self.sql = sql
+        # Each slot: {"kind": "place"|"year", "source": "prompt"|"<filter path>", "quoted": bool, "original": str}
+        self.slots = slots
+        self.filter_shape = filter_shape
+        regex = re.escape(pattern)
+        for index, slot in enumerate(slots):
+            if slot["source"] == "prompt" and "alias_of" not in slot:
+                group = r"(?P<s{}>(?:19|20)\d{{2}})" if slot["kind"] == "year" else r"(?P<s{}>[a-z0-9][a-z0-9 .\-]*?)"
+                regex = regex.replace(re.escape(f"{{{index}}}"), group.format(index), 1)
+        self.regex = re.compile(f"^{regex}$")
+        self.hits = 0
+
+    def bind(self, prompt: str, filters: Dict[str, Any], vocabulary: Dict[str, Set[str]]) -> Optional[str]:
+        """Return the SQL re-bound to ``prompt`` and ``filters``, or None if they do not fit.
+
+        Every value must be a known place or year (or come from the filters),
+        and years must keep the order they had in the learned SQL, so a
+        reversed range never produces ``BETWEEN 2022 AND 2018``.
+        """
+        match = self.regex.match(normalize_prompt(prompt))
+        if match is None:
+            return None
+        filter_values = _filter_values(filters)
+
+        values = []
+        for index, slot in enumerate(self.slots):
+            group = slot.get("alias_of", index)
+            value = match.group(f"s{group}") if slot["source"] == "prompt" else filter_values.get(slot["source"])
+            if value is None or not _known(value, slot["source"], slot["kind"], vocabulary):
+                return None
+            values.append(value)
+
+        years = [(slot["original"], value) for slot, value in zip(self.slots, values) if slot["kind"] == "year"]
+        for (original, value), (next_original, next_value) in zip(years, years[1:]):
+            if (original < next_original and value > next_value) or (original > next_original and value < next_value):
+                return None
+
+        sql = self.sql
+        for index, (slot, value) in enumerate(zip(self.slots, values)):
+            if slot["kind"] == "year":
+                literal = f"'{value}'" if slot["quoted"] else value
+            else:
+                if not SAFE_PLACE_PATTERN.match(value) or len(value.split()) > 4:
+                    return None
+                literal = "'" + _restyle(value, slot["original"]).replace("'", "''") + "'"
+                if slot["original_literal"].startswith("'%"):
+                    literal = "'%" + literal[1:]
+                if slot["original_literal"].endswith("%'"):
+                    literal = literal[:-1] + "%'"
+            sql = sql.replace(SLOT_MARKER.format(index), literal)
+        return sql
+
+
+def extract_template(
+    prompt: str,
+    filters: Dict[str, Any],
+    sql: str,
+    vocabulary: Dict[str, Set[str]]
+) -> Optional[SQLTemplate]:
+    """Turn a successful (prompt, filters, sql) triple into a re-bindable template.
+
+    Literals that equal a place/time filter, or that appear in the prompt and
+    are a known ``dim_geo`` name or year, become slots; everything else, such
+    as topic words, stays fixed. Queries that apply a place/time filter
+    without its literal value (e.g. ``year >= 2019`` for ``2019-01-01``) are
+    not learned.
+    """
+    pattern = normalize_prompt(prompt)
+    filter_values = _filter_values(filters)
+    slots: List[Dict[str, Any]] = []
+    # Slot index per (source, value), so a value used twice in the SQL binds once
+    slot_for: Dict[Tuple[str, str], int] = {}
+    pieces: List[str] = []
+    last = 0
+
+    for literal_match in SQL_LITERAL_PATTERN.finditer(sql):
+        literal = literal_match.group(0)
+        quoted = literal.startswith("'")
+        inner = literal[1:-1].replace("''", "'") if quoted else literal
+        bare = inner.strip("%")
+        value = bare.strip().lower()
+        if not value:
+            continue
+
+        kind = "year" if YEAR_PATTERN.match(value) else "place"
+        if kind == "place" and not SAFE_PLACE_PATTERN.match(value):
+            continue
+        word_pattern = rf"(?:^| ){re.escape(value)}(?: |$)"
+        if ("prompt", value) in slot_for or re.search(word_pattern, pattern):
+            source = "prompt"
+        else:
+            source = next((path for path, filter_value in filter_values.items() if filter_value == value), None)
+            if source is None:
+                continue
+        if not _known(value, source, kind, vocabulary):
+            continue
+
+        index = slot_for.get((source, value))
+        if index is None:
+            index = len(slots)
+            slot_for[(source, value)] = index
+            if source == "prompt":
+                pattern = re.sub(word_pattern, lambda m: m.group(0).replace(value, f"{{{index}}}"), pattern, count=1)
+            slots.append({"kind": kind, "source": source, "quoted": quoted, "original": bare, "original_literal": literal})
+        elif slots[index]["quoted"] != quoted or slots[index]["original_literal"] != literal:
+            # The same value spelled differently (e.g. with wildcards) gets its own rendering
+            index = len(slots)
+            slots.append({**slots[slot_for[(source, value)]], "quoted": quoted, "original": bare,
+                          "original_literal": literal, "alias_of": slot_for[(source, value)]})
+
+        pieces.append(sql[last:literal_match.start()])
+        pieces.append(SLOT_MARKER.format(index))
+        last = literal_match.end()
+    pieces.append(sql[last:])
+
+    # Filter values are blanked in the template key, so one the SQL does not bind would be replayed stale
+    unbound = set(filter_values) - {slot["source"] for slot in slots}
+    if unbound:
+        logger.debug(f"Not learning a template with unbound filters: {sorted(unbound)}")
+        return None
+    literal_words = [word for word in re.sub(r"\{\d+\}", " ", pattern).split() if word]
+    if len(literal_words) < MIN_LITERAL_WORDS:
+        return None
+    return SQLTemplate(pattern, "".join(pieces), slots, _filter_shape(filters))
+
+
+class SQLTemplateCache:
+    """Bounded LRU of learned SQL templates with hit-rate counters."""
+
+    def __init__(self, max_entries: int = None):
+        self.max_entries = max_entries or settings.sql_template_cache_max_entries
+        self._templates: "OrderedDict[Tuple[str, str], SQLTemplate]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.learned = 0
+        self.evictions = 0
+        self.failures = 0
+        self.rejected = 0
+        # Lowercased dim_geo names and years that prompt slots may bind to
+        self.vocabulary: Dict[str, Set[str]] = {"places": set(), "years": set()}
+
+    def match(self, prompt: str, filters: Dict[str, Any]) -> Optional[str]:
+        """Return re-bound SQL for the most recently used template that fits, or None."""
+        if not settings.sql_template_cache_enabled:
+            return None
+        shape = _filter_shape(filters)
+        for key in reversed(list(self._templates)):
+            template = self._templates[key]
+            if template.filter_shape != shape:
+                continue
+            sql = template.bind(prompt, filters, self.vocabulary)
+            if sql is None:
+                if template.regex.match(normalize_prompt(prompt)):
+                    self.rejected += 1
+            else:
+                template.hits += 1
+                self.hits += 1
+                self._templates.move_to_end(key)
+                logger.info(f"SQL template hit for pattern '{template.pattern}'")
+                return sql
+        self.misses += 1
+        return None
+
+    def learn(self, prompt: str, filters: Dict[str, Any], sql: str) -> None:
+        """Store the template for a successful query, evicting the least recently used."""
+        if not settings.sql_template_cache_enabled or not sql:
+            return
+        template = extract_template(prompt, filters, sql, self.vocabulary)
+        if template is None:
+            return
+        key = (template.pattern, template.filter_shape)
+        if key in self._templates:
+            self._templates.move_to_end(key)
+        else:
+            self.learned += 1
+        self._templates[key] = template
+        while len(self._templates) > self.max_entries:
+            self._templates.popitem(last=False)
+            self.evictions += 1
+
+    def forget(self, prompt: str, filters: Dict[str, Any]) -> None:
+        """Drop templates whose re-bound SQL failed for this prompt."""
+        self.failures += 1
+        shape = _filter_shape(filters)
+        for key, template in list(self._templates.items()):
+            if template.filter_shape == shape and template.bind(prompt, filters, self.vocabulary) is not None:
+                del self._templates[key]
+
+    def load_vocabulary(self, places: Iterable[str], years: Iterable[Any]) -> None:
+        """Set the place names and years that prompt values are checked against."""
+        self.vocabulary = {
+            "places": {str(place).strip().lower() for place in places if place},
+            "years": {str(year) for year in years if year is not None},
+        }
+        logger.info(
+            f"SQL template vocabulary: {len(self.vocabulary['places'])} places, {len(self.vocabulary['years'])} years"
+        )
+
+    def refresh_vocabulary(self) -> None:
+        """Load place names and years from ``dim_geo`` and ``dim_time`` (blocking)."""
+        from sqlalchemy import text
+        from db.session import readonly_engine
+
+        with readonly_engine.connect() as conn:
+            places = conn.execute(text(
+                "SELECT state FROM dim_geo UNION SELECT district FROM dim_geo "
+                "UNION SELECT zone FROM dim_geo UNION SELECT ward FROM dim_geo"
+            )).scalars().all()
+            years = conn.execute(text("SELECT DISTINCT year FROM dim_time")).scalars().all()
+        self.load_vocabulary(places, years)
+
+    def clear(self) -> None:
+        self._templates.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return size and hit-rate counters."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._templates),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "learned": self.learned,
+            "evictions": self.evictions,
+            "failures": self.failures,
+            "rejected_bindings": self.rejected,
+            "vocabulary": {kind: len(values) for kind, values in self.vocabulary.items()},
+        }
+
+
+# Global instance shared by agent runs on this worker
+sql_template_cache = SQLTemplateCache()
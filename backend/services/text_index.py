@@ -0,0 +1,66 @@
+"""Small in-process text retrieval helpers."""
+
+import math
+import re
+from typing import Dict, List, Tuple
+
+from services.response_cache import STOPWORDS
+
+
+def ngram_terms(text: str) -> List[str]:
+    """Unigrams and bigrams of the content words in ``text``."""
+    tokens = [token for token in re.findall(r"[a-z0-9]+", text.lower()) if token not in STOPWORDS]
+    return tokens + [f"{first}_{second}" for first, second in zip(tokens, tokens[1:])]
+
+
+class BM25Index:
+    """Incremental in-memory BM25 index over term lists."""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.doc_terms: List[Dict[str, int]] = []
+        self.doc_lengths: List[int] = []
+        self.doc_freq: Dict[str, int] = {}
+        self.postings: Dict[str, List[int]] = {}
+        self.removed = 0
+
+    def add(self, terms: List[str]) -> int:
+        """Index a document and return its position."""
+        counts: Dict[str, int] = {}
+        for term in terms:
+            counts[term] = counts.get(term, 0) + 1
+        doc_id = len(self.doc_terms)
+        self.doc_terms.append(counts)
+        self.doc_lengths.append(len(terms))
+        for term in counts:
+            self.doc_freq[term] = self.doc_freq.get(term, 0) + 1
+            self.postings.setdefault(term, []).append(doc_id)
+        return doc_id
+
+    def remove(self, doc_id: int) -> None:
+        """Stop scoring a document; its position is not reused."""
+        for term in self.doc_terms[doc_id]:
+            self.doc_freq[term] -= 1
+            self.postings[term].remove(doc_id)
+        self.doc_terms[doc_id] = {}
+        self.doc_lengths[doc_id] = 0
+        self.removed += 1
+
+    def search(self, terms: List[str], k: int) -> List[Tuple[int, float]]:
+        """Return up to ``k`` ``(doc_id, score)`` pairs with a positive score, best first."""
+        total = len(self.doc_terms) - self.removed
+        if total <= 0:
+            return []
+        average_length = sum(self.doc_lengths) / total or 1.0
+        scores: Dict[int, float] = {}
+        for term in set(terms):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id in postings:
+                frequency = self.doc_terms[doc_id][term]
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / average_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
@@ -0,0 +1,207 @@
+"""Token and cost accounting for LLM calls in a local SQLite ledger."""
+
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from core.config import settings
+from core.logging import get_logger
+
+logger = get_logger(__name__)
+
+# strftime formats for the rollup buckets
+BUCKETS = {
+    "minute": "%Y-%m-%dT%H:%M",
+    "hour": "%Y-%m-%dT%H:00",
+    "day": "%Y-%m-%d",
+}
+# Rollup dimensions and the ledger column each one groups by
+GROUP_COLUMNS = {
+    "model": "model",
+    "prompt_hash": "prompt_hash",
+    "request": "request_id",
+    "stage": "stage",
+}
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS llm_usage (
+    ts REAL NOT NULL,
+    request_id TEXT NOT NULL,
+    prompt_hash TEXT NOT NULL,
+    model TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    prompt_tokens INTEGER NOT NULL,
+    completion_tokens INTEGER NOT NULL,
+    cost_usd REAL,
+    latency_ms INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_llm_usage_ts ON llm_usage (ts);
+"""
+
+INSERT_SQL = """
+INSERT INTO llm_usage (
+    ts, request_id, prompt_hash, model, stage, prompt_tokens, completion_tokens, cost_usd, latency_ms
+) VALUES (:ts, :request_id, :prompt_hash, :model, :stage, :prompt_tokens, :completion_tokens, :cost_usd, :latency_ms)
+"""
+
+
+def estimate_cost(model: str, usage: Dict[str, Any]) -> Optional[float]:
+    """Return the call's cost in USD: OpenRouter's reported cost, else one from ``llm_model_prices``."""
+    if usage.get("cost") is not None:
+        return float(usage["cost"])
+    prices = settings.llm_model_prices.get(model)
+    if not prices:
+        return None
+    prompt_price, completion_price = prices
+    tokens_cost = (usage.get("prompt_tokens") or 0) * prompt_price + (usage.get("completion_tokens") or 0) * completion_price
+    return tokens_cost / 1_000_000
+
+
+class UsageLedger:
+    """Buffered writer and rollup reader for the ``llm_usage`` table.
+
+    ``record`` only appends to an in-memory buffer, so it is safe on the
+    event loop; ``flush`` writes the buffer in one transaction and is meant
+    for the background flusher or an executor thread.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or settings.usage_ledger_path
+        self._buffer: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._initialized = False
+        self.recorded = 0
+        self.flushed = 0
+        self.flush_errors = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._initialized:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=5.0)
+        if not self._initialized:
+            # WAL lets every worker process append while others read rollups
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA_SQL)
+            self._initialized = True
+        return conn
+
+    def record(
+        self,
+        request_id: str,
+        prompt_hash: str,
+        model: str,
+        stage: str,
+        usage: Dict[str, Any],
+        latency_ms: int
+    ) -> Dict[str, Any]:
+        """Buffer one LLM call's token usage and cost; returns the recorded row."""
+        row = {
+            "ts": time.time(),
+            "request_id": request_id,
+            "prompt_hash": prompt_hash,
+            "model": model,
+            "stage": stage,
+            "prompt_tokens": usage.get("prompt_tokens") or 0,
+            "completion_tokens": usage.get("completion_tokens") or 0,
+            "cost_usd": estimate_cost(model, usage),
+            "latency_ms": latency_ms,
+        }
+        if settings.usage_ledger_enabled:
+            with self._lock:
+                self._buffer.append(row)
+                self.recorded += 1
+        return row
+
+    def flush(self) -> int:
+        """Write buffered rows and drop rows past the retention window; returns rows written."""
+        with self._lock:
+            rows, self._buffer = self._buffer, []
+        if not rows:
+            return 0
+        try:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.executemany(INSERT_SQL, rows)
+                    conn.execute(
+                        "DELETE FROM llm_usage WHERE ts < ?",
+                        (time.time() - settings.usage_retention_days * 86400,)
+                    )
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            self.flush_errors += 1
+            logger.warning(f"Dropping {len(rows)} LLM usage rows: {e}")
+            return 0
+        self.flushed += len(rows)
+        return len(rows)
+
+    def rollup(self, hours: float = 24.0, bucket: str = "hour", group_by: str = "model", limit: int = 100) -> Dict[str, Any]:
+        """Return token, cost and latency totals per time bucket and ``group_by`` key, costliest first."""
+        if bucket not in BUCKETS:
+            raise ValueError(f"bucket must be one of {sorted(BUCKETS)}")
+        if group_by not in GROUP_COLUMNS:
+            raise ValueError(f"group_by must be one of {sorted(GROUP_COLUMNS)}")
+        self.flush()
+        since = time.time() - hours * 3600
+        column = GROUP_COLUMNS[group_by]
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                f"SELECT strftime('{BUCKETS[bucket]}', ts, 'unixepoch') AS bucket, {column}, COUNT(*), "
+                "SUM(prompt_tokens), SUM(completion_tokens), SUM(cost_usd), AVG(latency_ms), MAX(latency_ms) "
+                f"FROM llm_usage WHERE ts >= ? GROUP BY bucket, {column} "
+                "ORDER BY bucket DESC, SUM(cost_usd) DESC, SUM(prompt_tokens + completion_tokens) DESC LIMIT ?",
+                (since, limit)
+            ).fetchall()
+            totals = conn.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT request_id), SUM(prompt_tokens), SUM(completion_tokens), "
+                "SUM(cost_usd), AVG(latency_ms) FROM llm_usage WHERE ts >= ?",
+                (since,)
+            ).fetchone()
+        finally:
+            conn.close()
+        return {
+            "hours": hours,
+            "bucket": bucket,
+            "group_by": group_by,
+            "totals": {
+                "calls": totals[0],
+                "requests": totals[1],
+                "prompt_tokens": totals[2] or 0,
+                "completion_tokens": totals[3] or 0,
+                "cost_usd": round(totals[4], 6) if totals[4] is not None else None,
+                "avg_latency_ms": round(totals[5]) if totals[5] is not None else None,
+            },
+            "rows": [
+                {
+                    "bucket": row[0],
+                    group_by: row[1],
+                    "calls": row[2],
+                    "prompt_tokens": row[3],
+                    "completion_tokens": row[4],
+                    "cost_usd": round(row[5], 6) if row[5] is not None else None,
+                    "avg_latency_ms": round(row[6]),
+                    "max_latency_ms": row[7],
+                }
+                for row in rows
+            ],
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": settings.usage_ledger_enabled,
+            "path": self.path,
+            "buffered": len(self._buffer),
+            "recorded": self.recorded,
+            "flushed": self.flushed,
+            "flush_errors": self.flush_errors,
+        }
+
+
+# Global instance shared by requests on this worker
+usage_ledger = UsageLedger()
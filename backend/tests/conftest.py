@@ -0,0 +1,11 @@
+"""Shared pytest fixtures."""
+
+import pytest
+
+from services.example_library import example_library
+
+
+@pytest.fixture(autouse=True)
+def isolated_example_library(tmp_path, monkeypatch):
+    """Keep learned few-shot examples out of the working tree during tests."""
+    monkeypatch.setattr(example_library, "path", str(tmp_path / "sql_examples.jsonl"))
@@ -0,0 +1,182 @@
+"""Tests for LLM admission control."""
+
+import asyncio
+import time
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import app as app_module
+from llm.admission import BATCH, INTERACTIVE, AdmissionRejected, LLMAdmission, current_lane
+from llm.agent import MunicipalAnalystAgent
+from llm.circuit_breaker import HALF_OPEN
+from llm.openrouter import OpenRouterClient
+
+
+def test_in_flight_limit_queues_until_release():
+    """Test that a call over max_in_flight waits for a release and its wait is recorded."""
+    admission = LLMAdmission(max_in_flight=1, rate_per_second=0)
+
+    async def run():
+        await admission.acquire(INTERACTIVE)
+        waiting = asyncio.create_task(admission.acquire(INTERACTIVE))
+        await asyncio.sleep(0.05)
+        assert not waiting.done()
+        admission.release(INTERACTIVE)
+        await asyncio.wait_for(waiting, 1)
+
+    asyncio.run(run())
+
+    stats = admission.get_stats()["lanes"][INTERACTIVE]
+    assert stats["admitted"] == 2
+    assert stats["in_flight"] == 1
+    assert stats["wait_seconds_p95"] >= 0.05
+
+
+def test_over_limit_call_is_rejected_with_retry_after(monkeypatch):
+    """Test that a call that cannot get a slot within its lane's wait limit fails fast."""
+    monkeypatch.setattr("llm.admission.settings.llm_interactive_max_wait_seconds", 0.05)
+    admission = LLMAdmission(max_in_flight=1, rate_per_second=0)
+
+    async def run():
+        await admission.acquire(INTERACTIVE)
+        started = time.monotonic()
+        with pytest.raises(AdmissionRejected) as rejected:
+            await admission.acquire(INTERACTIVE)
+        return time.monotonic() - started, rejected.value
+
+    elapsed, error = asyncio.run(run())
+
+    assert elapsed < 0.5
+    assert error.retry_after >= 1
+    assert admission.get_stats()["lanes"][INTERACTIVE]["rejected"] == 1
+
+
+def test_full_queue_rejects_immediately():
+    """Test that a call finding max_queue waiters is rejected without waiting."""
+    admission = LLMAdmission(max_in_flight=1, rate_per_second=0, max_queue=1)
+
+    async def run():
+        await admission.acquire(INTERACTIVE)
+        waiting = asyncio.create_task(admission.acquire(INTERACTIVE))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected):
+            await admission.acquire(INTERACTIVE)
+        waiting.cancel()
+
+    asyncio.run(run())
+
+
+def test_interactive_calls_go_ahead_of_waiting_batch_calls():
+    """Test that a released slot goes to an interactive waiter even if a batch call queued first."""
+    admission = LLMAdmission(max_in_flight=1, batch_max_in_flight=1, rate_per_second=0)
+    order = []
+
+    async def call(lane):
+        await admission.acquire(lane)
+        order.append(lane)
+        admission.release(lane)
+
+    async def run():
+        await admission.acquire(INTERACTIVE)
+        batch = asyncio.create_task(call(BATCH))
+        await asyncio.sleep(0.01)
+        interactive = asyncio.create_task(call(INTERACTIVE))
+        await asyncio.sleep(0.01)
+        admission.release(INTERACTIVE)
+        await asyncio.wait_for(asyncio.gather(batch, interactive), 1)
+
+    asyncio.run(run())
+
+    assert order == [INTERACTIVE, BATCH]
+
+
+def test_token_bucket_paces_call_starts():
+    """Test that calls beyond the burst wait for the bucket to refill."""
+    admission = LLMAdmission(max_in_flight=10, rate_per_second=20, burst=1)
+
+    async def run():
+        started = time.monotonic()
+        for _ in range(3):
+            await admission.acquire(INTERACTIVE)
+        return time.monotonic() - started
+
+    assert asyncio.run(run()) >= 0.09
+
+
+def test_half_open_trial_rejected_by_admission_frees_breaker(monkeypatch):
+    """Test that a half-open trial call that never gets a slot does not wedge the breaker."""
+    monkeypatch.setattr("llm.openrouter.settings.llm_admission_enabled", True)
+    client = OpenRouterClient()
+    client.admission = LLMAdmission(max_in_flight=1, rate_per_second=0, max_queue=1)
+    client.breaker.state = HALF_OPEN
+
+    async def run():
+        await client.admission.acquire(INTERACTIVE)
+        waiting = asyncio.create_task(client.admission.acquire(INTERACTIVE))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected):
+            await client.chat_completion([{"role": "user", "content": "hi"}])
+        waiting.cancel()
+
+    asyncio.run(run())
+
+    assert client.breaker.state == HALF_OPEN
+    assert client.breaker.allow()
+
+
+def test_slot_is_released_during_retry_backoff(monkeypatch):
+    """Test that a call waiting out a 429 does not hold its lane's in-flight slot."""
+    monkeypatch.setattr("llm.openrouter.settings.llm_admission_enabled", True)
+    monkeypatch.setattr("llm.openrouter.settings.openrouter_backoff_base_seconds", 0.0)
+    client = OpenRouterClient()
+    client.admission = LLMAdmission(max_in_flight=1, rate_per_second=0)
+    responses = [
+        httpx.Response(429, headers={"Retry-After": "0.2"}, text="slow down"),
+        httpx.Response(200, json={"choices": [{"message": {"role": "assistant", "content": "hi"}}]}),
+    ]
+    client.client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: responses.pop(0)))
+
+    async def run():
+        call = asyncio.create_task(client.chat_completion([{"role": "user", "content": "hi"}]))
+        await asyncio.sleep(0.05)
+        in_flight = client.admission.in_flight[INTERACTIVE]
+        await asyncio.wait_for(client.admission.acquire(INTERACTIVE, timeout=0.05), 1)
+        client.admission.release(INTERACTIVE)
+        await call
+        return in_flight
+
+    assert asyncio.run(run()) == 0
+    assert client.admission.in_flight[INTERACTIVE] == 0
+    assert client.admission.get_stats()["lanes"][INTERACTIVE]["admitted"] == 3
+
+
+def test_agent_reraises_admission_rejection():
+    """Test that the agent surfaces AdmissionRejected instead of a templated fallback."""
+    class RejectingClient:
+        async def chat_completion(self, messages, **kwargs):
+            raise AdmissionRejected("LLM capacity exhausted", retry_after=3)
+
+    agent = MunicipalAnalystAgent(client=RejectingClient())
+
+    with pytest.raises(AdmissionRejected):
+        asyncio.run(agent.process_query("GDP trends", {}))
+
+
+def test_insights_endpoint_returns_429_with_retry_after(monkeypatch):
+    """Test that rejected requests get 429 and that X-Priority selects the batch lane."""
+    lanes = []
+
+    async def rejected_insight(prompt, filters, **kwargs):
+        lanes.append(current_lane.get())
+        raise AdmissionRejected("LLM capacity exhausted", retry_after=4)
+
+    monkeypatch.setattr(app_module, "run_insight", rejected_insight)
+    client = TestClient(app_module.app)
+
+    response = client.post("/api/insights", json={"prompt": "GDP trends"}, headers={"X-Priority": "batch"})
+
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "4"
+    assert lanes == [BATCH]
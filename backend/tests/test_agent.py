@@ -0,0 +1,216 @@
+"""Tests for the MunicipalAnalystAgent tool-calling loop."""
+
+import asyncio
+import json
+
+from llm.agent import MunicipalAnalystAgent
+from services.result_compactor import estimate_tokens
+
+
+FINAL_ANSWER = {
+    "insight_text": "done",
+    "sql_used": "",
+    "data_preview": {"columns": [], "rows": []},
+    "viz": {"type": "vega-lite", "spec": {}},
+    "doc_citations": [],
+    "filters_applied": {},
+    "disclaimers": [],
+}
+
+
+class ScriptedClient:
+    """Fake OpenRouter client that replays a fixed list of assistant messages."""
+
+    def __init__(self, messages):
+        self.messages = list(messages)
+        self.requests = []
+        self.models = []
+
+    async def chat_completion(self, messages, **kwargs):
+        self.requests.append([dict(m) for m in messages])
+        self.models.append(kwargs.get("model"))
+        return {
+            "choices": [{"message": self.messages.pop(0)}],
+            "usage": {"prompt_tokens": 100, "completion_tokens": 10},
+        }
+
+
+def tool_call(call_id, name, arguments):
+    return {"id": call_id, "type": "function", "function": {"name": name, "arguments": json.dumps(arguments)}}
+
+
+def test_tool_calls_from_one_turn_run_concurrently_and_keep_order():
+    """Test that a turn's tool calls overlap in time and results keep tool_call_id order."""
+    client = ScriptedClient([
+        {"role": "assistant", "content": "", "tool_calls": [
+            tool_call("a", "run_sql", {"query": "slow"}),
+            tool_call("b", "run_sql", {"query": "fast"}),
+        ]},
+        {"role": "assistant", "content": json.dumps(FINAL_ANSWER)},
+    ])
+    agent = MunicipalAnalystAgent(client=client)
+    running = [0]
+    most_running = [0]
+
+    async def fake_execute_tool(name, arguments):
+        running[0] += 1
+        most_running[0] = max(most_running[0], running[0])
+        await asyncio.sleep(0.02 if arguments["query"] == "slow" else 0.01)
+        running[0] -= 1
+        return {"success": True, "result": {"columns": ["q"], "rows": [[arguments["query"]]], "row_count": 1}}
+
+    agent.execute_tool = fake_execute_tool
+
+    result = asyncio.run(agent.process_query("compare", {}))
+
+    assert result["insight_text"] == "done"
+    assert most_running[0] == 2
+
+    tool_messages = [m for m in client.requests[-1] if m["role"] == "tool"]
+    assert [m["tool_call_id"] for m in tool_messages] == ["a", "b"]
+    assert json.loads(tool_messages[0]["content"])["result"]["sample_rows"] == [["slow"]]
+
+
+def test_invalid_tool_arguments_are_reported_without_stopping_siblings():
+    """Test that a call with malformed JSON arguments gets an error result while the others finish."""
+    bad_call = {"id": "b", "type": "function", "function": {"name": "run_sql", "arguments": '{"query": '}}
+    client = ScriptedClient([
+        {"role": "assistant", "content": "", "tool_calls": [tool_call("a", "run_sql", {"query": "ok"}), bad_call]},
+        {"role": "assistant", "content": json.dumps(FINAL_ANSWER)},
+    ])
+    agent = MunicipalAnalystAgent(client=client)
+    executed = []
+
+    async def fake_execute_tool(name, arguments):
+        await asyncio.sleep(0.01)
+        executed.append(arguments["query"])
+        return {"success": True, "result": {"columns": ["q"], "rows": [["ok"]], "row_count": 1}}
+
+    agent.execute_tool = fake_execute_tool
+    result = asyncio.run(agent.process_query("compare", {}))
+
+    tool_messages = {m["tool_call_id"]: json.loads(m["content"]) for m in client.requests[-1] if m["role"] == "tool"}
+    assert result["insight_text"] == "done"
+    assert executed == ["ok"]
+    assert tool_messages["a"]["success"] is True
+    assert "Invalid JSON arguments" in tool_messages["b"]["error"]
+
+
+def test_system_prompt_embeds_schema_digest():
+    """Test that the stable system prompt names every table but leaves columns to the user message."""
+    system_prompt = MunicipalAnalystAgent.build_system_prompt()
+
+    assert system_prompt.startswith(MunicipalAnalystAgent.SYSTEM_PROMPT)
+    for table in ("extended_fact_measure", "dataset_registry", "dataset_indicator", "fact_measure", "dim_geo"):
+        assert table in system_prompt
+        assert f"- {table}(" not in system_prompt
+    assert system_prompt == MunicipalAnalystAgent.build_system_prompt()
+
+
+def test_user_message_carries_relevant_columns_and_real_sizes():
+    """Test that the join keys move to the user message and schema_tokens measures the sent text."""
+    agent = MunicipalAnalystAgent(client=ScriptedClient([]))
+
+    content = agent._user_message("GDP growth trend", {})
+
+    assert "- extended_fact_measure(" in content
+    assert "dataset_id->dataset_registry.id" in content
+    tokens = agent.schema_tokens
+    assert tokens["system_prompt"] < estimate_tokens(MunicipalAnalystAgent.SYSTEM_PROMPT) + tokens["full_tables"]
+    assert tokens["user_message"] >= tokens["subset"]
+    assert set(tokens) == {"system_prompt", "user_message", "full_tables", "subset", "selection_ms"}
+
+
+def test_round_limit_returns_partial_answer_with_last_query_data(monkeypatch):
+    """Test that a model that never stops calling tools gets a partial answer, not an error."""
+    monkeypatch.setattr("llm.agent.settings.max_tool_rounds", 2)
+    looping = {"role": "assistant", "content": "", "tool_calls": [tool_call("x", "run_sql", {"query": "q"})]}
+    client = ScriptedClient([looping] * 3)
+    agent = MunicipalAnalystAgent(client=client)
+
+    async def fake_execute_tool(name, arguments):
+        return {"success": True, "result": {"columns": ["year", "value"], "rows": [[2020, 1], [2021, 2]], "row_count": 2}}
+
+    agent.execute_tool = fake_execute_tool
+
+    result = asyncio.run(agent.process_query("loop forever", {}))
+
+    assert result["partial"] is True
+    assert result["data_preview"]["rows"] == [[2020, 1], [2021, 2]]
+    assert result["viz"]["spec"]["encoding"]["x"]["field"] == "year"
+    assert len(client.requests) == 3
+    assert not agent.last_run_succeeded
+
+
+def test_queries_returning_no_rows_are_not_learned(monkeypatch):
+    """Test that a successful answer over an empty result feeds neither templates nor examples."""
+    learned, added = [], []
+    monkeypatch.setattr("llm.agent.sql_template_cache.learn", lambda *args: learned.append(args))
+    monkeypatch.setattr("llm.agent.example_library.add", lambda *args: added.append(args))
+    client = ScriptedClient([
+        {"role": "assistant", "content": "", "tool_calls": [
+            tool_call("a", "run_sql", {"query": "SELECT year, value FROM forest WHERE district = 'Nowhere'"}),
+        ]},
+        {"role": "assistant", "content": json.dumps(FINAL_ANSWER)},
+    ])
+    agent = MunicipalAnalystAgent(client=client)
+
+    async def fake_execute_tool(name, arguments):
+        return {"success": True, "result": {"columns": ["year", "value"], "rows": [], "row_count": 0}}
+
+    agent.execute_tool = fake_execute_tool
+    asyncio.run(agent.process_query("forest cover in Nowhere", {}))
+
+    assert agent.last_run_succeeded
+    assert agent.query_results[-1]["row_count"] == 0
+    assert learned == [] and added == []
+
+
+def test_expired_deadline_returns_partial_answer():
+    """Test that an exhausted budget skips the LLM and still answers."""
+    from core.deadline import Deadline
+
+    client = ScriptedClient([])
+    agent = MunicipalAnalystAgent(client=client)
+
+    result = asyncio.run(agent.process_query("GDP trends", {}, deadline=Deadline(0)))
+
+    assert result["partial"] is True
+    assert client.requests == []
+
+
+def test_deadline_header_can_only_shorten_the_budget(monkeypatch):
+    """Test that a client deadline longer than the server budget is ignored."""
+    from core.deadline import Deadline
+
+    monkeypatch.setattr("core.deadline.settings.insight_deadline_seconds", 45.0)
+
+    assert Deadline.from_header(10_000).budget_seconds == 10
+    assert Deadline.from_header(120_000).budget_seconds == 45
+    assert Deadline.from_header(None).budget_seconds == 45
+
+
+def test_planner_and_synthesis_models_are_routed(monkeypatch):
+    """Test that tool rounds use the planner model and the answer comes from the synthesis model."""
+    monkeypatch.setattr("llm.agent.settings.planner_model_slug", "fast/planner")
+    monkeypatch.setattr("llm.agent.settings.synthesis_model_slug", "strong/writer")
+    client = ScriptedClient([
+        {"role": "assistant", "content": "", "tool_calls": [tool_call("a", "run_sql", {"query": "q"})]},
+        {"role": "assistant", "content": "planner draft, discarded"},
+        {"role": "assistant", "content": json.dumps(FINAL_ANSWER)},
+    ])
+    agent = MunicipalAnalystAgent(client=client)
+
+    async def fake_execute_tool(name, arguments):
+        return {"success": True, "result": {"columns": ["v"], "rows": [[1]], "row_count": 1}}
+
+    agent.execute_tool = fake_execute_tool
+
+    result = asyncio.run(agent.process_query("compare", {}))
+
+    assert result["insight_text"] == "done"
+    assert client.models == ["fast/planner", "fast/planner", "strong/writer"]
+    stages = agent._run_metrics()["stages"]
+    assert stages["planner"]["calls"] == 2
+    assert stages["planner"]["prompt_tokens"] == 200
+    assert stages["synthesis"]["model"] == "strong/writer"
@@ -0,0 +1,230 @@
+"""Tests for conversation sessions and local result refinement."""
+
+import asyncio
+import json
+from decimal import Decimal
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app as app_module
+from llm.agent import MunicipalAnalystAgent
+from services.conversation_sessions import ConversationStore
+from services.result_refiner import RefineError, refine_result
+from tests.test_agent import FINAL_ANSWER, ScriptedClient, tool_call
+
+
+RESULT = {
+    "columns": ["state", "year", "value"],
+    "rows": [
+        ["Jharkhand", 2020, Decimal("1.5")],
+        ["Bihar", 2020, Decimal("2.0")],
+        ["Jharkhand", 2021, Decimal("3.0")],
+    ],
+    "row_count": 3,
+}
+
+
+def test_refine_result_filters_groups_and_sorts():
+    """Test vectorized filtering, grouping and sorting of a cached result."""
+    only_jharkhand = refine_result(RESULT, {"where": [{"column": "state", "op": "=", "value": "jharkhand"}]})
+    by_year = refine_result(RESULT, {"group_by": ["year"], "aggregate": {"value": "sum"}, "sort_by": "value", "descending": True})
+
+    assert only_jharkhand["rows"] == [["Jharkhand", 2020, 1.5], ["Jharkhand", 2021, 3.0]]
+    assert by_year == {"columns": ["year", "value"], "rows": [[2020, 3.5], [2021, 3.0]], "row_count": 2}
+    json.dumps(by_year)
+    with pytest.raises(RefineError):
+        refine_result(RESULT, {"where": [{"column": "district", "value": "Ranchi"}]})
+
+
+def test_store_bounds_sessions_results_and_idle_time(monkeypatch):
+    """Test LRU eviction, idle expiry and the per-session result cap."""
+    monkeypatch.setattr("services.conversation_sessions.settings.conversation_results_per_session", 2)
+    monkeypatch.setattr("services.conversation_sessions.settings.conversation_max_result_rows", 2)
+    store = ConversationStore(max_sessions=2, idle_ttl_seconds=60)
+
+    first = store.get_or_create()
+    for index in range(3):
+        first.record_turn(f"question {index}", {}, {"insight_text": "a", "sql_used": "SELECT 1", "full_result": RESULT})
+    assert [result["result_id"] for result in first.results] == ["r2", "r3"]
+    assert first.get_result()["row_count"] == 2
+    assert first.get_result()["truncated"] is True
+
+    assert store.get_or_create(first.session_id) is first
+    store.get_or_create()
+    store.get_or_create()
+    assert store.get_or_create(first.session_id).session_id != first.session_id
+    assert store.get_stats()["evicted"] == 2
+
+    clock = [1000.0]
+    monkeypatch.setattr("services.conversation_sessions.time.monotonic", lambda: clock[0])
+    store = ConversationStore(max_sessions=2, idle_ttl_seconds=60)
+    idle = store.get_or_create()
+    clock[0] += 61
+    assert store.get_or_create(idle.session_id) is not idle
+    assert store.get_stats()["expired"] == 1
+
+
+def test_refine_result_rejects_numeric_aggregates_of_text():
+    """Test that sum/mean/min/max of a text column fail instead of concatenating strings."""
+    mixed = {"columns": ["state", "value"], "rows": [["Bihar", "1.5"], ["Bihar", "x"]], "row_count": 2}
+
+    for func in ("sum", "avg", "min", "max"):
+        with pytest.raises(RefineError, match="not numeric"):
+            refine_result(mixed, {"group_by": ["state"], "aggregate": {"value": func}})
+    counted = refine_result(mixed, {"group_by": ["state"], "aggregate": {"value": "count"}})
+    assert counted["rows"] == [["Bihar", 2]]
+
+
+def test_store_drops_oldest_results_over_the_row_budget():
+    """Test that cached rows across sessions stay within the store's budget, idle sessions first."""
+    store = ConversationStore(max_cached_rows=7)
+    idle = store.get_or_create()
+    idle.record_turn("q1", {}, {"sql_used": "SELECT 1", "full_result": RESULT})
+    idle.record_turn("q2", {}, {"sql_used": "SELECT 1", "full_result": RESULT})
+    active = store.get_or_create()
+    active.record_turn("q3", {}, {"sql_used": "SELECT 1", "full_result": RESULT})
+
+    assert [result["result_id"] for result in idle.results] == ["r2"]
+    assert active.get_result()["result_id"] == "r1"
+    stats = store.get_stats()
+    assert stats["cached_rows"] == 6
+    assert stats["results_dropped"] == 1
+
+
+def test_follow_up_refines_cached_result_without_sql():
+    """Test that a follow-up question is answered by refining the session's last result."""
+    session = ConversationStore().get_or_create()
+    session.record_turn("GDP growth by state", {}, {
+        "insight_text": "Growth varied by state.",
+        "sql_used": "SELECT state, year, value FROM growth",
+        "full_result": RESULT,
+    })
+    client = ScriptedClient([
+        {"role": "assistant", "content": "", "tool_calls": [
+            tool_call("a", "refine_result", {"where": [{"column": "state", "op": "=", "value": "Jharkhand"}]}),
+        ]},
+        {"role": "assistant", "content": json.dumps(FINAL_ANSWER)},
+    ])
+    agent = MunicipalAnalystAgent(client=client)
+
+    result = asyncio.run(agent.process_query("only for Jharkhand", {}, session=session))
+
+    assert "CONVERSATION SO FAR" in client.requests[0][1]["content"]
+    assert "refine_result" in agent.tool_call_counts
+    assert "run_sql" not in agent.tool_call_counts
+    assert result["data_preview"]["rows"] == [["Jharkhand", 2020, 1.5], ["Jharkhand", 2021, 3.0]]
+    assert result["sql_used"] == "SELECT state, year, value FROM growth"
+    assert any("earlier result" in disclaimer for disclaimer in result["disclaimers"])
+
+
+def test_refining_a_truncated_result_is_disclosed():
+    """Test that aggregates over a capped cached result carry a disclaimer."""
+    session = ConversationStore().get_or_create()
+    session.record_turn("GDP growth by state", {}, {
+        "insight_text": "Growth varied by state.",
+        "sql_used": "SELECT state, year, value FROM growth",
+        "full_result": {**RESULT, "row_count": 9000},
+    })
+    client = ScriptedClient([
+        {"role": "assistant", "content": "", "tool_calls": [
+            tool_call("a", "refine_result", {"group_by": ["state"], "aggregate": {"value": "sum"}}),
+        ]},
+        {"role": "assistant", "content": json.dumps(FINAL_ANSWER)},
+    ])
+    agent = MunicipalAnalystAgent(client=client)
+
+    result = asyncio.run(agent.process_query("total by state", {}, session=session))
+
+    tool_message = json.loads(client.requests[1][-1]["content"])
+    assert tool_message["result"]["source_truncated"] is True
+    assert any("cut off" in disclaimer for disclaimer in result["disclaimers"])
+
+
+def test_follow_up_sql_is_not_learned_or_served_from_templates(monkeypatch):
+    """Test that context-dependent follow-ups never feed or use the shared templates and examples."""
+    learned, added, matched = [], [], []
+    monkeypatch.setattr("llm.agent.sql_template_cache.learn", lambda *args: learned.append(args))
+    monkeypatch.setattr("llm.agent.sql_template_cache.match", lambda *args: matched.append(args))
+    monkeypatch.setattr("llm.agent.example_library.add", lambda *args: added.append(args))
+    session = ConversationStore().get_or_create()
+    session.record_turn("forest cover in Ranchi", {}, {
+        "insight_text": "Forest cover rose.",
+        "sql_used": "SELECT year, value FROM forest WHERE district = 'Ranchi'",
+        "full_result": RESULT,
+    })
+    client = ScriptedClient([
+        {"role": "assistant", "content": "", "tool_calls": [
+            tool_call("a", "run_sql", {"query": "SELECT year, value FROM forest WHERE district = 'Dhanbad'"}),
+        ]},
+        {"role": "assistant", "content": json.dumps(FINAL_ANSWER)},
+    ])
+    agent = MunicipalAnalystAgent(client=client)
+
+    async def fake_execute_tool(name, arguments):
+        return {"success": True, "result": {"columns": ["year", "value"], "rows": [[2020, 1]], "row_count": 1}}
+
+    agent.execute_tool = fake_execute_tool
+    asyncio.run(agent.process_query("now show it for Dhanbad", {}, session=session))
+
+    assert agent.last_run_succeeded
+    assert agent.query_results
+    assert learned == [] and added == [] and matched == []
+
+
+def test_insights_endpoint_opens_sessions_only_on_request(monkeypatch):
+    """Test that one-off questions get no session and only an id or ?session=new opens one."""
+    store = ConversationStore()
+    sessions = []
+
+    async def fake_run_insight(prompt, filters, deadline=None, session=None):
+        sessions.append(session)
+        return {"insight_text": "ok", "session_id": session.session_id if session else None}
+
+    monkeypatch.setattr(app_module, "conversation_store", store)
+    monkeypatch.setattr(app_module, "run_insight", fake_run_insight)
+    client = TestClient(app_module.app)
+
+    client.post("/api/insights", json={"prompt": "GDP trends"})
+    opened = client.post("/api/insights?session=new", json={"prompt": "GDP trends"}).json()["session_id"]
+    client.post("/api/insights", json={"prompt": "only Bihar", "session_id": opened})
+
+    assert sessions[0] is None
+    assert sessions[1] is sessions[2]
+    assert store.get_stats()["created"] == 1
+
+
+def test_coalesced_request_without_session_gets_no_session_id(monkeypatch):
+    """Test that a follower coalesced onto a session's request does not receive its session_id."""
+    from core.deadline import Deadline
+
+    class FakeAgent:
+        last_run_succeeded = True
+
+        def __init__(self, client=None):
+            pass
+
+        async def generate_insight(self, prompt, filters, on_event=None, deadline=None, session=None):
+            await asyncio.sleep(0.05)
+            return {"insight_text": "shared"}
+
+    async def not_routed(prompt, filters):
+        return None
+
+    monkeypatch.setattr(app_module, "MunicipalAnalystAgent", FakeAgent)
+    monkeypatch.setattr(app_module, "get_shared_client", lambda: None)
+    monkeypatch.setattr(app_module.intent_router, "answer", not_routed)
+    monkeypatch.setattr(app_module.settings, "response_cache_enabled", False)
+    session = ConversationStore().get_or_create()
+
+    async def run():
+        return await asyncio.gather(
+            app_module.run_insight("GDP trends", {}, deadline=Deadline(30), session=session),
+            app_module.run_insight("GDP trends", {}, deadline=Deadline(30)),
+        )
+
+    with_session, without_session = asyncio.run(run())
+
+    assert app_module.insight_flights.coalesced >= 1
+    assert with_session["session_id"] == session.session_id
+    assert "session_id" not in without_session
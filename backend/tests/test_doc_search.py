@@ -0,0 +1,74 @@
+"""Tests for the local search_docs index."""
+
+import asyncio
+
+import numpy as np
+
+from llm.agent import MunicipalAnalystAgent
+from services.doc_search import DocSearchIndex, build_index, catalog_documents, load_documents
+
+
+def write_docs(tmp_path):
+    (tmp_path / "docs").mkdir()
+    (tmp_path / "docs" / "forest_survey.md").write_text(
+        "---\ntitle: Forest cover survey\nward: Ward 12\ndate: 2021-03-01\n---\n"
+        "Satellite imagery was used to estimate tree canopy and forest cover.\n\n"
+        "# Methodology\nCanopy density thresholds follow the national forest survey.\n",
+        encoding="utf-8",
+    )
+    (tmp_path / "docs" / "water.txt").write_text(
+        "Water quality sampling covers chlorine and turbidity at treatment plants.", encoding="utf-8"
+    )
+    documents = load_documents([str(tmp_path / "docs")])
+    documents += catalog_documents([{
+        "slug": "gdp-growth", "title": "GDP Growth Rate", "description": "Annual GDP growth at constant prices",
+        "category": "Economic", "last_updated": "2023-06-30T00:00:00",
+    }])
+    build_index(documents, str(tmp_path / "index"))
+    index = DocSearchIndex(str(tmp_path / "index"))
+    index.load()
+    return index
+
+
+def test_search_ranks_matching_chunks_and_memory_maps_postings(tmp_path):
+    """Test BM25 ranking over chunked documents loaded from memory-mapped files."""
+    index = write_docs(tmp_path)
+
+    results = index.search("forest canopy methodology")
+
+    assert isinstance(index.postings, np.memmap)
+    assert results[0]["title"] == "Forest cover survey - Methodology"
+    assert {result["source"].split("/")[-1] for result in results} == {"forest_survey.md"}
+    assert index.search("GDP growth")[0]["source"] == "dataset:gdp-growth"
+    assert index.search("unrelated words") == []
+
+
+def test_search_filters_by_ward_and_date(tmp_path):
+    """Test that documents tagged with another ward or dated outside the range are dropped."""
+    index = write_docs(tmp_path)
+
+    assert index.search("forest cover", ward="Ward 3") == []
+    assert index.search("forest cover", ward="ward 12")
+    assert index.search("forest cover", from_date="2022-01-01") == []
+    assert index.search("forest cover", from_date="2020-01-01", to_date="2021-12-31")
+    # Untagged, undated documents pass every filter
+    assert index.search("water chlorine", ward="Ward 3", from_date="2022-01-01")
+
+
+def test_missing_index_returns_no_citations(tmp_path):
+    """Test that search_docs degrades to an empty result without an index."""
+    index = DocSearchIndex(str(tmp_path / "missing"))
+    index.load()
+
+    assert index.search("forest") == []
+
+
+def test_agent_search_docs_tool_uses_index(tmp_path, monkeypatch):
+    """Test that the search_docs tool returns citations from the global index."""
+    monkeypatch.setattr("llm.agent.doc_search_index", write_docs(tmp_path))
+    agent = MunicipalAnalystAgent(client=object())
+
+    result = asyncio.run(agent.execute_tool("search_docs", {"text": "turbidity", "ward": "Ward 5"}))
+
+    assert result["success"] is True
+    assert result["result"][0]["source"].endswith("water.txt")
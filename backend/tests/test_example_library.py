@@ -0,0 +1,75 @@
+"""Tests for few-shot example retrieval."""
+
+import json
+
+from services.example_library import ExampleLibrary
+from services.text_index import BM25Index, ngram_terms
+
+
+def test_bm25_prefers_shared_bigrams():
+    """Test that a matching phrase outranks documents sharing single words."""
+    index = BM25Index()
+    index.add(ngram_terms("forest cover by district"))
+    index.add(ngram_terms("forest fires and cover crops"))
+    index.add(ngram_terms("literacy rate by state"))
+
+    ranked = index.search(ngram_terms("show forest cover in Ranchi"), k=3)
+
+    assert [doc_id for doc_id, _ in ranked] == [0, 1]
+
+
+def test_learned_examples_are_searchable_and_persisted(tmp_path):
+    """Test that added pairs are retrieved, deduplicated and reloaded from disk."""
+    path = tmp_path / "examples.jsonl"
+    library = ExampleLibrary(path=str(path), max_entries=100)
+
+    library.add("Air quality index in Delhi by month", "SELECT 1")
+    library.add("air quality index in delhi by month?", "SELECT 2")
+
+    hits = library.search("monthly air quality index for Delhi", k=1)
+    assert hits[0]["sql"] == "SELECT 2"
+    assert any(hit["source"] == "seed" for hit in library.search("GDP growth over the years", k=2))
+
+    reloaded = ExampleLibrary(path=str(path), max_entries=100)
+    assert reloaded.search("air quality delhi", k=1)[0]["sql"] == "SELECT 2"
+    assert reloaded.get_stats()["learned"] == 1
+    assert all("source" not in json.loads(line) for line in path.read_text().splitlines())
+
+
+def test_full_library_evicts_oldest_learned_pair_and_only_appends(tmp_path):
+    """Test that adding to a full library evicts in memory and appends one line instead of rewriting."""
+    path = tmp_path / "examples.jsonl"
+    library = ExampleLibrary(path=str(path), max_entries=100)
+    library.load()
+    library.max_entries = library.get_stats()["seed"] + 2
+
+    library.add("Forest cover in Ranchi", "SELECT 1")
+    library.add("Rainfall in Dhanbad", "SELECT 2")
+    library.add("Literacy in Bokaro", "SELECT 3")
+    library.add("Rainfall in Dhanbad", "SELECT 4")
+
+    stats = library.get_stats()
+    assert stats["learned"] == 2
+    assert stats["entries"] == library.max_entries
+    assert library.search("forest cover ranchi", k=1)[0]["sql"] != "SELECT 1"
+    assert library.search("rainfall dhanbad", k=1)[0]["sql"] == "SELECT 4"
+    assert len(path.read_text().splitlines()) == 4
+
+    reloaded = ExampleLibrary(path=str(path), max_entries=library.max_entries)
+    assert {hit["sql"] for hit in reloaded.search("literacy bokaro rainfall dhanbad", k=2)} == {"SELECT 3", "SELECT 4"}
+    assert len(path.read_text().splitlines()) == 2
+
+
+def test_agent_injects_examples_into_user_message():
+    """Test that retrieved examples go into the user message, not the system prompt."""
+    from llm.agent import MunicipalAnalystAgent
+    from tests.test_agent import ScriptedClient
+
+    agent = MunicipalAnalystAgent(client=ScriptedClient([]))
+
+    content = agent._user_message("GDP growth trend over the years", {})
+
+    assert "SIMILAR SOLVED QUESTIONS" in content
+    assert "extended_fact_measure" in content
+    assert agent.few_shot_examples > 0
+    assert "SIMILAR SOLVED QUESTIONS" not in agent.build_system_prompt()
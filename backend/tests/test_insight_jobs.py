@@ -0,0 +1,94 @@
+"""Tests for background insight jobs."""
+
+import asyncio
+
+from fastapi.testclient import TestClient
+
+import app as app_module
+from services.insight_jobs import InsightJobQueue, run_job_worker
+
+
+class MemoryQueue(InsightJobQueue):
+    """Job queue that keeps rows in a dict instead of Postgres."""
+
+    def __init__(self, prompts):
+        super().__init__(engine=object())
+        self.jobs = {
+            index: {"id": index, "prompt": prompt, "filters": {}, "status": "queued", "wait_seconds": 0.5}
+            for index, prompt in enumerate(prompts, 1)
+        }
+
+    def claim(self, worker_id):
+        for job in self.jobs.values():
+            if job["status"] == "queued":
+                job.update(status="running", worker_id=worker_id)
+                self.claimed += 1
+                self.wait_seconds.add(job["wait_seconds"])
+                return dict(job)
+        return None
+
+    def complete(self, job_id, result):
+        self.jobs[job_id].update(status="succeeded", result=result)
+        self.succeeded += 1
+
+    def fail(self, job_id, error):
+        self.jobs[job_id].update(status="failed", error=error)
+        self.failed += 1
+
+    def requeue_stale(self):
+        return 0
+
+
+def test_workers_drain_queue_and_record_failures(monkeypatch):
+    """Test that concurrent workers each claim distinct jobs and failures are stored."""
+    monkeypatch.setattr("services.insight_jobs.settings.insight_job_poll_seconds", 0.01)
+    queue = MemoryQueue(["gdp trend", "boom", "literacy by state"])
+    handled = []
+
+    async def handler(prompt, filters):
+        handled.append(prompt)
+        await asyncio.sleep(0.01)
+        if prompt == "boom":
+            raise RuntimeError("agent crashed")
+        return {"insight_text": prompt}
+
+    async def run():
+        workers = [asyncio.create_task(run_job_worker(queue, f"w{i}", handler)) for i in range(2)]
+        while any(job["status"] in ("queued", "running") for job in queue.jobs.values()):
+            await asyncio.sleep(0.01)
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+    asyncio.run(run())
+
+    assert sorted(handled) == ["boom", "gdp trend", "literacy by state"]
+    assert queue.jobs[1]["result"] == {"insight_text": "gdp trend"}
+    assert queue.jobs[2]["status"] == "failed"
+    assert queue.jobs[2]["error"] == "agent crashed"
+    stats = queue.get_stats()
+    assert stats["claimed"] == 3
+    assert stats["succeeded"] == 2
+    assert stats["wait_seconds_p50"] == 0.5
+    assert stats["run_seconds_p95"] is not None
+
+
+def test_job_endpoints_enqueue_and_poll(monkeypatch):
+    """Test that POST returns a job id right away and GET reports the job or 404."""
+    queued = {}
+
+    def enqueue(prompt, filters):
+        queued[7] = {"id": 7, "status": "queued", "queue_position": 0, "prompt": prompt, "filters": filters}
+        return 7
+
+    monkeypatch.setattr(app_module.insight_job_queue, "enqueue", enqueue)
+    monkeypatch.setattr(app_module.insight_job_queue, "get", lambda job_id: queued.get(job_id))
+    client = TestClient(app_module.app)
+
+    response = client.post("/api/insights/jobs", json={"prompt": "GDP trends", "filters": {"extra": {"category": "Economic"}}})
+
+    assert response.status_code == 202
+    assert response.json() == {"job_id": 7, "status": "queued"}
+    assert queued[7]["filters"] == {"extra": {"category": "Economic"}}
+    assert client.get("/api/insights/jobs/7").json()["status"] == "queued"
+    assert client.get("/api/insights/jobs/8").status_code == 404
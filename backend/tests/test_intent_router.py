@@ -0,0 +1,127 @@
+"""Tests for the deterministic catalog intent router."""
+
+import asyncio
+
+from services.intent_router import IntentRouter
+
+REGISTRY = [
+    {"slug": "gdp-growth-rate", "title": "GDP Growth Rate", "category": "Economic", "subcategory": "National Accounts",
+     "geographic_level": "national", "time_granularity": "quarterly", "indicators_count": 3},
+    {"slug": "retail-inflation", "title": "Retail Inflation Rate", "category": "Economic", "subcategory": "Prices",
+     "geographic_level": "national", "time_granularity": "monthly", "indicators_count": 2},
+    {"slug": "literacy-rate", "title": "Literacy Rate by State", "category": "Social", "subcategory": "Education",
+     "geographic_level": "state", "time_granularity": "annual", "indicators_count": 4},
+]
+
+
+def make_router():
+    router = IntentRouter()
+    router.load(REGISTRY)
+    return router
+
+
+def test_catalog_questions_are_classified():
+    """Test that catalog phrasing resolves to datasets, categories or the full list."""
+    router = make_router()
+
+    assert router.classify("What datasets do you have on education?") == {"intent": "catalog", "slugs": ["literacy-rate"]}
+    assert router.classify("list economic indicators") == {"intent": "catalog", "categories": ["Economic"]}
+    assert router.classify("What datasets are available?") == {"intent": "catalog"}
+    assert router.classify("which categories of data do you have") == {"intent": "categories"}
+
+
+def test_analytical_and_unknown_questions_go_to_the_agent():
+    """Test that anything needing analysis or an unknown topic is not routed."""
+    router = make_router()
+
+    assert router.classify("show GDP trends over time") is None
+    assert router.classify("Compare literacy between states") is None
+    assert router.classify("what datasets do you have on cricket") is None
+    assert IntentRouter().classify("What datasets are available?") is None
+
+
+def test_threshold_and_topic_questions_go_to_the_agent():
+    """Test that questions about the data itself are never answered with catalog metadata."""
+    router = make_router()
+
+    assert router.classify("which states have literacy above 80%") is None
+    assert router.classify("which states have literacy rate more than 70 percent") is None
+    assert router.classify("Education statistics") is None
+    assert router.classify("GDP statistics") is None
+    assert router.classify("top 5 states by literacy rate") is None
+    assert router.classify("literacy rate below 60 in which districts") is None
+    assert router.classify("compare inflation and GDP growth") is None
+
+
+def test_catalog_words_with_a_year_or_place_pass_through(monkeypatch):
+    """Test that questions about values for a year or place are left to the agent."""
+    router = make_router()
+    monkeypatch.setattr(
+        "services.intent_router.sql_template_cache.vocabulary", {"places": {"jharkhand", "bihar"}, "years": set()}
+    )
+
+    assert router.classify("show me GDP indicators for 2020") is None
+    assert router.classify("show inflation indicators in Jharkhand") is None
+    assert router.classify("show GDP dataset values for Bihar") is None
+    assert router.classify("which datasets have bihar") is None
+    assert router.classify("What datasets are available?", {"place": {"state": "Jharkhand"}}) is None
+    assert router.classify("list economic indicators", {"time": {"from_": "2019", "to": None}}) is None
+    assert router.classify("What datasets are available?", {"place": {"state": None}}) == {"intent": "catalog"}
+
+
+def test_explicit_coverage_and_statistics_wording_is_routed():
+    """Test that coverage and statistics are routed only when asked about a dataset."""
+    router = make_router()
+
+    assert router.classify("how many records are in the literacy rate data")["intent"] == "statistics"
+    assert router.classify("statistics for the GDP growth dataset") == {"intent": "statistics", "slug": "gdp-growth-rate"}
+    assert router.classify("which states does the literacy dataset cover")["geographic"] is True
+
+
+def test_category_filter_limits_catalog_answers():
+    """Test that the extra.category filter narrows catalog answers and excludes other datasets."""
+    router = make_router()
+
+    assert router.classify("What datasets are available?", {"extra": {"category": "Social"}}) == {"intent": "catalog", "categories": ["Social"]}
+    assert router.classify("what datasets do you have on GDP", {"extra": {"category": "Social"}}) is None
+    assert router.classify("list economic indicators", {"extra": {"category": "Social"}}) is None
+
+    response = asyncio.run(router.answer("What datasets are available?", {"extra": {"category": "Social"}}))
+
+    assert [row[0] for row in response["data_preview"]["rows"]] == ["Literacy Rate by State"]
+
+
+def test_coverage_is_answered_from_the_data_service(monkeypatch):
+    """Test that a coverage question queries only the requested dimension."""
+    router = make_router()
+    monkeypatch.setattr(
+        "services.intent_router.government_data_service.get_time_coverage",
+        lambda slug: [{"year": 2020}, {"year": 2021}],
+    )
+    monkeypatch.setattr(
+        "services.intent_router.government_data_service.get_geographic_coverage",
+        lambda slug: (_ for _ in ()).throw(AssertionError("geographic coverage not requested")),
+    )
+
+    response = asyncio.run(router.answer("what years does the literacy rate dataset cover", {}))
+
+    assert response["intent"] == "coverage"
+    assert response["data_preview"] == {"columns": ["year", "periods"], "rows": [[2020, 1], [2021, 1]]}
+    assert "2020–2021" in response["insight_text"]
+    assert router.get_stats()["routed"] == {"coverage": 1}
+
+
+def test_data_service_errors_pass_through_to_the_agent(monkeypatch):
+    """Test that a failing coverage or statistics lookup hands the prompt to the agent."""
+    router = make_router()
+
+    def fail(slug):
+        raise RuntimeError("connection refused")
+
+    monkeypatch.setattr("services.intent_router.government_data_service.get_time_coverage", fail)
+    monkeypatch.setattr("services.intent_router.government_data_service.get_dataset_statistics", fail)
+
+    assert asyncio.run(router.answer("what years does the literacy rate dataset cover", {})) is None
+    assert asyncio.run(router.answer("statistics for the GDP growth dataset", {})) is None
+    assert router.get_stats()["passed_through"] == 2
+    assert router.get_stats()["routed"] == {}
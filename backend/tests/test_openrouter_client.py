@@ -0,0 +1,61 @@
+"""Tests for the shared pooled OpenRouter client."""
+
+import asyncio
+
+import httpx
+
+from llm import openrouter
+from llm.openrouter import ConnectionStats, close_shared_client, get_shared_client
+
+OK_BODY = {"choices": [{"message": {"role": "assistant", "content": "hi"}}]}
+
+
+def test_shared_client_is_reused_and_closed_on_shutdown(monkeypatch):
+    """Test that every call goes through one pooled client until shutdown closes it."""
+    monkeypatch.setattr(openrouter, "_shared_client", None)
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(200, json=OK_BODY)
+
+    async def scenario():
+        client = get_shared_client()
+        client.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        http_client = client.client
+        for _ in range(3):
+            assert get_shared_client() is client
+            await get_shared_client().chat_completion([{"role": "user", "content": "hi"}])
+        await close_shared_client()
+        return client, http_client
+
+    client, http_client = asyncio.run(scenario())
+
+    assert len(calls) == 3
+    assert client.client is http_client
+    assert http_client.is_closed
+    assert openrouter._shared_client is None
+    stats = client.get_stats()
+    assert stats["requests"] == 3
+    assert stats["http_versions"] == {"HTTP/1.1": 3}
+
+
+def test_connection_stats_count_new_and_reused_connections():
+    """Test that trace events and responses feed the reuse counters."""
+    stats = ConnectionStats()
+
+    async def scenario():
+        await stats.trace("connection.connect_tcp.complete", {})
+        await stats.trace("connection.start_tls.complete", {})
+        await stats.trace("http11.send_request_headers.complete", {})
+
+    asyncio.run(scenario())
+    for _ in range(4):
+        stats.record_response(httpx.Response(200, extensions={"http_version": b"HTTP/2"}))
+
+    snapshot = stats.snapshot()
+    assert snapshot["new_connections"] == 1
+    assert snapshot["tls_handshakes"] == 1
+    assert snapshot["reused_connections"] == 3
+    assert snapshot["reuse_ratio"] == 0.75
+    assert snapshot["http_versions"] == {"HTTP/2": 4}
@@ -0,0 +1,104 @@
+"""Tests for hedged OpenRouter requests."""
+
+import asyncio
+import json
+import time
+
+import httpx
+
+from llm.admission import INTERACTIVE, LLMAdmission
+from llm.hedging import percentile
+from llm.openrouter import OpenRouterClient
+
+OK_BODY = {"choices": [{"message": {"role": "assistant", "content": "hi"}}]}
+
+
+def make_hedged_client(monkeypatch, delays):
+    """Build a client whose responses take ``delays[model]`` seconds."""
+    monkeypatch.setattr("llm.openrouter.settings.openrouter_hedge_model", "backup/model")
+    monkeypatch.setattr("llm.openrouter.settings.openrouter_hedge_initial_delay_seconds", 0.05)
+    client = OpenRouterClient()
+    client.model_slug = "primary/model"
+    calls = []
+
+    async def handler(request):
+        model = json.loads(request.content)["model"]
+        calls.append(model)
+        await asyncio.sleep(delays[model])
+        return httpx.Response(200, json={**OK_BODY, "model": model})
+
+    client.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return client, calls
+
+
+def test_slow_primary_is_hedged_and_loser_cancelled(monkeypatch):
+    """Test that the hedge model answers when the primary is slow."""
+    client, calls = make_hedged_client(monkeypatch, {"primary/model": 1.0, "backup/model": 0.01})
+
+    started = time.monotonic()
+    result = asyncio.run(client.chat_completion([{"role": "user", "content": "hi"}]))
+
+    assert result["model"] == "backup/model"
+    assert time.monotonic() - started < 0.5
+    assert calls == ["primary/model", "backup/model"]
+    hedging = client.get_stats()["hedging"]
+    assert hedging["hedged"] == 1
+    assert hedging["models"]["backup/model"]["wins"] == 1
+
+
+def test_fast_primary_is_not_hedged(monkeypatch):
+    """Test that no hedge request is sent when the primary answers in time."""
+    client, calls = make_hedged_client(monkeypatch, {"primary/model": 0.0, "backup/model": 0.0})
+
+    result = asyncio.run(client.chat_completion([{"role": "user", "content": "hi"}]))
+
+    assert result["model"] == "primary/model"
+    assert calls == ["primary/model"]
+    assert client.get_stats()["hedging"]["hedged"] == 0
+
+
+def test_hedge_stats_are_labelled_with_the_requested_model(monkeypatch):
+    """Test that a per-stage model override is reported as the primary and its loser is collected."""
+    client, calls = make_hedged_client(
+        monkeypatch, {"planner/model": 1.0, "primary/model": 1.0, "backup/model": 0.01}
+    )
+
+    async def run():
+        result = await client.chat_completion([{"role": "user", "content": "hi"}], model="planner/model")
+        # Only the test's own task is left once the cancelled primary has been awaited
+        return result, len(asyncio.all_tasks())
+
+    result, tasks_left = asyncio.run(run())
+
+    assert result["model"] == "backup/model"
+    assert calls == ["planner/model", "backup/model"]
+    assert tasks_left == 1
+    primaries = client.get_stats()["hedging"]["primaries"]
+    assert set(primaries) == {"planner/model"}
+    assert primaries["planner/model"]["calls"] == 1
+
+
+def test_hedge_request_takes_its_own_admission_slot(monkeypatch):
+    """Test that a hedge request is counted against the lane's in-flight cap."""
+    monkeypatch.setattr("llm.openrouter.settings.llm_admission_enabled", True)
+    client, calls = make_hedged_client(monkeypatch, {"primary/model": 1.0, "backup/model": 0.1})
+    client.admission = LLMAdmission(max_in_flight=2, rate_per_second=0)
+
+    async def run():
+        call = asyncio.create_task(client.chat_completion([{"role": "user", "content": "hi"}]))
+        await asyncio.sleep(0.1)
+        in_flight = client.admission.in_flight[INTERACTIVE]
+        await call
+        return in_flight
+
+    assert asyncio.run(run()) == 2
+    assert calls == ["primary/model", "backup/model"]
+    assert client.admission.in_flight[INTERACTIVE] == 0
+    assert client.admission.get_stats()["lanes"][INTERACTIVE]["admitted"] == 2
+
+
+def test_percentile_nearest_rank():
+    """Test nearest-rank percentiles used for the hedge delay."""
+    assert percentile([], 99) is None
+    assert percentile([3, 1, 2], 50) == 2
+    assert percentile(range(1, 101), 95) == 95
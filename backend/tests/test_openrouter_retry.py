@@ -0,0 +1,78 @@
+"""Tests for OpenRouter retries and the circuit breaker."""
+
+import asyncio
+
+import httpx
+import pytest
+
+from llm.openrouter import CircuitOpenError, OpenRouterClient, OpenRouterError, parse_retry_after
+
+OK_BODY = {"choices": [{"message": {"role": "assistant", "content": "hi"}}]}
+
+
+def make_client(monkeypatch, responses):
+    """Build a client whose HTTP calls replay ``responses`` in order."""
+    monkeypatch.setattr("llm.openrouter.settings.openrouter_backoff_base_seconds", 0.0)
+    client = OpenRouterClient()
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return responses.pop(0)
+
+    client.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return client, calls
+
+
+def test_retries_rate_limit_and_honours_retry_after(monkeypatch):
+    """Test that a 429 is retried after its Retry-After delay and then succeeds."""
+    client, calls = make_client(monkeypatch, [
+        httpx.Response(429, headers={"Retry-After": "0.05"}, text="slow down"),
+        httpx.Response(503, text="unavailable"),
+        httpx.Response(200, json=OK_BODY),
+    ])
+
+    result = asyncio.run(client.chat_completion([{"role": "user", "content": "hi"}]))
+
+    assert result == OK_BODY
+    assert len(calls) == 3
+    stats = client.get_stats()
+    assert stats["retries"]["retries"] == 2
+    assert stats["retries"]["retry_after_honoured"] == 1
+    assert stats["circuit_breaker"]["state"] == "closed"
+
+
+def test_client_errors_are_not_retried(monkeypatch):
+    """Test that a 400 fails immediately without tripping the breaker."""
+    client, calls = make_client(monkeypatch, [httpx.Response(400, text="bad request")])
+
+    with pytest.raises(OpenRouterError):
+        asyncio.run(client.chat_completion([{"role": "user", "content": "hi"}]))
+
+    assert len(calls) == 1
+    assert client.breaker.consecutive_failures == 0
+
+
+def test_breaker_opens_and_short_circuits(monkeypatch):
+    """Test that repeated failures open the breaker so later calls skip the network."""
+    monkeypatch.setattr("llm.openrouter.settings.openrouter_max_retries", 0)
+    client, calls = make_client(monkeypatch, [httpx.Response(502, text="bad gateway") for _ in range(10)])
+    client.breaker.failure_threshold = 2
+
+    for _ in range(2):
+        with pytest.raises(OpenRouterError):
+            asyncio.run(client.chat_completion([{"role": "user", "content": "hi"}]))
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(client.chat_completion([{"role": "user", "content": "hi"}]))
+
+    assert len(calls) == 2
+    assert client.get_stats()["circuit_breaker"]["state"] == "open"
+    assert client.get_stats()["retries"]["short_circuited"] == 1
+
+
+def test_parse_retry_after():
+    """Test Retry-After parsing for seconds, dates and junk."""
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after(None) is None
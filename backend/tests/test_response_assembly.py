@@ -0,0 +1,85 @@
+"""Tests for server-side assembly of previews and chart data."""
+
+from decimal import Decimal
+
+from services.response_assembly import assemble_result_data, build_default_chart_spec
+
+
+RESULT = {
+    "query": "SELECT year, value FROM t",
+    "columns": ["year", "value"],
+    "rows": [[2019, Decimal("1.5")], [2020, Decimal("2")], [2021, Decimal("2.5")]],
+    "row_count": 3,
+}
+
+
+def test_assemble_fills_preview_sql_and_inline_data():
+    """Test that rows come from the query result, not the model."""
+    response = {
+        "insight_text": "Rising",
+        "viz": {"type": "vega-lite", "spec": {
+            "data": {"values": "__INLINE_DATA__"},
+            "mark": "line",
+            "encoding": {"x": {"field": "year"}, "y": {"field": "value"}},
+        }},
+    }
+
+    assemble_result_data(response, RESULT, max_preview_rows=2)
+
+    assert response["sql_used"] == "SELECT year, value FROM t"
+    assert response["data_preview"] == {"columns": ["year", "value"], "rows": [[2019, 1.5], [2020, 2]]}
+    assert response["viz"]["spec"]["data"]["values"][2] == {"year": 2021, "value": 2.5}
+
+
+def test_assemble_wraps_bare_data_placeholder_in_values():
+    """Test that a ``"data": "__INLINE_DATA__"`` placeholder becomes a Vega-Lite data object."""
+    response = {
+        "insight_text": "Rising",
+        "viz": {"type": "vega-lite", "spec": {
+            "data": "__INLINE_DATA__",
+            "mark": "line",
+            "encoding": {"x": {"field": "year"}, "y": {"field": "value"}},
+        }},
+    }
+
+    assemble_result_data(response, RESULT, max_preview_rows=50)
+
+    data = response["viz"]["spec"]["data"]
+    assert isinstance(data, dict)
+    assert data["values"][0] == {"year": 2019, "value": 1.5}
+    assert len(data["values"]) == 3
+
+
+def test_assemble_keeps_layered_specs():
+    """Test that a layered spec without a top-level encoding gets its data and is kept."""
+    layers = [
+        {"mark": "line", "encoding": {"x": {"field": "year"}, "y": {"field": "value"}}},
+        {"mark": "point", "encoding": {"x": {"field": "year"}, "y": {"field": "value"}}},
+    ]
+    inlined = {"data": {"values": "__INLINE_DATA__"}, "layer": [dict(layer) for layer in layers]}
+    bare = {"layer": [dict(layer) for layer in layers]}
+
+    for spec in (inlined, bare):
+        response = {"insight_text": "Rising", "viz": {"type": "vega-lite", "spec": spec}}
+        assemble_result_data(response, RESULT, max_preview_rows=50)
+
+        assert response["viz"]["spec"] is spec
+        assert len(spec["layer"]) == 2
+        assert spec["data"]["values"][0] == {"year": 2019, "value": 1.5}
+
+
+def test_assemble_generates_chart_when_model_gave_none():
+    """Test that a default chart is built when the spec has no encoding."""
+    response = {"insight_text": "Rising", "viz": {"type": "vega-lite", "spec": {}}}
+
+    assemble_result_data(response, RESULT, max_preview_rows=50)
+
+    spec = response["viz"]["spec"]
+    assert spec["encoding"]["x"]["field"] == "year"
+    assert spec["encoding"]["y"]["field"] == "value"
+    assert len(spec["data"]["values"]) == 3
+
+
+def test_default_chart_needs_a_numeric_column():
+    """Test that no chart is produced for purely textual results."""
+    assert build_default_chart_spec(["title"], [["GDP"], ["CPI"]]) == {}
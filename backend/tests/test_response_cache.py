@@ -0,0 +1,95 @@
+"""Tests for the insight response cache."""
+
+from services.response_cache import ResponseCache, make_cache_key, normalize_prompt
+
+
+def test_normalize_prompt_ignores_case_whitespace_and_stopwords():
+    """Test that trivially different phrasings share a normalized form."""
+    assert normalize_prompt("Show me the GDP   trends") == normalize_prompt("gdp trends?")
+
+
+def test_cache_key_ignores_empty_filters_and_key_order():
+    """Test that filter canonicalization drops empty values and sorts keys."""
+    a = make_cache_key("GDP trends", {"place": {"state": "Jharkhand", "district": None}, "time": {}})
+    b = make_cache_key("gdp trends", {"place": {"state": "jharkhand"}})
+    assert a == b
+    assert a != make_cache_key("gdp trends", {"place": {"state": "Bihar"}})
+
+
+def test_cache_hit_and_miss_counters():
+    """Test that hits and misses are counted."""
+    cache = ResponseCache(max_entries=4, ttl_seconds=60)
+    assert cache.get("k") is None
+    cache.set("k", {"insight_text": "x"})
+    assert cache.get("k") == {"insight_text": "x"}
+
+    stats = cache.get_stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+
+
+def test_cache_evicts_least_recently_used():
+    """Test that the least recently used entry is evicted when full."""
+    cache = ResponseCache(max_entries=2, ttl_seconds=60)
+    cache.set("a", {"v": 1})
+    cache.set("b", {"v": 2})
+    cache.get("a")
+    cache.set("c", {"v": 3})
+
+    assert cache.get("b") is None
+    assert cache.get("a") == {"v": 1}
+    assert cache.get_stats()["evictions"] == 1
+
+
+def test_cache_expires_entries():
+    """Test that entries past their TTL are treated as misses."""
+    cache = ResponseCache(max_entries=2, ttl_seconds=0.000001)
+    cache.set("a", {"v": 1})
+    assert cache.get("a") is None
+
+
+def test_cache_invalidates_on_data_version_change():
+    """Test that a new data version clears cached responses."""
+    cache = ResponseCache(max_entries=2, ttl_seconds=60)
+    cache.observe_data_version("1:1:1:1")
+    cache.set("a", {"v": 1})
+    cache.observe_data_version("1:1:1:1")
+    assert cache.get("a") == {"v": 1}
+
+    cache.observe_data_version("2:1:1:1")
+    assert cache.get("a") is None
+
+
+def test_cached_response_is_isolated_copy():
+    """Test that mutating a returned response does not corrupt the cache."""
+    cache = ResponseCache(max_entries=2, ttl_seconds=60)
+    cache.set("a", {"disclaimers": []})
+    cache.get("a")["disclaimers"].append("mutated")
+    assert cache.get("a") == {"disclaimers": []}
+
+
+def test_cache_bounds_total_rows_and_shares_stored_rows():
+    """Test that the row budget evicts old entries and hits do not deep-copy rows."""
+    def response(rows):
+        return {
+            "insight_text": "x",
+            "data_preview": {"columns": ["v"], "rows": [[i] for i in range(min(rows, 2))]},
+            "full_result": {"columns": ["v"], "rows": [[i] for i in range(rows)], "row_count": rows},
+        }
+
+    cache = ResponseCache(max_entries=10, ttl_seconds=60, max_rows=10)
+    cache.set("a", response(4))
+    cache.set("b", response(3))
+    cache.set("c", response(2))
+
+    assert cache.get("a") is None
+    assert cache.get_stats()["rows"] == 9
+    cache.set("huge", response(50))
+    assert cache.get("huge") is None
+
+    first, second = cache.get("b"), cache.get("b")
+    first["cached"] = True
+    first["full_result"]["rows"].append([99])
+    assert "cached" not in second
+    assert len(second["full_result"]["rows"]) == 3
+    assert first["full_result"]["rows"][0] is second["full_result"]["rows"][0]
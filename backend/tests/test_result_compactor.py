@@ -0,0 +1,40 @@
+"""Tests for compaction of SQL results sent to the LLM."""
+
+from decimal import Decimal
+
+from services.result_compactor import compact_result, estimate_tokens
+
+
+def make_result(row_count):
+    rows = [[2000 + i % 20, "Jharkhand" if i % 3 else "Bihar", Decimal(i) / 10] for i in range(row_count)]
+    return {"columns": ["year", "state", "value"], "rows": rows, "row_count": row_count}
+
+
+def test_compact_result_bounds_sample_and_keeps_full_statistics():
+    """Test that only a sample is kept while statistics cover every row."""
+    compacted = compact_result(make_result(5000), sample_rows=20, token_budget=100000)
+
+    assert compacted["row_count"] == 5000
+    assert compacted["sample_size"] == 20
+    assert compacted["truncated"] is True
+
+    year, state, value = compacted["column_stats"]
+    assert year["min"] == 2000 and year["max"] == 2019 and year["distinct"] == 20
+    assert state["top_values"][0] == ["Jharkhand", 3333]
+    assert value["count"] == 5000
+    assert value["mean"] == 249.95
+
+
+def test_compact_result_respects_token_budget():
+    """Test that the sample shrinks until the payload fits the token budget."""
+    compacted = compact_result(make_result(5000), sample_rows=200, token_budget=300)
+
+    assert estimate_tokens(compacted) <= 300
+    assert compacted["sample_size"] < 200
+
+
+def test_compact_result_small_result_is_not_truncated():
+    """Test that small results are passed through whole."""
+    compacted = compact_result(make_result(3), sample_rows=20, token_budget=1500)
+    assert compacted["sample_size"] == 3
+    assert compacted["truncated"] is False
@@ -0,0 +1,70 @@
+"""Tests for per-request schema subsetting."""
+
+import pytest
+
+from services.result_compactor import estimate_tokens
+from services.schema import SchemaService
+
+
+CATALOG = [
+    {
+        "id": 1, "slug": "gdp-growth", "title": "GDP Growth Rate", "category": "Economic",
+        "subcategory": "National Accounts", "description": "Annual GDP growth at constant prices",
+        "indicators": [{"field_name": "gdp_growth", "display_name": "GDP growth", "unit": "%"}],
+    },
+    {
+        "id": 2, "slug": "pmgsy-roads", "title": "PMGSY Road Length", "category": "Infrastructure",
+        "subcategory": "Rural Roads", "description": "Rural road length sanctioned and completed",
+        "indicators": [{"field_name": "road_length_km", "display_name": "Road length", "unit": "km"}],
+    },
+    {
+        "id": 3, "slug": "literacy-rate", "title": "Literacy Rate by State", "category": "Social",
+        "subcategory": "Education", "description": "Census literacy rates",
+        "indicators": [{"field_name": "literacy_rate", "display_name": "Literacy rate", "unit": "%"}],
+    },
+]
+
+
+@pytest.fixture
+def catalog(monkeypatch):
+    monkeypatch.setattr(SchemaService, "_catalog", [])
+    monkeypatch.setattr(SchemaService, "_catalog_index", None)
+    SchemaService.load_catalog(CATALOG)
+
+
+def test_without_catalog_the_full_schema_is_selected(monkeypatch):
+    """Test that an unloaded catalog falls back to every table."""
+    monkeypatch.setattr(SchemaService, "_catalog_index", None)
+
+    subset = SchemaService.select_schema("GDP growth", {})
+
+    assert len(subset["tables"]) == len(SchemaService.get_sanitized_schema()["tables"])
+    assert subset["candidate_datasets"] == []
+
+
+def test_government_question_gets_government_tables_and_matching_datasets(catalog):
+    """Test that a dataset question drops the legacy tables and lists the matching dataset first."""
+    subset = SchemaService.select_schema("GDP growth rate trend", {})
+
+    names = {table["name"] for table in subset["tables"]}
+    assert names == {"extended_fact_measure", "dataset_registry", "dataset_indicator", "dim_time", "dim_geo"}
+    assert subset["candidate_datasets"][0]["slug"] == "gdp-growth"
+    assert all(join["from"].split(".")[0] in names for join in subset["joins"])
+    assert estimate_tokens(subset) < estimate_tokens(SchemaService.get_sanitized_schema())
+
+
+def test_category_filter_restricts_candidates(catalog):
+    """Test that extra.category keeps only datasets from that category."""
+    subset = SchemaService.select_schema("growth and rate", {"extra": {"category": "Social"}})
+
+    assert [dataset["slug"] for dataset in subset["candidate_datasets"]] == ["literacy-rate"]
+
+
+def test_ward_question_gets_legacy_tables(catalog):
+    """Test that municipal wording without dataset matches selects the legacy tables."""
+    subset = SchemaService.select_schema("forest cover by ward", {})
+
+    names = {table["name"] for table in subset["tables"]}
+    assert {"fact_measure", "dim_indicator", "dim_geo"} <= names
+    assert "extended_fact_measure" not in names
+    assert "RELEVANT TABLES: " in SchemaService.describe_subset(subset)
@@ -0,0 +1,75 @@
+"""Tests for the read-only query executor."""
+
+import asyncio
+import threading
+
+from core.config import settings
+from db.session import (
+    execute_safe_query_async, run_in_background_executor, run_in_query_executor, shutdown_query_executor
+)
+
+
+def test_query_executor_restarts_after_shutdown():
+    """Test that a second lifespan can still run queries after the executor was shut down."""
+    def thread_name():
+        return threading.current_thread().name
+
+    first = asyncio.run(run_in_query_executor(thread_name))
+    shutdown_query_executor()
+    second = asyncio.run(run_in_query_executor(thread_name))
+
+    assert first.startswith("readonly-sql")
+    assert second.startswith("readonly-sql")
+
+
+def test_background_work_runs_outside_the_query_executor():
+    """Test that housekeeping calls use their own threads and survive a shutdown."""
+    def thread_name():
+        return threading.current_thread().name
+
+    first = asyncio.run(run_in_background_executor(thread_name))
+    shutdown_query_executor()
+    second = asyncio.run(run_in_background_executor(thread_name))
+
+    assert first.startswith("background")
+    assert second.startswith("background")
+
+
+class FakeResult:
+    def keys(self):
+        return ["state"]
+
+    def fetchall(self):
+        return [("Jharkhand",), ("Bihar",)]
+
+
+class FakeSession:
+    """Stands in for a read-only session and records what it executes and where."""
+
+    def __init__(self, log):
+        self.log = log
+
+    def execute(self, statement):
+        self.log.append((str(statement), threading.current_thread().name))
+        return FakeResult()
+
+    def close(self):
+        self.log.append(("close", threading.current_thread().name))
+
+
+def test_execute_safe_query_async_runs_guarded_query_on_executor(monkeypatch):
+    """Test that queries run off the event loop with a transaction-local, clamped timeout."""
+    log = []
+    monkeypatch.setattr("db.session.ReadonlySessionLocal", lambda: FakeSession(log))
+
+    result = asyncio.run(execute_safe_query_async("SELECT state FROM dim_geo", 0.0001))
+    default = asyncio.run(execute_safe_query_async("SELECT state FROM dim_geo"))
+
+    assert result == {"columns": ["state"], "rows": [["Jharkhand"], ["Bihar"]], "row_count": 2}
+    assert default["row_count"] == 2
+    statements = [statement for statement, _ in log]
+    assert statements[0] == "SET LOCAL statement_timeout = 1"
+    assert statements[1] == "SELECT state FROM dim_geo LIMIT 5000"
+    assert statements[2] == "close"
+    assert statements[3] == f"SET LOCAL statement_timeout = {settings.query_timeout_seconds * 1000}"
+    assert all(thread.startswith("readonly-sql") for _, thread in log)
@@ -0,0 +1,157 @@
+"""Tests for singleflight coalescing of identical in-flight calls."""
+
+import asyncio
+
+import pytest
+
+from services.singleflight import SingleFlight
+
+
+def test_concurrent_identical_calls_run_once():
+    """Test that followers share the leader's result and get their own copy."""
+    flights = SingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"insight_text": "shared"}
+
+    async def run():
+        return await asyncio.gather(*(flights.do("key", work) for _ in range(5)))
+
+    results = asyncio.run(run())
+
+    assert len(calls) == 1
+    assert [coalesced for _, coalesced in results].count(False) == 1
+    assert all(result == {"insight_text": "shared"} for result, _ in results)
+    assert len({id(result) for result, _ in results}) == 5
+    assert flights.get_stats()["coalesced"] == 4
+    assert flights.get_stats()["in_flight"] == 0
+
+
+def test_errors_propagate_to_every_caller():
+    """Test that a failing call raises in the leader and all followers."""
+    flights = SingleFlight()
+
+    async def work():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def run():
+        return await asyncio.gather(*(flights.do("key", work) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(run())
+
+    assert all(isinstance(result, ValueError) for result in results)
+    assert flights.get_stats()["errors"] == 1
+
+
+def test_follower_timeout_does_not_cancel_leader():
+    """Test that a follower giving up leaves the shared call running for the leader."""
+    flights = SingleFlight()
+
+    async def work():
+        await asyncio.sleep(0.1)
+        return "done"
+
+    async def run():
+        leader = asyncio.create_task(flights.do("key", work))
+        await asyncio.sleep(0)
+        with pytest.raises(asyncio.TimeoutError):
+            await flights.do("key", work, timeout=0.01)
+        return await leader
+
+    assert asyncio.run(run()) == ("done", False)
+    assert flights.get_stats()["follower_timeouts"] == 1
+
+
+def test_insights_coalesce_only_with_the_same_budget_and_without_streaming(monkeypatch):
+    """Test that no caller inherits another's shorter deadline or event callback."""
+    import app as app_module
+    from core.deadline import Deadline
+
+    runs = []
+
+    class FakeAgent:
+        last_run_succeeded = True
+
+        def __init__(self, client=None):
+            pass
+
+        async def generate_insight(self, prompt, filters, on_event=None, deadline=None, session=None):
+            runs.append((deadline.budget_seconds, on_event))
+            await asyncio.sleep(0.05)
+            return {"insight_text": "shared"}
+
+    async def not_routed(prompt, filters):
+        return None
+
+    async def on_event(event, payload):
+        pass
+
+    monkeypatch.setattr(app_module, "MunicipalAnalystAgent", FakeAgent)
+    monkeypatch.setattr(app_module, "get_shared_client", lambda: None)
+    monkeypatch.setattr(app_module.intent_router, "answer", not_routed)
+    monkeypatch.setattr(app_module.settings, "response_cache_enabled", False)
+
+    async def run():
+        return await asyncio.gather(
+            app_module.answer_insight("GDP trends", {}, deadline=Deadline(30)),
+            app_module.answer_insight("GDP trends", {}, deadline=Deadline(30)),
+            app_module.answer_insight("GDP trends", {}, deadline=Deadline(2)),
+            app_module.answer_insight("GDP trends", {}, on_event=on_event, deadline=Deadline(30)),
+        )
+
+    results = asyncio.run(run())
+
+    assert all(result["insight_text"] == "shared" for result in results)
+    assert sorted(budget for budget, _ in runs) == [2, 30, 30]
+    assert [callback for _, callback in runs].count(on_event) == 1
+
+
+def test_insights_coalesce_only_within_a_lane_and_mark_follower_timings(monkeypatch):
+    """Test that interactive requests never join a batch leader and followers see their wait."""
+    import app as app_module
+    from core.deadline import Deadline
+    from core.timing import start_request_timings
+    from llm.admission import BATCH, priority_lane
+
+    runs = []
+
+    class FakeAgent:
+        last_run_succeeded = True
+
+        def __init__(self, client=None):
+            pass
+
+        async def generate_insight(self, prompt, filters, on_event=None, deadline=None, session=None):
+            runs.append(prompt)
+            await asyncio.sleep(0.05)
+            return {"insight_text": "shared"}
+
+    async def not_routed(prompt, filters):
+        return None
+
+    monkeypatch.setattr(app_module, "MunicipalAnalystAgent", FakeAgent)
+    monkeypatch.setattr(app_module, "get_shared_client", lambda: None)
+    monkeypatch.setattr(app_module.intent_router, "answer", not_routed)
+    monkeypatch.setattr(app_module.settings, "response_cache_enabled", False)
+
+    async def batch():
+        with priority_lane(BATCH):
+            return await app_module.answer_insight("GDP trends", {}, deadline=Deadline(30))
+
+    async def interactive():
+        timings = start_request_timings()
+        await app_module.answer_insight("GDP trends", {}, deadline=Deadline(30))
+        return timings
+
+    async def run():
+        return await asyncio.gather(batch(), interactive(), interactive())
+
+    _, first, second = asyncio.run(run())
+
+    assert len(runs) == 2
+    names = [{span["name"] for span in timings.spans} for timings in (first, second)]
+    assert names.count({"coalesced"}) == 1
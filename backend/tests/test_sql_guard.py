@@ -1,7 +1,7 @@
 """Tests for SQL Guard functionality."""
 
 import pytest
-from services.sql_guard import SQLGuard, SQLGuardError
+from services.sql_guard import SQLGuard, SQLGuardError, TableCatalog, statement_cache
 
 
 def test_sql_guard_allows_select():
@@ -134,3 +134,159 @@ def test_sql_guard_removes_comments():
     assert "--" not in result_str
     assert "/*" not in result_str
     assert "*/" not in result_str
+
+
+def test_sql_guard_resolves_cte_and_subquery_aliases():
+    """Test that CTE and subquery names are not mistaken for tables and their columns resolve."""
+    guard = SQLGuard()
+    
+    query = """
+    WITH yearly AS (
+        SELECT t.year, SUM(f.value) AS total
+        FROM fact_measure f JOIN dim_time t ON t.id = f.time_id
+        GROUP BY t.year
+    )
+    SELECT y.year, y.total, ranked.state
+    FROM yearly y
+    CROSS JOIN (SELECT g.state FROM dim_geo g WHERE g.level = 'state') ranked
+    WHERE y.total > (SELECT AVG(total) FROM yearly)
+    """
+    result = guard.validate_and_sanitize(query)
+    
+    assert str(result).endswith("LIMIT 5000")
+
+
+def test_sql_guard_blocks_unknown_columns():
+    """Test that columns missing from the catalog are rejected, also through aliases."""
+    guard = SQLGuard()
+    
+    for query in (
+        "SELECT password FROM dim_geo",
+        "SELECT g.password FROM dim_geo g",
+        "WITH x AS (SELECT id FROM dim_geo) SELECT x.state FROM x",
+    ):
+        with pytest.raises(SQLGuardError) as exc_info:
+            guard.validate_and_sanitize(query)
+        assert "Unknown columns referenced" in str(exc_info.value)
+
+
+def test_sql_guard_blocks_other_schemas_and_extra_statements():
+    """Test that system catalogs and stacked statements are rejected."""
+    guard = SQLGuard()
+    
+    with pytest.raises(SQLGuardError) as exc_info:
+        guard.validate_and_sanitize("SELECT * FROM pg_catalog.pg_roles")
+    assert "Access to tables not allowed" in str(exc_info.value)
+    
+    with pytest.raises(SQLGuardError):
+        guard.validate_and_sanitize("SELECT * FROM dim_geo; SELECT * FROM dim_time")
+
+
+def test_sql_guard_allows_only_listed_table_functions():
+    """Test that server functions in FROM are rejected and generate_series still works."""
+    guard = SQLGuard()
+    
+    for query in (
+        "SELECT * FROM pg_catalog.pg_ls_dir('.') d",
+        "SELECT * FROM pg_read_file('/etc/passwd') f",
+        "SELECT * FROM public.generate_series(1, 3) g",
+    ):
+        with pytest.raises(SQLGuardError) as exc_info:
+            guard.validate_and_sanitize(query)
+        assert "Table functions not allowed" in str(exc_info.value)
+    
+    result = guard.validate_and_sanitize("SELECT g.year FROM generate_series(2015, 2020) AS g(year)")
+    
+    assert str(result) == "SELECT g.year FROM generate_series(2015, 2020) AS g(year) LIMIT 5000"
+
+
+def test_sql_guard_allows_only_listed_functions_in_expressions():
+    """Test that server functions are rejected in the select list, WHERE, subqueries and LIMIT."""
+    guard = SQLGuard()
+    
+    for query in (
+        "SELECT query_to_xml('select * from pg_authid', true, true, '')",
+        "SELECT query_to_xml('select 1 from fact_measure;delete from fact_measure',true,true,'')",
+        "SELECT pg_read_file('/etc/passwd')",
+        "SELECT value FROM fact_measure WHERE pg_sleep(5) IS NOT NULL",
+        "SELECT value FROM fact_measure WHERE id IN (SELECT lo_import('/etc/passwd'))",
+        "SELECT value FROM fact_measure WHERE id = (SELECT dblink_exec('host=x', 'select 1'))",
+        "SELECT set_config('statement_timeout', '0', false)",
+        "SELECT current_setting('data_directory')",
+        "SELECT pg_catalog.lower(title) FROM dim_indicator",
+        "SELECT value FROM fact_measure LIMIT (SELECT length(pg_read_file('/etc/passwd')))",
+        "SELECT * FROM generate_series(1, pg_sleep(1)::int) g",
+    ):
+        with pytest.raises(SQLGuardError, match="Functions not allowed"):
+            guard.validate_and_sanitize(query)
+    
+    result = guard.validate_and_sanitize(
+        "SELECT COALESCE(SUM(value), 0)::numeric(12,2), ROUND(AVG(value), 2), "
+        "EXTRACT(YEAR FROM NOW()), CAST(value AS decimal(10,2)) FROM fact_measure "
+        "WHERE EXISTS (SELECT 1 FROM dim_geo) AND id = ANY(ARRAY[1, 2]) GROUP BY value"
+    )
+    
+    assert str(result).endswith("LIMIT 5000")
+
+
+def test_sql_guard_ignores_keywords_inside_strings():
+    """Test that a forbidden word inside a string literal is data, not SQL."""
+    guard = SQLGuard()
+    
+    result = guard.validate_and_sanitize("SELECT title FROM dim_indicator WHERE title = 'Update frequency'")
+    
+    assert "'Update frequency'" in str(result)
+
+
+def test_sql_guard_caches_statement_shapes():
+    """Test that a repeated shape with new literals is served from the cache and still capped."""
+    guard = SQLGuard(allowed_columns={"dim_geo": {"id", "state"}})
+    
+    first = guard.validate_and_sanitize("SELECT state FROM dim_geo WHERE id = 1 LIMIT 10")
+    second = guard.validate_and_sanitize("select state  from dim_geo where id = 2 limit 99999;")
+    
+    assert str(first) == "SELECT state FROM dim_geo WHERE id = 1 LIMIT 10"
+    assert str(second) == "SELECT state FROM dim_geo WHERE id = 2 LIMIT 5000"
+    assert guard.cache.get_stats()["hits"] == 1
+
+
+def test_sql_guard_allows_ordered_set_aggregates_and_values_lists():
+    """Test that median queries and inline VALUES tables pass with their columns resolved."""
+    guard = SQLGuard()
+    
+    median = guard.validate_and_sanitize(
+        "SELECT percentile_cont(0.5) WITHIN GROUP (ORDER BY value) AS median FROM fact_measure"
+    )
+    inline = guard.validate_and_sanitize("SELECT v.id, v.name FROM (VALUES (1,'a'),(2,'b')) AS v(id, name)")
+    lookup = guard.validate_and_sanitize(
+        "SELECT state FROM dim_geo WHERE state IN (VALUES ('Bihar'), ('Jharkhand'))"
+    )
+    
+    assert "WITHIN GROUP (ORDER BY value)" in str(median)
+    assert "(VALUES (1,'a'),(2,'b')) AS v(id, name)" in str(inline)
+    assert str(lookup).endswith("LIMIT 5000")
+    with pytest.raises(SQLGuardError, match="Unknown columns"):
+        guard.validate_and_sanitize("SELECT percentile_cont(0.5) WITHIN GROUP (ORDER BY nope) FROM fact_measure")
+    with pytest.raises(SQLGuardError, match="Unknown columns"):
+        guard.validate_and_sanitize("SELECT v.missing FROM (VALUES (1, 2)) AS v(a, b)")
+
+
+def test_sql_guard_uses_reflected_catalog(monkeypatch):
+    """Test that reflected tables replace the model catalog, minus excluded tables."""
+    catalog = TableCatalog()
+    monkeypatch.setattr("services.sql_guard.table_catalog", catalog)
+    rows = [("new_table", "id"), ("new_table", "amount"), ("insight_job", "prompt")]
+    
+    assert catalog.load(rows) is True
+    SQLGuard().validate_and_sanitize("SELECT amount FROM new_table")
+    assert statement_cache.get_stats()["entries"] > 0
+    assert catalog.load(list(reversed(rows))) is False
+    
+    with pytest.raises(SQLGuardError, match="not allowed"):
+        SQLGuard().validate_and_sanitize("SELECT prompt FROM insight_job")
+    
+    # A migration that drops a column takes effect and clears cached verdicts
+    assert catalog.load([("new_table", "id")]) is True
+    assert statement_cache.get_stats()["entries"] == 0
+    with pytest.raises(SQLGuardError, match="Unknown columns"):
+        SQLGuard().validate_and_sanitize("SELECT amount FROM new_table")
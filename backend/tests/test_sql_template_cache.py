@@ -0,0 +1,124 @@
+"""Tests for learned question-to-SQL templates."""
+
+import asyncio
+import json
+
+from llm.agent import MunicipalAnalystAgent
+from services.sql_template_cache import SQLTemplateCache, sql_template_cache
+from tests.test_agent import FINAL_ANSWER, ScriptedClient, tool_call
+
+RANCHI_SQL = (
+    "SELECT t.year, SUM(e.numeric_value) AS forest_cover FROM extended_fact_measure e "
+    "JOIN dim_geo g ON g.id = e.geo_id JOIN dim_time t ON t.id = e.time_id "
+    "WHERE g.name ILIKE '%Ranchi%' AND t.year BETWEEN 2018 AND 2022 GROUP BY t.year LIMIT 2000"
+)
+PLACES = ["Jharkhand", "Ranchi", "Dhanbad", "East Singhbhum"]
+YEARS = range(2005, 2024)
+
+
+def make_cache(max_entries):
+    cache = SQLTemplateCache(max_entries=max_entries)
+    cache.load_vocabulary(PLACES, YEARS)
+    return cache
+
+
+def test_place_and_years_are_rebound_from_the_prompt():
+    """Test that slots found in both prompt and SQL are re-bound and escaped safely."""
+    cache = make_cache(max_entries=4)
+    cache.learn("Forest cover in Ranchi from 2018 to 2022", {}, RANCHI_SQL)
+
+    sql = cache.match("forest cover in East Singhbhum from 2010 to 2012?", {})
+
+    assert "ILIKE '%East Singhbhum%'" in sql
+    assert "BETWEEN 2010 AND 2012" in sql
+    assert "LIMIT 2000" in sql
+    assert cache.match("forest cover in Ranchi", {}) is None
+    assert cache.match("population of Ranchi from 2018 to 2022", {}) is None
+    assert cache.get_stats()["hit_rate"] == round(1 / 3, 3)
+
+
+def test_only_known_places_and_ordered_years_are_bound():
+    """Test that topic words stay fixed and invalid bindings are rejected without evicting the template."""
+    cache = make_cache(max_entries=4)
+    sql = (
+        "SELECT t.year, SUM(e.numeric_value) FROM extended_fact_measure e JOIN dim_geo g ON g.id = e.geo_id "
+        "JOIN dim_time t ON t.id = e.time_id JOIN dataset_indicator di ON di.id = e.indicator_id "
+        "WHERE di.display_name ILIKE '%forest%' AND g.district = 'Ranchi' AND t.year BETWEEN 2018 AND 2022 "
+        "GROUP BY t.year"
+    )
+    cache.learn("total forest cover area in Ranchi from 2018 to 2022", {}, sql)
+
+    assert cache.match("total literacy cover area in Dhanbad from 2018 to 2022", {}) is None
+    assert cache.match("total forest cover area in Trends from 2015 to 2020", {}) is None
+    assert cache.match("total forest cover area in Ranchi from 2022 to 2018", {}) is None
+    assert cache.match("total forest cover area in Ranchi from 1901 to 1903", {}) is None
+    cache.forget("total forest cover area in Trends from 2015 to 2020", {})
+    assert cache.get_stats()["entries"] == 1
+    assert cache.get_stats()["rejected_bindings"] == 3
+
+    rebound = cache.match("total forest cover area in Dhanbad from 2015 to 2020", {})
+    assert "ILIKE '%forest%'" in rebound
+    assert "g.district = 'Dhanbad'" in rebound
+    assert "BETWEEN 2015 AND 2020" in rebound
+
+
+def test_filter_slots_and_lru_eviction():
+    """Test that filter values re-bind from new filters and the store stays bounded."""
+    cache = make_cache(max_entries=1)
+    filters = {"place": {"district": "Ranchi"}, "time": {"from": "2015"}}
+    cache.learn("forest cover over time", filters, "SELECT year FROM x WHERE district = 'Ranchi' AND year >= 2015")
+
+    sql = cache.match("Forest cover over time", {"place": {"district": "Dhanbad"}, "time": {"from": "2019"}})
+    assert sql == "SELECT year FROM x WHERE district = 'Dhanbad' AND year >= 2019"
+    assert cache.match("forest cover over time", {"place": {"state": "Jharkhand"}}) is None
+
+    cache.learn("literacy in Ranchi by year", {}, "SELECT * FROM y WHERE name = 'Ranchi'")
+    assert cache.get_stats()["entries"] == 1
+    assert cache.get_stats()["evictions"] == 1
+
+
+def test_queries_with_unbound_filter_values_are_not_learned():
+    """Test that a filter applied without its literal value never replays for another value."""
+    cache = make_cache(max_entries=4)
+    cache.learn(
+        "forest cover over time", {"time": {"from": "2019-01-01"}},
+        "SELECT year FROM x WHERE year >= 2019"
+    )
+    cache.learn(
+        "forest cover by district", {"place": {"state": "Jharkhand"}},
+        "SELECT district FROM x WHERE geo_id = 12"
+    )
+
+    assert cache.get_stats()["entries"] == 0
+    assert cache.match("forest cover over time", {"time": {"from": "2021-01-01"}}) is None
+    assert cache.match("forest cover by district", {"place": {"state": "Bihar"}}) is None
+
+
+def test_agent_runs_template_sql_and_skips_planning():
+    """Test that a second, re-bound question needs only the synthesis LLM round."""
+    sql_template_cache.clear()
+    sql_template_cache.load_vocabulary(PLACES, YEARS)
+    executed = []
+
+    async def fake_execute_tool(name, arguments):
+        executed.append(arguments["query"])
+        return {"success": True, "result": {"columns": ["year", "forest_cover"], "rows": [[2019, 1.5]], "row_count": 1}}
+
+    first = ScriptedClient([
+        {"role": "assistant", "content": "", "tool_calls": [tool_call("a", "run_sql", {"query": RANCHI_SQL})]},
+        {"role": "assistant", "content": json.dumps(FINAL_ANSWER)},
+    ])
+    agent = MunicipalAnalystAgent(client=first)
+    agent.execute_tool = fake_execute_tool
+    asyncio.run(agent.process_query("Forest cover in Ranchi from 2018 to 2022", {}))
+
+    second = ScriptedClient([{"role": "assistant", "content": json.dumps(FINAL_ANSWER)}])
+    agent = MunicipalAnalystAgent(client=second)
+    agent.execute_tool = fake_execute_tool
+    result = asyncio.run(agent.process_query("Forest cover in Dhanbad from 2015 to 2020", {}))
+
+    assert len(second.requests) == 1
+    assert "'%Dhanbad%'" in executed[-1] and "BETWEEN 2015 AND 2020" in executed[-1]
+    assert result["sql_used"] == executed[-1]
+    assert agent.used_sql_template
+    sql_template_cache.clear()
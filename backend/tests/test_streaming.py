@@ -0,0 +1,154 @@
+"""Tests for SSE streaming helpers."""
+
+import asyncio
+import json
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import app as app_module
+from llm.openrouter import OpenRouterClient, OpenRouterError
+from llm.streaming import InsightTextExtractor, format_sse
+
+
+def test_extractor_streams_insight_text_across_fragments():
+    """Test that insight_text is decoded incrementally from JSON fragments."""
+    document = json.dumps({"sql_used": "SELECT 1", "insight_text": "GDP rose \"sharply\"\nin 2023 — 6.8%"})
+    extractor = InsightTextExtractor()
+
+    pieces = [extractor.feed(document[i:i + 3]) for i in range(0, len(document), 3)]
+
+    assert "".join(pieces) == 'GDP rose "sharply"\nin 2023 — 6.8%'
+    assert extractor.done
+
+
+def test_extractor_ignores_content_without_insight_text():
+    """Test that unrelated content produces no tokens."""
+    extractor = InsightTextExtractor()
+    assert extractor.feed('{"viz": {"type": "vega-lite"}}') == ""
+    assert not extractor.done
+
+
+def test_format_sse_frame():
+    """Test the SSE wire format."""
+    frame = format_sse("sql_executed", {"row_count": 3})
+    assert frame == 'event: sql_executed\ndata: {"row_count": 3}\n\n'
+
+
+def test_extractor_passes_malformed_escapes_through_as_text():
+    """Test that a bad \\u escape from the model does not raise."""
+    extractor = InsightTextExtractor()
+
+    text = extractor.feed('{"insight_text": "bad \\uZZZZ escape"}')
+
+    assert text == "bad \\uZZZZ escape"
+    assert extractor.done
+
+
+def test_extractor_joins_surrogate_pairs_split_across_fragments():
+    """Test that a high surrogate is held until its low half arrives."""
+    document = '{"insight_text": "up \\ud83d\\udcc8 and \\ud83d lone"}'
+    extractor = InsightTextExtractor()
+
+    pieces = [extractor.feed(document[i:i + 4]) for i in range(0, len(document), 4)]
+
+    assert "".join(pieces) == "up \U0001F4C8 and \ufffd lone"
+    assert all("\ud83d" not in piece for piece in pieces)
+
+
+def make_streaming_client(lines):
+    """Build a client whose streamed completion replays SSE ``lines``."""
+    client = OpenRouterClient()
+    body = "".join(f"{line}\n\n" for line in lines).encode()
+    client.client = httpx.AsyncClient(transport=httpx.MockTransport(
+        lambda request: httpx.Response(200, content=body, headers={"content-type": "text/event-stream"})
+    ))
+    return client
+
+
+def sse_chunk(**delta):
+    return "data: " + json.dumps({"choices": [{"delta": delta}]})
+
+
+def test_stream_completion_assembles_content_tool_calls_and_usage():
+    """Test that streamed deltas become a regular response with tool calls and usage."""
+    client = make_streaming_client([
+        ": keep-alive",
+        sse_chunk(content="Hel"),
+        sse_chunk(content="lo"),
+        sse_chunk(tool_calls=[{"index": 0, "id": "call_1", "function": {"name": "run_", "arguments": '{"qu'}}]),
+        sse_chunk(tool_calls=[{"index": 0, "function": {"name": "sql", "arguments": 'ery": "q"}'}}]),
+        sse_chunk(tool_calls=[{"index": 1, "id": "call_2", "function": {"name": "get_schema", "arguments": "{}"}}]),
+        "data: " + json.dumps({"choices": [{"delta": {}, "finish_reason": "tool_calls"}]}),
+        "data: " + json.dumps({"choices": [], "usage": {"prompt_tokens": 12, "completion_tokens": 5}}),
+        "data: [DONE]",
+    ])
+    deltas = []
+
+    async def on_delta(fragment):
+        deltas.append(fragment)
+
+    result = asyncio.run(client._stream_completion({"model": "m", "messages": []}, on_delta, 5))
+
+    message = result["choices"][0]["message"]
+    assert deltas == ["Hel", "lo"]
+    assert message["content"] == "Hello"
+    assert [call["id"] for call in message["tool_calls"]] == ["call_1", "call_2"]
+    assert message["tool_calls"][0]["function"] == {"name": "run_sql", "arguments": '{"query": "q"}'}
+    assert result["choices"][0]["finish_reason"] == "tool_calls"
+    assert result["usage"] == {"prompt_tokens": 12, "completion_tokens": 5}
+
+
+def test_stream_completion_raises_on_error_chunk():
+    """Test that an error event in the stream fails the call."""
+    client = make_streaming_client([
+        sse_chunk(content="partial"),
+        "data: " + json.dumps({"error": {"message": "upstream overloaded"}}),
+    ])
+
+    async def on_delta(fragment):
+        pass
+
+    with pytest.raises(OpenRouterError, match="upstream overloaded"):
+        asyncio.run(client._stream_completion({"model": "m", "messages": []}, on_delta, 5))
+
+
+def read_events(response):
+    """Split an SSE response body into (event, data) pairs."""
+    events = []
+    for frame in response.text.strip().split("\n\n"):
+        event, data = frame.split("\n")
+        events.append((event[len("event: "):], json.loads(data[len("data: "):])))
+    return events
+
+
+def test_stream_endpoint_emits_events_in_order(monkeypatch):
+    """Test that /api/insights/stream sends started, progress events and the result last."""
+    async def fake_run_insight(prompt, filters, on_event=None, deadline=None, session=None):
+        await on_event("tool_call", {"name": "run_sql"})
+        await on_event("insight_token", {"text": "GDP"})
+        return {"insight_text": "GDP rose"}
+
+    monkeypatch.setattr(app_module, "run_insight", fake_run_insight)
+    response = TestClient(app_module.app).post("/api/insights/stream", json={"prompt": "GDP trends"})
+
+    events = read_events(response)
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert [event for event, _ in events] == ["started", "tool_call", "insight_token", "result"]
+    assert events[0][1]["prompt"] == "GDP trends"
+    assert events[-1][1] == {"insight_text": "GDP rose"}
+
+
+def test_stream_endpoint_reports_failures_as_error_frame(monkeypatch):
+    """Test that a failing request ends the stream with an error event."""
+    async def failing_run_insight(prompt, filters, on_event=None, deadline=None, session=None):
+        await on_event("tool_call", {"name": "run_sql"})
+        raise RuntimeError("database unavailable")
+
+    monkeypatch.setattr(app_module, "run_insight", failing_run_insight)
+    response = TestClient(app_module.app).post("/api/insights/stream", json={"prompt": "GDP trends"})
+
+    events = read_events(response)
+    assert [event for event, _ in events] == ["started", "tool_call", "error"]
+    assert "database unavailable" in events[-1][1]["detail"]
@@ -0,0 +1,100 @@
+"""Tests for the per-request latency breakdown."""
+
+import asyncio
+import time
+
+import httpx
+from fastapi.testclient import TestClient
+
+import app as app_module
+from core.timing import LatencyHistogram, TimingHistograms, span, start_request_timings
+from db.session import run_in_query_executor
+from llm.openrouter import OpenRouterClient
+
+
+def test_spans_reach_the_request_from_tasks_and_executor_threads():
+    """Test that spans recorded in gathered tasks and on the query executor land on the request."""
+    def blocking_query():
+        with span("db", rows=3):
+            time.sleep(0.01)
+
+    async def tool(name):
+        with span("tool", tool=name):
+            await run_in_query_executor(blocking_query)
+
+    async def run():
+        timings = start_request_timings()
+        await asyncio.gather(tool("run_sql"), tool("search_docs"))
+        return timings
+
+    timings = asyncio.run(run())
+
+    summary = timings.summary()
+    assert summary["tool"]["count"] == 2
+    assert summary["db"]["count"] == 2
+    assert summary["db"]["duration_ms"] >= 20
+    assert {span["tool"] for span in timings.as_dict()["spans"] if span["name"] == "tool"} == {"run_sql", "search_docs"}
+    header = timings.server_timing()
+    assert 'tool;dur=' in header and 'desc="2x"' in header and header.split(", ")[-1].startswith("total;dur=")
+
+
+def test_histogram_buckets_and_percentiles():
+    """Test cumulative bucket counts and bucket-bound percentiles."""
+    histogram = LatencyHistogram(bounds=(10, 100, 1000))
+    for ms in (5, 50, 60, 70, 500):
+        histogram.observe(ms)
+
+    snapshot = histogram.snapshot()
+
+    assert snapshot["buckets"] == {"10": 1, "100": 4, "1000": 5, "+Inf": 5}
+    assert snapshot["p50_ms"] == 100
+    assert snapshot["p95_ms"] == 1000
+    assert snapshot["mean_ms"] == 137.0
+
+
+def test_llm_span_records_queue_ttfb_and_tokens(monkeypatch):
+    """Test that an OpenRouter call records its queue wait, time to first byte and token usage."""
+    histograms = TimingHistograms()
+    monkeypatch.setattr("core.timing.timing_histograms", histograms)
+    body = {
+        "choices": [{"message": {"role": "assistant", "content": "hi"}}],
+        "usage": {"prompt_tokens": 120, "completion_tokens": 8},
+    }
+    client = OpenRouterClient()
+    client.client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(200, json=body)))
+
+    async def run():
+        timings = start_request_timings()
+        await client.chat_completion([{"role": "user", "content": "hi"}])
+        return timings
+
+    llm_span = asyncio.run(run()).spans[0]
+
+    assert llm_span["name"] == "llm"
+    assert llm_span["prompt_tokens"] == 120
+    assert llm_span["completion_tokens"] == 8
+    assert llm_span["queue_ms"] >= 0
+    assert 0 <= llm_span["ttfb_ms"] <= llm_span["duration_ms"]
+    assert {"llm", "llm_queue", "llm_ttfb"} <= set(histograms.get_stats())
+
+
+def test_insights_endpoint_sends_server_timing_and_optional_timings(monkeypatch):
+    """Test the Server-Timing header and that the timings field is only added on request."""
+    async def timed_insight(prompt, filters, **kwargs):
+        with span("llm", prompt_tokens=10):
+            await asyncio.sleep(0.01)
+        return {"insight_text": "ok"}
+
+    monkeypatch.setattr(app_module, "run_insight", timed_insight)
+    client = TestClient(app_module.app)
+
+    plain = client.post("/api/insights", json={"prompt": "GDP trends"})
+    detailed = client.post("/api/insights?timings=true", json={"prompt": "GDP trends"})
+
+    assert plain.status_code == 200
+    assert plain.headers["Server-Timing"].startswith('llm;dur=')
+    assert "timings" not in plain.json()
+    timings = detailed.json()["timings"]
+    assert timings["summary"]["llm"]["count"] == 1
+    assert timings["spans"][0]["prompt_tokens"] == 10
+    assert timings["total_ms"] >= timings["spans"][0]["duration_ms"]
@@ -0,0 +1,64 @@
+"""Tests for LLM token and cost accounting."""
+
+import asyncio
+import json
+
+import pytest
+
+from llm.agent import MunicipalAnalystAgent
+from services.usage_ledger import UsageLedger, estimate_cost
+from tests.test_agent import FINAL_ANSWER, ScriptedClient
+
+
+def test_cost_prefers_reported_cost_then_configured_prices(monkeypatch):
+    """Test that OpenRouter's reported cost wins and configured prices are the fallback."""
+    monkeypatch.setattr("services.usage_ledger.settings.llm_model_prices", {"cheap/model": [1.0, 2.0]})
+
+    assert estimate_cost("cheap/model", {"prompt_tokens": 1000, "completion_tokens": 500, "cost": 0.5}) == 0.5
+    assert estimate_cost("cheap/model", {"prompt_tokens": 1000, "completion_tokens": 500}) == pytest.approx(0.002)
+    assert estimate_cost("unpriced/model", {"prompt_tokens": 1000}) is None
+
+
+def test_rollup_groups_by_bucket_and_key(tmp_path):
+    """Test that flushed rows roll up per model, per prompt hash and per request."""
+    ledger = UsageLedger(str(tmp_path / "usage.sqlite3"))
+    ledger.record("req1", "aaaa", "big/model", "planner", {"prompt_tokens": 900, "completion_tokens": 50, "cost": 0.02}, 800)
+    ledger.record("req1", "aaaa", "big/model", "synthesis", {"prompt_tokens": 1200, "completion_tokens": 300, "cost": 0.04}, 1500)
+    ledger.record("req2", "bbbb", "small/model", "planner", {"prompt_tokens": 100, "completion_tokens": 20, "cost": 0.001}, 200)
+
+    by_model = ledger.rollup(group_by="model")
+    by_prompt = ledger.rollup(bucket="day", group_by="prompt_hash")
+    by_request = ledger.rollup(group_by="request")
+
+    assert ledger.get_stats()["flushed"] == 3
+    assert by_model["totals"]["calls"] == 3
+    assert by_model["totals"]["requests"] == 2
+    assert by_model["totals"]["prompt_tokens"] == 2200
+    assert [row["model"] for row in by_model["rows"]] == ["big/model", "small/model"]
+    assert by_model["rows"][0]["cost_usd"] == pytest.approx(0.06)
+    assert by_model["rows"][0]["max_latency_ms"] == 1500
+    assert by_prompt["rows"][0]["prompt_hash"] == "aaaa"
+    assert {row["request"]: row["calls"] for row in by_request["rows"]} == {"req1": 2, "req2": 1}
+    with pytest.raises(ValueError):
+        ledger.rollup(group_by="user")
+
+
+def test_agent_records_each_llm_round(monkeypatch):
+    """Test that the agent buffers one ledger row per LLM call keyed by request and prompt hash."""
+    recorded = []
+    monkeypatch.setattr(
+        "llm.agent.usage_ledger.record",
+        lambda request_id, prompt_hash, model, stage, usage, latency_ms: recorded.append(
+            (request_id, prompt_hash, stage, usage.get("prompt_tokens"))
+        )
+    )
+    client = ScriptedClient([{"role": "assistant", "content": json.dumps(FINAL_ANSWER)}])
+    agent = MunicipalAnalystAgent(client=client)
+
+    asyncio.run(agent.process_query("GDP trends", {}))
+
+    assert len(recorded) == 1
+    request_id, prompt_hash, stage, _ = recorded[0]
+    assert request_id == agent.request_id
+    assert prompt_hash == agent.prompt_hash and len(prompt_hash) == 8
+    assert stage == "synthesis"